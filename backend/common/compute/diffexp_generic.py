@@ -5,9 +5,12 @@ def diffexp_ttest(meanA,vA,nA,meanB,vB,nB):
     return diffexp_ttest_from_mean_var(meanA, vA, nA, meanB, vB, nB)
 
 
-def diffexp_ttest_from_mean_var(meanA, varA, nA, meanB, varB, nB):
+def diffexp_ttest_stats(meanA, varA, nA, meanB, varB, nB):
+    """
+    Welch's t-test for every variable.  Returns a dict of per-variable arrays:
+    lfc, pval, pval_adj and score (the signed -log10 adjusted p-value used for ranking).
+    """
     n_var = meanA.shape[0]
-    top_n = n_var
 
     # variance / N
     vnA = varA / min(nA, nB)  # overestimate variance, would normally be nA
@@ -33,6 +36,18 @@ def diffexp_ttest_from_mean_var(meanA, varA, nA, meanB, varB, nB):
     logfoldchanges = np.log2(np.abs((meanA + 1e-9) / (meanB + 1e-9)))
 
     stats_to_sort = -np.sign(tscores)*np.log10(pvals_adj+1e-200)
+    return {"lfc": logfoldchanges, "pval": pvals, "pval_adj": pvals_adj, "score": stats_to_sort}
+
+
+def diffexp_ttest_from_mean_var(meanA, varA, nA, meanB, varB, nB):
+    n_var = meanA.shape[0]
+    top_n = n_var
+
+    res = diffexp_ttest_stats(meanA, varA, nA, meanB, varB, nB)
+    logfoldchanges = res["lfc"]
+    pvals = res["pval"]
+    pvals_adj = res["pval_adj"]
+    stats_to_sort = res["score"]
     # find all with lfc > cutoff
 
     # derive sort order
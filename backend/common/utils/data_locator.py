@@ -1,11 +1,37 @@
+import json
 import os
 import tempfile
+import threading
+import time
+import shutil
 import fsspec
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from hashlib import blake2b
 import boto3
 import botocore
 from urllib.parse import urlparse
 
+# remote objects are downloaded in ranges of CHUNK_SIZE bytes, DOWNLOAD_WORKERS at a time,
+# so at most CHUNK_SIZE * DOWNLOAD_WORKERS bytes are buffered in memory
+CHUNK_SIZE = 1 << 23
+DOWNLOAD_WORKERS = 8
+MAX_RETRIES = 5
+# metadata fields identifying a version of a remote object, in order of preference
+VERSION_FIELDS = ("ETag", "etag", "LastModified", "last_modified", "mtime", "updated", "created")
+
+_cache_dir = None
+
+
+def set_cache_dir(cache_dir):
+    """
+    Keep downloaded remote datasets in `cache_dir`, so later launches reuse them as long as
+    the remote object is unchanged (None downloads to a temporary file on every launch).
+    Only the latest version of each remote object is kept.
+    """
+    global _cache_dir
+    _cache_dir = cache_dir
+
 
 class DataLocator:
     """
@@ -102,18 +128,116 @@ class DataLocator:
         if self.islocal():
             return LocalFilePath(self.path)
 
-        # if not local, create a tmp file system object to contain the data,
-        # and clean it up when done.  If the path has a suffix/extension,
-        # do our best to create a file with the same.
+        # if not local, download the data to the local cache or, if it is disabled or the
+        # object has no version to validate a cached copy against, to a tmp file which is
+        # cleaned up when done.  If the path has a suffix/extension, do our best to create
+        # a file with the same.
         ext = os.path.splitext(self.path)
-        suffix = None if ext[1] == "" else ext[1]
-        with self.open() as src, tempfile.NamedTemporaryFile(prefix="cellxgene_", suffix=suffix, delete=False) as tmp:
-            tmp.write(src.read())
-            tmp.close()
-            src.close()
-            tmp_path = tmp.name
+        suffix = "" if ext[1] == "" else ext[1]
+        info = self.fs.info(self.uri_or_path)
+        key = self._cache_key(info)
+        if _cache_dir is None or key is None:
+            with tempfile.NamedTemporaryFile(prefix="cellxgene_", suffix=suffix, delete=False) as tmp:
+                tmp_path = tmp.name
+            try:
+                self._download(info, tmp_path, resume=False)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
             return LocalFilePath(tmp_path, delete=True)
 
+        os.makedirs(_cache_dir, exist_ok=True)
+        path = os.path.join(_cache_dir, key + suffix)
+        if not os.path.exists(path):
+            self._remove_other_versions(key)
+            part = path + ".part"
+            self._download(info, part, resume=True)
+            os.replace(part, path)
+            try:
+                os.unlink(part + ".progress")
+            except FileNotFoundError:
+                pass
+        return LocalFilePath(path)
+
+    def _uri_key(self):
+        return blake2b(self.uri_or_path.encode(), digest_size=8).hexdigest()
+
+    def _cache_key(self, info):
+        """
+        A name for the version of the object described by `info`, or None if it has no
+        version, as `{object}.{version}` so the versions of an object share a prefix.
+        """
+        version = next((info[f] for f in VERSION_FIELDS if info.get(f) is not None), None)
+        if version is None:
+            return None
+        h = blake2b(digest_size=16)
+        h.update(json.dumps([self.uri_or_path, str(version), info.get("size")]).encode())
+        return f"{self._uri_key()}.{h.hexdigest()}"
+
+    def _remove_other_versions(self, key):
+        """remove the cached copies, and interrupted downloads, of other versions of the object"""
+        prefix = self._uri_key() + "."
+        for fn in os.listdir(_cache_dir):
+            if fn.startswith(prefix) and not fn.startswith(key):
+                try:
+                    os.unlink(os.path.join(_cache_dir, fn))
+                except (FileNotFoundError, IsADirectoryError):
+                    pass
+
+    def _download(self, info, dest, resume=True):
+        """
+        Download the object to `dest` in parallel ranged reads of CHUNK_SIZE bytes.  The
+        chunks written so far are recorded in `{dest}.progress`, so with `resume` an
+        interrupted download picks up where it stopped.  Objects of unknown size are
+        streamed sequentially instead.
+        """
+        size = info.get("size")
+        if size is None:
+            with self.open("rb") as src, open(dest, "wb") as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            return
+
+        progress = dest + ".progress" if resume else None
+        done = set()
+        if resume and os.path.exists(dest) and os.path.getsize(dest) == size and os.path.exists(progress):
+            with open(progress) as f:
+                done = {int(line) for line in f if line.strip().isdigit()}
+        else:
+            with open(dest, "wb") as f:
+                f.truncate(size)
+            if resume:
+                with open(progress, "w"):
+                    pass
+
+        lock = threading.Lock()
+
+        def fetch(i):
+            start = i * CHUNK_SIZE
+            end = min(start + CHUNK_SIZE, size)
+            for attempt in range(MAX_RETRIES):
+                try:
+                    data = self.fs.cat_file(self.uri_or_path, start=start, end=end)
+                    if len(data) != end - start:
+                        raise IOError(f"Short read of {self.uri_or_path} at {start}")
+                    break
+                except Exception:
+                    if attempt == MAX_RETRIES - 1:
+                        raise
+                    time.sleep(2**attempt)
+            with open(dest, "r+b") as f:
+                f.seek(start)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if resume:
+                with lock, open(progress, "a") as f:
+                    f.write(f"{i}\n")
+
+        todo = [i for i in range((size + CHUNK_SIZE - 1) // CHUNK_SIZE) if i not in done]
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+            for _ in pool.map(fetch, todo):
+                pass
+
     def ls(self):
         paths = self.fs.ls(self.uri_or_path)
         return [os.path.basename(p) for p in paths]
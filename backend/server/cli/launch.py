@@ -175,7 +175,8 @@ def dataset_args(func):
         is_flag=True,
         default=DEFAULT_CONFIG.server_config.adaptor__anndata_adaptor__backed,
         show_default=False,
-        help="Load anndata in file-backed mode. " "This may save memory, but may result in slower overall performance.",
+        help="Load anndata in file-backed mode; the matrices of CSC-encoded h5ad files are read from disk on demand. "
+        "This may save memory, but may result in slower overall performance.",
     )
     @click.option(
         "--title",
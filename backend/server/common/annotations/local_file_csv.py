@@ -5,7 +5,6 @@ import threading
 from datetime import datetime
 from hashlib import blake2b
 import json
-import pickle
 import pandas as pd
 from flask import session, has_request_context, current_app, request
 
@@ -14,6 +13,7 @@ from backend.server.common.annotations.annotations import Annotations
 from backend.common.genesets import read_gene_sets_tidycsv
 from backend.common.errors import AnnotationsError, ObsoleteRequest
 from backend.common.utils.data_locator import DataLocator
+import backend.server.common.workspace.artifact_cache as artifact_cache
 
 
 class AnnotationsLocalFile(Annotations):
@@ -199,7 +199,7 @@ class AnnotationsLocalFile(Annotations):
             idhash = base64.b32encode(blake2b(id, digest_size=5).digest()).decode("utf-8")
         
         try:
-            mode = pickle.load(open(f"{idhash}/mode.p","rb"))
+            mode = artifact_cache.load(f"{idhash}/mode.p")
         except:
             mode = "OBS"
         
@@ -8,9 +8,15 @@ from backend.server.auth.auth import AuthTypeFactory
 from backend.server.common.config.base_config import BaseConfig
 from backend.server.common.config import DEFAULT_SERVER_PORT, BIG_FILE_SIZE_THRESHOLD
 from backend.common.utils.data_locator import discover_s3_region_name
+import backend.common.utils.data_locator as data_locator
 from backend.common.errors import ConfigurationError, DatasetAccessError
 from backend.common.utils.utils import is_port_available, find_available_port, custom_format_warning
 from backend.server.data_common.matrix_loader import MatrixDataLoader
+import backend.server.common.workspace.artifact_cache as artifact_cache
+import backend.server.common.workspace.housekeeping as housekeeping
+import backend.server.data_anndata.backed_layers as backed_layers
+import backend.server.data_anndata.job_scheduler as job_scheduler
+import backend.server.data_anndata.virtual_layers as virtual_layers
 
 
 class ServerConfig(BaseConfig):
@@ -41,11 +47,31 @@ class ServerConfig(BaseConfig):
             self.single_dataset__title = default_config["single_dataset"]["title"]
 
             self.data_locator__s3__region_name = default_config["data_locator"]["s3"]["region_name"]
+            self.data_locator__cache_dir = default_config["data_locator"]["cache_dir"]
 
             self.adaptor__anndata_adaptor__backed = default_config["adaptor"]["anndata_adaptor"]["backed"]
+            self.adaptor__anndata_adaptor__backed_cache_bytes = default_config["adaptor"]["anndata_adaptor"][
+                "backed_cache_bytes"
+            ]
+            self.adaptor__anndata_adaptor__sidecar_dir = default_config["adaptor"]["anndata_adaptor"]["sidecar_dir"]
+            self.adaptor__anndata_adaptor__layer_orientation = default_config["adaptor"]["anndata_adaptor"][
+                "layer_orientation"
+            ]
+            self.adaptor__anndata_adaptor__layer_preparation = default_config["adaptor"]["anndata_adaptor"][
+                "layer_preparation"
+            ]
+            self.adaptor__anndata_adaptor__virtual_layers = default_config["adaptor"]["anndata_adaptor"][
+                "virtual_layers"
+            ]
+            self.adaptor__anndata_adaptor__compute_workers = default_config["adaptor"]["anndata_adaptor"][
+                "compute_workers"
+            ]
 
             self.limits__diffexp_cellcount_max = default_config["limits"]["diffexp_cellcount_max"]
             self.limits__column_request_max = default_config["limits"]["column_request_max"]
+            self.limits__artifact_cache_max_bytes = default_config["limits"]["artifact_cache_max_bytes"]
+            self.limits__workspace_quota_bytes = default_config["limits"]["workspace_quota_bytes"]
+            self.limits__jobs_per_user_max = default_config["limits"]["jobs_per_user_max"]
 
         except KeyError as e:
             raise ConfigurationError(f"Unexpected config: {str(e)}")
@@ -130,6 +156,9 @@ class ServerConfig(BaseConfig):
                 region_name = None
             self.data_locator__s3__region_name = region_name
 
+        self.validate_correct_type_of_configuration_attribute("data_locator__cache_dir", (type(None), str))
+        data_locator.set_cache_dir(self.data_locator__cache_dir)
+
     def handle_data_source(self):
         self.validate_correct_type_of_configuration_attribute("single_dataset__datapath", str)
 
@@ -173,10 +202,52 @@ class ServerConfig(BaseConfig):
 
     def handle_adaptor(self):
         self.validate_correct_type_of_configuration_attribute("adaptor__anndata_adaptor__backed", bool)
+        self.validate_correct_type_of_configuration_attribute(
+            "adaptor__anndata_adaptor__backed_cache_bytes", (type(None), int)
+        )
+        backed_layers.set_max_bytes(self.adaptor__anndata_adaptor__backed_cache_bytes)
+        self.validate_correct_type_of_configuration_attribute(
+            "adaptor__anndata_adaptor__sidecar_dir", (type(None), str)
+        )
+        self.validate_correct_type_of_configuration_attribute(
+            "adaptor__anndata_adaptor__layer_orientation", (str, dict)
+        )
+        policy = self.adaptor__anndata_adaptor__layer_orientation
+        for orientation in policy.values() if isinstance(policy, dict) else [policy]:
+            if orientation not in ("both", "csr", "csc"):
+                raise ConfigurationError(
+                    f"Invalid layer orientation {orientation}, expected one of 'both', 'csr' or 'csc'."
+                )
+        self.validate_correct_type_of_configuration_attribute("adaptor__anndata_adaptor__layer_preparation", str)
+        if self.adaptor__anndata_adaptor__layer_preparation not in ("startup", "background", "on_access"):
+            raise ConfigurationError(
+                f"Invalid layer preparation {self.adaptor__anndata_adaptor__layer_preparation}, "
+                "expected one of 'startup', 'background' or 'on_access'."
+            )
+        self.validate_correct_type_of_configuration_attribute(
+            "adaptor__anndata_adaptor__virtual_layers", (type(None), dict)
+        )
+        for name, definition in (self.adaptor__anndata_adaptor__virtual_layers or {}).items():
+            try:
+                virtual_layers.parse(definition)
+            except ValueError as e:
+                raise ConfigurationError(f"Invalid virtual layer {name}: {e}")
+        self.validate_correct_type_of_configuration_attribute(
+            "adaptor__anndata_adaptor__compute_workers", (type(None), int)
+        )
+        n_workers = self.adaptor__anndata_adaptor__compute_workers
+        if n_workers is not None and n_workers < 1:
+            raise ConfigurationError(f"Invalid number of compute workers {n_workers}, expected at least 1.")
 
     def handle_limits(self):
         self.validate_correct_type_of_configuration_attribute("limits__diffexp_cellcount_max", (type(None), int))
         self.validate_correct_type_of_configuration_attribute("limits__column_request_max", (type(None), int))
+        self.validate_correct_type_of_configuration_attribute("limits__artifact_cache_max_bytes", (type(None), int))
+        artifact_cache.set_max_bytes(self.limits__artifact_cache_max_bytes)
+        self.validate_correct_type_of_configuration_attribute("limits__workspace_quota_bytes", (type(None), int))
+        housekeeping.set_quota_bytes(self.limits__workspace_quota_bytes)
+        self.validate_correct_type_of_configuration_attribute("limits__jobs_per_user_max", (type(None), int))
+        job_scheduler.set_max_running_per_user(self.limits__jobs_per_user_max)
 
     def exceeds_limit(self, limit_name, value):
         limit_value = getattr(self, "limits__" + limit_name, None)
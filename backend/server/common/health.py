@@ -3,6 +3,8 @@ from flask import make_response, jsonify
 
 from backend.server import __version__ as cellxgene_version
 from backend.common.utils.data_locator import DataLocator
+import backend.server.common.workspace.artifact_cache as artifact_cache
+import backend.server.data_anndata.job_scheduler as job_scheduler
 
 
 def _is_accessible(path, config):
@@ -27,6 +29,7 @@ def health_check(config):
     check = _is_accessible(server_config.single_dataset__datapath, server_config)
 
     health["status"] = "pass" if check else "fail"
+    health["details"] = {"artifact_cache": artifact_cache.stats(), "jobs": job_scheduler.stats()}
     code = HTTPStatus.OK if health["status"] == "pass" else HTTPStatus.BAD_REQUEST
     response = make_response(jsonify(health), code)
     response.headers["Content-Type"] = "application/health+json"
@@ -8,10 +8,7 @@ import numpy as np
 from glob import glob
 from flask import make_response, jsonify, current_app, abort, send_file, after_this_request, session
 from urllib.parse import unquote
-import shutil
-import pickle
 from backend.common.utils.utils import jsonify_numpy
-from backend.common.utils.type_conversion_utils import get_schema_type_hint_of_array
 from backend.server.common.config.client_config import get_client_config, get_client_userinfo
 from backend.common.constants import Axis, DiffExpMode, JSON_NaN_to_num_warning_msg
 from backend.common.errors import (
@@ -26,6 +23,15 @@ from backend.common.errors import (
 )
 from backend.common.genesets import summarizeQueryHash
 from backend.common.fbs.matrix import decode_matrix_fbs
+import backend.server.common.workspace.artifact_cache as artifact_cache
+import backend.server.common.workspace.clone as workspace_clone
+import backend.server.common.workspace.column_store as column_store
+import backend.server.common.workspace.diffexp_store as diffexp_store
+import backend.server.common.workspace.embedding_store as embedding_store
+import backend.server.common.workspace.gene_set_store as gene_set_store
+import backend.server.common.workspace.graph_store as graph_store
+import backend.server.common.workspace.housekeeping as housekeeping
+import backend.server.common.workspace.manifest as manifest
 import os
 import pathlib
 
@@ -122,10 +128,7 @@ def schema_get_helper(data_adaptor, userID=None):
     for k in data_adaptor._obsm_init.keys():
         initial_embeddings.append(k if k[:2] != "X_" else k[2:])
 
-    latent_spaces = []
-    fns = glob(f"{userID}/pca/*.p")
-    for f in fns:
-        latent_spaces.append(f.split("/")[-1].split("\\")[-1][:-2])
+    latent_spaces = manifest.list_artifacts(userID, "pca")
 
     mode = userID.split("/")[-1].split("\\")[-1]
     schema = {
@@ -140,53 +143,27 @@ def schema_get_helper(data_adaptor, userID=None):
         },
         "layout": {"obs": []},
         "layers": layers,
+        "layerStates": data_adaptor.get_layer_states(),
         "latent_spaces": latent_spaces,
         "initial_embeddings": initial_embeddings,
         "rootName": data_adaptor.rootName,
     }
 
     for ax in Axis:
-        if str(ax) == "var":
-            fns = glob(f"{userID}/var/*.p")
-            for ann in fns:
-                ann = ann.split(".p")[0].split("/")[-1].split("\\")[-1]
-                if ann != "name_0":
-                    x = pickle_loader(f"{userID}/var/{ann}.p")
-                    a, c = np.unique(x, return_counts=True)
-                    if a.size > 2000 or c.max() < 5:
-                        ann_schema = {"name": ann, "writable": False}
-                    else:
-                        ann_schema = {"name": ann, "writable": True}
-                    ann_schema.update(get_schema_type_hint_of_array(x))
-                    schema["annotations"]["var"]["columns"].append(ann_schema)
-
-            ann = "name_0"
-            x = pickle_loader(f"{userID}/var/{ann}.p")
-            ann_schema = {"name": ann, "writable": False}
-            ann_schema.update(get_schema_type_hint_of_array(x))
-            schema["annotations"][ax]["columns"].append(ann_schema)
-
-        elif str(ax) == "obs":
-            fns = glob(f"{userID}/obs/*.p")
-            for ann in fns:
-                ann = ann.split(".p")[0].split("/")[-1].split("\\")[-1]
-                if ann != "name_0":
-                    x = pickle_loader(f"{userID}/obs/{ann}.p")
-                    a, c = np.unique(x, return_counts=True)
-                    if a.size > 2000 or c.max() < 5:
-                        ann_schema = {"name": ann, "writable": False}
-                    else:
-                        ann_schema = {"name": ann, "writable": True}
-                    ann_schema.update(get_schema_type_hint_of_array(x))
-                    schema["annotations"][ax]["columns"].append(ann_schema)
-
-            ann = "name_0"
-            x = pickle_loader(f"{userID}/obs/{ann}.p")
-            ann_schema = {"name": ann, "writable": False}
-            ann_schema.update(get_schema_type_hint_of_array(x))
-            schema["annotations"][ax]["columns"].append(ann_schema)
-
-    for layout in [x.split("/")[-1].split("\\")[-1][:-2] for x in glob(f"{userID}/emb/*.p")]:
+        directory = f"{userID}/{ax}"
+        for ann in column_store.list_columns(directory):
+            if ann != "name_0":
+                info = column_store.column_info(directory, ann)
+                ann_schema = {"name": ann, "writable": info["writable"]}
+                ann_schema.update(info["type_hint"])
+                schema["annotations"][str(ax)]["columns"].append(ann_schema)
+
+        ann = "name_0"
+        ann_schema = {"name": ann, "writable": False}
+        ann_schema.update(column_store.column_info(directory, ann)["type_hint"])
+        schema["annotations"][str(ax)]["columns"].append(ann_schema)
+
+    for layout in embedding_store.list_embeddings(f"{userID}/emb"):
         layout_schema = {"name": layout, "type": "float32", "dims": [f"{layout}_0", f"{layout}_1"]}
         schema["layout"]["obs"].append(layout_schema)
     return schema
@@ -206,10 +183,10 @@ def gene_info_get(request, data_adaptor):
 
     if varM is not None and gene is not None:
         try:
-            X = pickle_loader(f"{userID}/var/{varM};;{name}.p")
-        except:
-            X = pickle_loader(f"{userID}/var/{varM}.p")
-        n = pickle_loader(f"{userID}/var/name_0.p")
+            X = column_store.read_column(f"{userID}/var", f"{varM};;{name}")
+        except KeyError:
+            X = column_store.read_column(f"{userID}/var", varM)
+        n = column_store.read_column(f"{userID}/var", "name_0")
         return make_response(jsonify({"response": X[n == gene]}), HTTPStatus.OK)
     else:
         return make_response(jsonify({"response": "NaN"}), HTTPStatus.OK)
@@ -218,8 +195,8 @@ def gene_info_get(request, data_adaptor):
 def reset_to_root_folder(request, data_adaptor):
     userID = _get_user_id(data_adaptor)
     src = data_adaptor.guest_idhash
-    target = userID
-    os.system(f"rsync -a --recursive --delete {src}/ {target}")
+    target = userID.split("/")[0].split("\\")[0]
+    workspace_clone.reset_workspace(src, target)
     schema = schema_get_helper(data_adaptor)
     return make_response(jsonify({"schema": schema}), HTTPStatus.OK)
 
@@ -240,10 +217,10 @@ def gene_info_bulk_put(request, data_adaptor):
 
     if varM != "":
         try:
-            X = pickle_loader(f"{userID}/var/{varM};;{name}.p")
-        except:
-            X = pickle_loader(f"{userID}/var/{varM}.p")
-        n = pickle_loader(f"{userID}/var/name_0.p")
+            X = column_store.read_column(f"{userID}/var", f"{varM};;{name}")
+        except KeyError:
+            X = column_store.read_column(f"{userID}/var", varM)
+        n = column_store.read_column(f"{userID}/var", "name_0")
 
         return make_response(jsonify({"response": list(pd.Series(data=X, index=n)[geneSet].values)}), HTTPStatus.OK)
     else:
@@ -262,14 +239,12 @@ def userinfo_get(app_config, data_adaptor):
 
 def _get_obs_keys(data_adaptor):
     userID = _get_user_id(data_adaptor)
-    fns = glob(f"{userID}/obs/*.p")
-    return [ann.split(".p")[0].split("/")[-1].split("\\")[-1] for ann in fns]
+    return column_store.list_columns(f"{userID}/obs")
 
 
 def _get_var_keys(data_adaptor):
     userID = _get_user_id(data_adaptor)
-    fns = glob(f"{userID}/var/*.p")
-    return [ann.split(".p")[0].split("/")[-1].split("\\")[-1] for ann in fns]
+    return column_store.list_columns(f"{userID}/var")
 
 
 def annotations_obs_get(request, data_adaptor):
@@ -286,10 +261,10 @@ def annotations_obs_get(request, data_adaptor):
         annotations = data_adaptor.dataset_config.user_annotations
         if annotations.user_annotations_enabled():
             userID = _get_user_id(data_adaptor)
-            name_0 = pickle_loader(f"{userID}/obs/name_0.p")
+            name_0 = column_store.read_column(f"{userID}/obs", "name_0")
             labels = pd.DataFrame()
-            for f in fields:
-                labels[f] = pickle_loader(f"{userID}/obs/{f}.p")
+            for f, vals in column_store.read_columns(f"{userID}/obs", fields).items():
+                labels[f] = vals
             labels.index = pd.Index(name_0, dtype="object")
         fbs = data_adaptor.annotation_to_fbs_matrix(Axis.OBS, fields, labels)
         return make_response(fbs, HTTPStatus.OK, {"Content-Type": "application/octet-stream"})
@@ -313,13 +288,13 @@ def annotations_var_get(request, data_adaptor):
         annotations = data_adaptor.dataset_config.user_annotations
         if annotations.user_annotations_enabled():
             userID = _get_user_id(data_adaptor)
-            name_0 = pickle_loader(f"{userID}/var/name_0.p")
+            name_0 = column_store.read_column(f"{userID}/var", "name_0")
             labels = pd.DataFrame()
             for f in fields:
                 try:
-                    labels[f] = pickle_loader(f"{userID}/var/{f};;{name}.p")
-                except:
-                    labels[f] = pickle_loader(f"{userID}/var/{f}.p")
+                    labels[f] = column_store.read_column(f"{userID}/var", f"{f};;{name}")
+                except KeyError:
+                    labels[f] = column_store.read_column(f"{userID}/var", f)
             labels.index = pd.Index(name_0, dtype="object")
         fbs = data_adaptor.annotation_to_fbs_matrix(Axis.VAR, fields, labels)
         return make_response(fbs, HTTPStatus.OK, {"Content-Type": "application/octet-stream"})
@@ -350,14 +325,11 @@ def annotations_var_put(request, data_adaptor):
 
 
 def pickle_dumper(x, fn):
-    with open(fn, "wb") as f:
-        pickle.dump(x, f)
+    artifact_cache.dump(x, fn)
 
 
 def pickle_loader(fn):
-    with open(fn, "rb") as f:
-        x = pickle.load(f)
-    return x
+    return artifact_cache.load(fn)
 
 
 def annotations_put_fbs_helper(data_adaptor, fbs):
@@ -385,13 +357,11 @@ def annotations_put_worker(data_adaptor, new_label_df, userID=None, initVar=Fals
         if isinstance(vals[0], np.integer):
             if len(set(vals)) < 500:
                 vals = vals.astype("str")
-        src = "{}/obs/{}.p".format(userID, col.replace("/", "_"))
-        tgt = "{}/var/{}.p".format(pathNew, col.replace("/", "_"))
-        pickle_dumper(vals, src)
+        changed = column_store.update_column(f"{userID}/obs", col.replace("/", "_"), vals)
 
         if data_adaptor._joint_mode or initVar:
             if initVar:
-                pickle_dumper(vals, tgt)
+                column_store.write_column(f"{pathNew}/var", col.replace("/", "_"), vals)
 
             name = data_adaptor.NAME[mode]["obs"]
 
@@ -403,17 +373,20 @@ def annotations_put_worker(data_adaptor, new_label_df, userID=None, initVar=Fals
             if not flag and (
                 dtype_name == "object" and dtype_kind == "O" or dtype.type is np.str_ or dtype.type is np.string_
             ):
+                if changed is not None and gene_set_store.has_group(pathNew, col):
+                    # only the edited rows changed: move them between the sets derived from the column
+                    # (the obs of one mode are the var of the other, in the same order)
+                    if changed.size > 0:
+                        gene_set_store.move_members(pathNew, col, changed, vals[changed])
+                    continue
+
                 d = _df_to_dict(vals, name)
                 try:
                     del d["unassigned"]
                 except:
                     pass
 
-                if os.path.exists(f"{pathNew}/set/{col}/"):
-                    shutil.rmtree(f"{pathNew}/set/{col}/")
-                os.makedirs(f"{pathNew}/set/{col}/")
-                for dkey in d:
-                    pickle_dumper(d[dkey], f"{pathNew}/set/{col}/{dkey}.p")
+                gene_set_store.replace_group(pathNew, col, d)
 
 
 def annotations_put_fbs_helper_var(data_adaptor, fbs, name):
@@ -428,9 +401,10 @@ def annotations_put_fbs_helper_var(data_adaptor, fbs, name):
     if not new_label_df.empty:
         userID = _get_user_id(data_adaptor)
         for col in new_label_df:
-            pickle_dumper(
+            column_store.write_column(
+                f"{userID}/var",
+                "{};;{}".format(col.replace("/", "_"), name),
                 np.array(list(new_label_df[col]), dtype="object"),
-                "{}/var/{};;{}.p".format(userID, col.replace("/", "_"), name),
             )
 
 
@@ -508,7 +482,7 @@ def data_var_put(request, data_adaptor):
     scale = args.get("scale", "false") == "true"
 
     userID = _get_user_id(data_adaptor).split("/")[0].split("\\")[0]
-    mode = pickle.load(open(f"{userID}/mode.p", "rb"))
+    mode = pickle_loader(f"{userID}/mode.p")
     try:
         return make_response(
             data_adaptor.data_frame_to_fbs_matrix(
@@ -527,7 +501,7 @@ def data_var_get(request, data_adaptor):
         return abort(HTTPStatus.NOT_ACCEPTABLE)
 
     userID = _get_user_id(data_adaptor).split("/")[0].split("\\")[0]
-    mode = pickle.load(open(f"{userID}/mode.p", "rb"))
+    mode = pickle_loader(f"{userID}/mode.p")
 
     try:
         layer = request.values.get("layer", default="X")
@@ -678,7 +652,7 @@ def upload_var_metadata_post(request, data_adaptor):
     file.save(f"{userID}/{filename}")
     A = pd.read_csv(f"{userID}/{filename}", sep="\t", index_col=0)
     v1 = np.array(list(A.index))
-    v2 = np.array(list(pickle_loader(f"{userID}/var/name_0.p")))
+    v2 = np.array(list(column_store.read_column(f"{userID}/var", "name_0")))
     filt = np.in1d(v1, v2)
     v1 = v1[filt]
     assert v1.size > 0
@@ -698,9 +672,9 @@ def upload_var_metadata_post(request, data_adaptor):
         vals = np.array(list(pd.Series(index=np.append(v1, v2rev), data=np.append(vals, valsrev))[v2].values)).astype(
             "object"
         )
-        pickle_dumper(vals, "{}/var/{}.p".format(userID, k.replace("/", "_")))
+        column_store.write_column(f"{userID}/var", k.replace("/", "_"), vals)
         if data_adaptor._joint_mode:
-            pickle_dumper(vals, "{}/obs/{}.p".format(ID, k.replace("/", "_")))
+            column_store.write_column(f"{ID}/obs", k.replace("/", "_"), vals)
 
     @after_this_request
     def remove_file(response):
@@ -721,27 +695,25 @@ def save_var_metadata_put(request, data_adaptor):
     # direc
     userID = _get_user_id(data_adaptor)
 
-    fnames = glob(f"{userID}/var/*.p")
-    v = pickle_loader(f"{userID}/var/name_0.p")
+    fnames = column_store.list_columns(f"{userID}/var")
+    v = column_store.read_column(f"{userID}/var", "name_0")
     var = pd.DataFrame(data=v[:, None], index=v, columns=["name_0"])
-    for f in fnames:
-        n = f.split("/")[-1].split("\\")[-1][:-2]
+    for n in fnames:
         if ";;" in n:
             tlay = n.split(";;")[-1]
         else:
             tlay = ""
         if embName == tlay:
-            l = pickle_loader(f"{userID}/var/{n}.p")
             if n != "name_0":
+                l = column_store.read_column(f"{userID}/var", n)
                 var[n.split(";;")[0]] = pd.Series(data=l, index=v)
 
     vkeys = list(var.keys())
-    for f in fnames:
-        n = f.split("/")[-1].split("\\")[-1][:-2]
+    for n in fnames:
         if ";;" not in n:
             if n not in vkeys:
-                l = pickle_loader(f"{userID}/var/{n}.p")
                 if n != "name_0":
+                    l = column_store.read_column(f"{userID}/var", n)
                     var[n] = pd.Series(data=l, index=v)
     del var["name_0"]
     var.to_csv(f"{userID}/output/var.txt", sep="\t")
@@ -778,8 +750,8 @@ def save_metadata_put(request, data_adaptor):
     userID = _get_user_id(data_adaptor)
 
     labels = pd.DataFrame()
-    for k in labelNames:
-        labels[k] = pickle_loader(f"{userID}/obs/{k}.p")
+    for k, vals in column_store.read_columns(f"{userID}/obs", labelNames).items():
+        labels[k] = vals
 
     mode = userID.split("/")[-1].split("\\")[-1]
     labels.index = pd.Index(data_adaptor.NAME[mode]["obs"])
@@ -805,14 +777,7 @@ def save_metadata_put(request, data_adaptor):
 
 def save_genedata_put(request, data_adaptor):
     userID = _get_user_id(data_adaptor)
-    genesets = {}
-    for k in glob(f"{userID}/set/*"):
-        kn = k.split("/")[-1].split("\\")[-1]
-        kn = "" if kn == "__blank__" else kn
-        genesets[kn] = {}
-        for k2 in glob(f"{userID}/set/{kn}/*.p"):
-            kn2 = k2.split("/")[-1].split("\\")[-1].split(".p")[0]
-            genesets[kn][kn2] = pickle_loader(k2)
+    genesets = gene_set_store.read_genesets(userID)
 
     annotations = data_adaptor.dataset_config.user_annotations
     with open(f"{userID}/output/gene-sets.csv", "w", newline="") as f:
@@ -862,22 +827,18 @@ def delete_obsm_put(request, data_adaptor):
                 pickle_dumper(paired_embeddings, f"{ID}/paired_embeddings.p")
 
         for embName in embNames:
-            if os.path.exists(f"{userID}/emb/{embName}.p"):
-                os.remove(f"{userID}/emb/{embName}.p")
-            if os.path.exists(f"{userID}/nnm/{embName}.p"):
-                os.remove(f"{userID}/nnm/{embName}.p")
-            if os.path.exists(f"{userID}/params/{embName}.p"):
-                os.remove(f"{userID}/params/{embName}.p")
-
-            fns = glob(f"{userID}/pca/*.p")
-            for f in fns:
-                if ";;" + embName in f:
-                    os.remove(f)
-
-            fns = glob(f"{userID}/var/*.p")
-            for f in fns:
-                if ";;" + embName in f:
-                    os.remove(f)
+            embedding_store.delete_embedding(f"{userID}/emb", embName)
+            graph_store.delete_graph(f"{userID}/nnm", embName)
+            manifest.delete_artifact(userID, "params", embName)
+
+            for n in manifest.list_artifacts(userID, "pca"):
+                if ";;" + embName in n:
+                    manifest.delete_artifact(userID, "pca", n)
+
+            for n in column_store.list_columns(f"{userID}/var"):
+                if ";;" + embName in n:
+                    column_store.delete_column(f"{userID}/var", n)
+        housekeeping.maintain_async(ID)
     try:
         return make_response(jsonify({"fail": fail}), HTTPStatus.OK, {"Content-Type": "application/json"})
     except NotImplementedError as e:
@@ -895,14 +856,11 @@ def delete_obs_put(request, data_adaptor):
     otherMode = "OBS" if mode == "VAR" else "VAR"
     ID = userID.split("/")[0].split("\\")[0] + "/" + otherMode
 
-    if os.path.exists(f"{userID}/obs/{name}.p"):
-        os.remove(f"{userID}/obs/{name}.p")
+    column_store.delete_column(f"{userID}/obs", name)
 
     if data_adaptor._joint_mode:
-        if os.path.exists(f"{ID}/var/{name}.p"):
-            os.remove(f"{ID}/var/{name}.p")
-        if os.path.exists(f"{ID}/set/{name}/"):
-            shutil.rmtree(f"{ID}/set/{name}/")
+        column_store.delete_column(f"{ID}/var", name)
+        gene_set_store.delete_group(ID, name)
 
     try:
         return make_response(jsonify({"fail": fail}), HTTPStatus.OK, {"Content-Type": "application/json"})
@@ -921,18 +879,12 @@ def rename_obs_put(request, data_adaptor):
     otherMode = "OBS" if mode == "VAR" else "VAR"
     ID = userID.split("/")[0].split("\\")[0] + "/" + otherMode
 
-    if os.path.exists(f"{userID}/obs/{oldName}.p"):
-        os.rename(f"{userID}/obs/{oldName}.p", f"{userID}/obs/{newName}.p")
+    if column_store.has_column(f"{userID}/obs", oldName):
+        column_store.rename_column(f"{userID}/obs", oldName, newName)
 
         if data_adaptor._joint_mode:
-            try:
-                os.rename(f"{ID}/var/{oldName}.p", f"{ID}/var/{newName}.p")
-            except:
-                pass
-            try:
-                shutil.rmtree(f"{ID}/set/{oldName}/")
-            except:
-                pass
+            column_store.rename_column(f"{ID}/var", oldName, newName)
+            gene_set_store.delete_group(ID, oldName)
     try:
         return make_response(
             jsonify({"schema": schema_get_helper(data_adaptor)}), HTTPStatus.OK, {"Content-Type": "application/json"}
@@ -948,7 +900,7 @@ def switch_cxg_mode(request, data_adaptor):
     mode = userID.split("/")[-1].split("\\")[-1]
     ID = userID.split("/")[0].split("\\")[0]
     newMode = "OBS" if mode == "VAR" else "VAR"
-    pickle.dump(newMode, open(f"{ID}/mode.p", "wb"))
+    pickle_dumper(newMode, f"{ID}/mode.p")
 
     try:
         return make_response(jsonify({"success": True}), HTTPStatus.OK, {"Content-Type": "application/json"})
@@ -977,13 +929,9 @@ def rename_set_put(request, data_adaptor):
     newName = args.get("newName", None)
     if "//;;//" in oldName and "//;;//" not in newName:
         newName += "//;;//"
-    oldName = oldName.replace("//;;//", "__DEG__")
-    newName = newName.replace("//;;//", "__DEG__")
 
     userID = _get_user_id(data_adaptor)
-
-    if os.path.exists(f"{userID}/set/{oldName.replace('/','_')}"):
-        os.rename(f"{userID}/set/{oldName.replace('/','_')}", f"{userID}/set/{newName.replace('/','_')}")
+    gene_set_store.rename_group(userID, oldName, newName)
 
     try:
         return make_response(jsonify({"fail": False}), HTTPStatus.OK, {"Content-Type": "application/json"})
@@ -996,11 +944,8 @@ def rename_set_put(request, data_adaptor):
 def delete_set_put(request, data_adaptor):
     args = request.get_json()
     name = args.get("name", None)
-    name = name.replace("//;;//", "__DEG__")
     userID = _get_user_id(data_adaptor)
-
-    if os.path.exists(f"{userID}/set/{name.replace('/','_')}"):
-        shutil.rmtree(f"{userID}/set/{name.replace('/','_')}")
+    gene_set_store.delete_group(userID, name)
 
     try:
         return make_response(jsonify({"fail": False}), HTTPStatus.OK, {"Content-Type": "application/json"})
@@ -1013,18 +958,11 @@ def delete_set_put(request, data_adaptor):
 def rename_geneset_put(request, data_adaptor):
     args = request.get_json()
     set = args.get("set", None)
-    set = "__blank__" if set == "" else set
     newSet = args.get("newSet", None)
     oldName = args.get("oldName", None)
     newName = args.get("newName", None)
     userID = _get_user_id(data_adaptor)
-    src = f"{userID}/set/{set.replace('/','_')}/{oldName.replace('/','_')}.p"
-    tgtFolder = f"{userID}/set/{newSet.replace('/','_')}/"
-    if not os.path.exists(tgtFolder):
-        os.makedirs(tgtFolder)
-    tgt = f"{tgtFolder}/{newName.replace('/','_')}.p"
-    if os.path.exists(src):
-        os.rename(src, tgt)
+    gene_set_store.rename_geneset(userID, set, oldName, newSet, newName)
 
     try:
         return make_response(jsonify({"fail": False}), HTTPStatus.OK, {"Content-Type": "application/json"})
@@ -1037,13 +975,9 @@ def rename_geneset_put(request, data_adaptor):
 def delete_geneset_put(request, data_adaptor):
     args = request.get_json()
     set = args.get("set", None)
-    set = "__blank__" if set == "" else set
     name = args.get("name", None)
     userID = _get_user_id(data_adaptor)
-    src = f"{userID}/set/{set.replace('/','_')}/{name.replace('/','_')}.p"
-
-    if os.path.exists(src):
-        os.remove(src)
+    gene_set_store.delete_geneset(userID, set, name)
 
     try:
         return make_response(jsonify({"fail": False}), HTTPStatus.OK, {"Content-Type": "application/json"})
@@ -1106,15 +1040,45 @@ def diff_group_get(request, data_adaptor):
 
 
 def diff_stats_get(request, data_adaptor):
+    """
+    Return the differential expression result of a population as rows of
+    [varIndex, logfoldchange, pval, pval_adj] (plus [meanA, meanB] if `means` is set),
+    and the number of rows passing the filters.  The first `diffexp_store.TOP_N` rows
+    in rank order are returned unless the optional arguments are given: `sort` (lfc,
+    pval, pval_adj, mean_a or mean_b) and `order` (asc or desc), threshold filters
+    `lfc_min`, `pval_max` and `pval_adj_max`, and paging with `offset` and `limit`.
+    """
     name = request.args.get("name", None)
     pop = request.args.get("pop", None)
     userID = _get_user_id(data_adaptor)
     try:
-        x = pickle_loader(f"{userID}/diff/{name.replace('/','_')}/{pop.replace('/','_')}_output.p")
-        return make_response(jsonify_numpy({"pop": x}), HTTPStatus.OK, {"Content-Type": "application/json"})
+        args = request.args
+        rows, total = diffexp_store.query(
+            f"{userID}/diff/{name.replace('/','_')}",
+            pop.replace("/", "_"),
+            sort_by=args.get("sort", None),
+            ascending=args.get("order", "desc") == "asc",
+            lfc_min=args.get("lfc_min", None, type=float),
+            pval_max=args.get("pval_max", None, type=float),
+            pval_adj_max=args.get("pval_adj_max", None, type=float),
+            offset=args.get("offset", 0, type=int),
+            limit=args.get("limit", diffexp_store.TOP_N, type=int),
+        )
+        columns = ["index", "lfc", "pval", "pval_adj"]
+        if args.get("means", "false").lower() == "true":
+            columns += ["mean_a", "mean_b"]
+        x = np.stack([rows[c].astype("float64") for c in columns], axis=1).tolist()
+        for row in x:
+            row[0] = int(row[0])
+            if len(row) > 4:
+                # means are unknown (NaN) for results computed by older versions
+                row[4:] = [None if np.isnan(v) else v for v in row[4:]]
+        return make_response(
+            jsonify_numpy({"pop": x, "total": total}), HTTPStatus.OK, {"Content-Type": "application/json"}
+        )
     except NotImplementedError as e:
         return abort_and_log(HTTPStatus.NOT_IMPLEMENTED, str(e))
-    except (ValueError, DisabledFeatureError, FilterError) as e:
+    except (ValueError, DisabledFeatureError, FilterError, KeyError) as e:
         return abort_and_log(HTTPStatus.BAD_REQUEST, str(e), include_exc_info=True)
 
 
@@ -1149,8 +1113,8 @@ def diff_genes_put(request, data_adaptor):
 def initialize_user(data_adaptor):
     userID = _get_user_id(data_adaptor).split("/")[0].split("\\")[0]
     if not os.path.exists(f"{userID}/"):
-        os.system(f"mkdir {userID}")
-        os.system(f"cp -r {data_adaptor.guest_idhash}/* {userID}/")
+        workspace_clone.clone_workspace(data_adaptor.guest_idhash, userID)
+    housekeeping.maintain_async(userID)
 
     if not current_app.hosted_mode:
         session.clear()
@@ -1200,22 +1164,18 @@ def rename_obsm_put(request, data_adaptor):
                 pickle_dumper(paired_embeddings, f"{ID}/paired_embeddings.p")
 
             newItem = rename_wrapper(embName, oldName, newName)
-            if os.path.exists(f"{userID}/emb/{embName}.p"):
-                os.rename(f"{userID}/emb/{embName}.p", f"{userID}/emb/{newItem}.p")
-            if os.path.exists(f"{userID}/nnm/{embName}.p"):
-                os.rename(f"{userID}/nnm/{embName}.p", f"{userID}/nnm/{newItem}.p")
-            if os.path.exists(f"{userID}/params/{embName}.p"):
-                os.rename(f"{userID}/params/{embName}.p", f"{userID}/params/{newItem}.p")
-
-            fns = glob(f"{userID}/pca/*.p")
-            for f in fns:
-                if ";;" + embName in f:
-                    os.rename(f, f.replace(embName, newItem))
-
-            fns = glob(f"{userID}/var/*.p")
-            for f in fns:
-                if ";;" + embName in f:
-                    os.rename(f, f.replace(embName, newItem))
+            embedding_store.rename_embedding(f"{userID}/emb", embName, newItem)
+            graph_store.rename_graph(f"{userID}/nnm", embName, newItem)
+            manifest.rename_artifact(userID, "params", embName, newItem)
+
+            for n in manifest.list_artifacts(userID, "pca"):
+                if ";;" + embName in n:
+                    manifest.rename_artifact(userID, "pca", n, n.replace(embName, newItem))
+
+            for n in column_store.list_columns(f"{userID}/var"):
+                if ";;" + embName in n:
+                    column_store.rename_column(f"{userID}/var", n, n.replace(embName, newItem))
+        housekeeping.maintain_async(ID)
     try:
         layout_schema = {"name": newName, "type": "float32", "dims": [f"{newName}_0", f"{newName}_1"]}
         return make_response(jsonify({"schema": layout_schema}), HTTPStatus.OK, {"Content-Type": "application/json"})
@@ -1363,69 +1323,24 @@ def reembed_parameters_put(request, data_adaptor):
 
 def genesets_get(request, data_adaptor):
     userID = _get_user_id(data_adaptor)
-    genesets = {}
-    for k in glob(f"{userID}/set/*"):
-        k = k.split("/")[-1].split("\\")[-1]
-        set = "" if k == "__blank__" else k
-        set = set.replace("__DEG__", "//;;//") if set.endswith("__DEG__") else set
-        genesets[set] = {}
-        for k2 in glob(f"{userID}/set/{k}/*.p"):
-            kn2 = k2.split("/")[-1].split("\\")[-1].split(".p")[0]
-            genesets[set][kn2] = pickle_loader(k2)
-
+    genesets = gene_set_store.read_genesets(userID)
     return make_response(jsonify({"genesets": genesets}), HTTPStatus.OK)
 
 
 def genesets_put(request, data_adaptor):
     userID = _get_user_id(data_adaptor)
     genesets = request.get_json()
-    for set in genesets:
-        setn = "__blank__" if set == "" else set
-        setn = setn.replace("//;;//", "__DEG__")
-        if not os.path.exists(f"{userID}/set/{setn}/"):
-            os.makedirs(f"{userID}/set/{setn}/")
-        for name in genesets[set]:
-            pickle_dumper(genesets[set][name], f"{userID}/set/{setn}/{name}.p")
-
-        if "//;;//" not in set and data_adaptor._joint_mode:
-            # convert genesets to obs
-            v = pickle_loader(f"{userID}/var/name_0.p")
-            ID = userID.split("/")[0].split("\\")[0]
-            mode = userID.split("/")[-1].split("\\")[-1]
-            otherMode = "OBS" if mode == "VAR" else "VAR"
-            genesets = {}
-            for k2 in glob(f"{userID}/set/{setn}/*.p"):
-                kn2 = k2.split("/")[-1].split("\\")[-1].split(".p")[0]
-                genesets[kn2] = pickle_loader(k2)
-
-            if set != "":
-                C = []
-                O = []
-                for key2 in genesets:
-                    o = genesets[key2]
-                    O.extend(o)
-                    C.extend([key2] * len(o))
-                C = np.array(C)
-                O = np.array(O)
-                d = _df_to_dict(O, C)
-
-                for kk in d.keys():
-                    if len(d[kk]) > 1:
-                        d[kk] = d[kk][
-                            np.argmin(np.array([np.where(np.array(genesets[mm]) == kk)[0][0] for mm in d[kk]]))
-                        ]
-                    else:
-                        d[kk] = d[kk][0]
-                C = np.array(list(d.values()))
-                O = np.array(list(d.keys()))
-
-                f = np.in1d(v, O, invert=True)
-                vnot = v[f]
-                C = np.append(C, ["unassigned"] * len(vnot))
-                O = np.append(O, vnot)
-                vals = pd.Series(data=C, index=O)[v].values.flatten()
-
-                pickle_dumper(vals, f"{ID}/{otherMode}/obs/{set}.p")
+    gene_set_store.put_genesets(userID, genesets)
+
+    if data_adaptor._joint_mode:
+        # convert genesets to obs of the other mode, assigning each gene to the set it ranks highest in
+        ID = userID.split("/")[0].split("\\")[0]
+        mode = userID.split("/")[-1].split("\\")[-1]
+        otherMode = "OBS" if mode == "VAR" else "VAR"
+        for set in genesets:
+            if set != "" and "//;;//" not in set:
+                vals = gene_set_store.first_set_per_var(userID, set)
+                column_store.write_column(f"{ID}/{otherMode}/obs", set, vals)
 
     return make_response(jsonify({"status": "OK"}), HTTPStatus.OK)
 
@@ -0,0 +1,136 @@
+"""
+Process-wide cache of unpickled workspace artifacts.
+
+`load` is a drop-in replacement for reading a pickle from the user workspace.  Loaded
+objects are kept in a bounded LRU keyed by path and validated against the file's
+mtime, size and inode, so a file rewritten by another process (eg, a compute worker) is
+never served stale.  Every cached entry is accounted for by the size of its pickle on disk.
+`dump` writes through the cache and invalidates the entry for the written path.
+
+Cached objects are shared rather than copied on every hit, which would cost about as much
+as unpickling them again: arrays are returned as read-only views of the cached arrays,
+inside fresh copies of the dicts, lists and tuples holding them, so callers may update
+those containers but must copy an array before modifying it.  Objects of any other type
+are deep-copied.
+"""
+
+import copy
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import backend.server.common.workspace.fsutils as fsutils
+
+IMMUTABLE_TYPES = (str, bytes, int, float, complex, bool, type(None))
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # path -> ((mtime_ns, size, inode), obj)
+_nbytes = 0
+_max_bytes = DEFAULT_MAX_BYTES
+_hits = 0
+_misses = 0
+
+
+def set_max_bytes(max_bytes):
+    """set the cache size bound.  A bound of 0 (or None) disables the cache."""
+    global _max_bytes
+    with _lock:
+        _max_bytes = max_bytes or 0
+        _evict()
+
+
+def _evict():
+    global _nbytes
+    while _entries and _nbytes > _max_bytes:
+        _, (key, _) = _entries.popitem(last=False)
+        _nbytes -= key[1]
+
+
+def _discard(path):
+    global _nbytes
+    entry = _entries.pop(path, None)
+    if entry is not None:
+        _nbytes -= entry[0][1]
+
+
+def invalidate(fn):
+    with _lock:
+        _discard(os.path.abspath(fn))
+
+
+def clear():
+    global _nbytes
+    with _lock:
+        _entries.clear()
+        _nbytes = 0
+
+
+def _share(obj):
+    """the cached object `obj`, as handed out to a caller (see above)"""
+    if isinstance(obj, np.ndarray):
+        view = obj.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(obj, IMMUTABLE_TYPES) or isinstance(obj, np.generic):
+        return obj
+    if type(obj) is dict:
+        return {k: _share(v) for k, v in obj.items()}
+    if type(obj) in (list, tuple):
+        return type(obj)(_share(v) for v in obj)
+    return copy.deepcopy(obj)
+
+
+def load(fn):
+    global _hits, _misses, _nbytes
+    path = os.path.abspath(fn)
+    key = fsutils.stat_key(path)
+
+    with _lock:
+        entry = _entries.get(path)
+        if entry is not None and entry[0] == key:
+            _entries.move_to_end(path)
+            _hits += 1
+            obj = entry[1]
+        else:
+            _discard(path)
+            _misses += 1
+            obj = None
+
+    if obj is not None:
+        return _share(obj)
+
+    with open(path, "rb") as f:
+        obj = pickle.load(f)
+
+    if key[1] <= _max_bytes:
+        with _lock:
+            _discard(path)
+            _entries[path] = (key, obj)
+            _nbytes += key[1]
+            _evict()
+        return _share(obj)
+    return obj
+
+
+def dump(x, fn):
+    # replace rather than overwrite: the file may be shared with other workspaces
+    path = os.path.abspath(fn)
+    invalidate(path)
+    fsutils.atomic_dump(x, path)
+
+
+def stats():
+    """return cache counters, for sizing the cache"""
+    with _lock:
+        return {
+            "hits": _hits,
+            "misses": _misses,
+            "entries": len(_entries),
+            "bytes": _nbytes,
+            "max_bytes": _max_bytes,
+        }
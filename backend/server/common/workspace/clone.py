@@ -0,0 +1,66 @@
+"""
+Copy-on-write cloning of user workspaces.
+
+A new user's workspace starts as a clone of the guest workspace.  Instead of copying
+every embedding, graph and annotation, files are hard-linked into the new workspace
+(falling back to a copy when the two directories are on different file systems), so
+cloning costs one directory entry per file and no data.
+
+This relies on every workspace writer replacing files atomically (write to a temporary
+file, then `os.replace`) rather than rewriting them in place: a write then swaps in a
+new inode for the writing user only, leaving the other links, and hence the base
+workspace and every other clone, untouched.  All writers in `backend.server.common.workspace`
+follow this rule.
+"""
+
+import os
+import shutil
+
+# transient files which are never shared between workspaces
+SKIPPED_DIRECTORIES = ("output",)
+SKIPPED_SUFFIXES = (".tmp", ".lock")
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def clone_workspace(src, dst):
+    """populate `dst` with a copy-on-write clone of the workspace in `src`"""
+    src = os.path.normpath(src)
+    dst = os.path.normpath(dst)
+    for root, dirs, files in os.walk(src):
+        rel = os.path.relpath(root, src)
+        target = dst if rel == "." else os.path.join(dst, rel)
+        os.makedirs(target, exist_ok=True)
+
+        if os.path.basename(root) in SKIPPED_DIRECTORIES and rel != ".":
+            dirs[:] = []
+            continue
+
+        for fn in files:
+            if fn.endswith(SKIPPED_SUFFIXES):
+                continue
+            _link_or_copy(os.path.join(root, fn), os.path.join(target, fn))
+
+
+def reset_workspace(src, dst):
+    """discard all changes made in `dst` and make it a fresh clone of `src`"""
+    src = os.path.normpath(src)
+    dst = os.path.normpath(dst)
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return
+
+    staging = f"{dst}.reset.{os.getpid()}"
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    clone_workspace(src, staging)
+
+    trash = f"{dst}.old.{os.getpid()}"
+    if os.path.exists(dst):
+        os.replace(dst, trash)
+    os.replace(staging, dst)
+    shutil.rmtree(trash, ignore_errors=True)
@@ -0,0 +1,419 @@
+"""
+Columnar storage for per-user obs/var annotations.
+
+Each annotation directory (eg, `{userID}/obs` or `{userID}/var`) holds the data files of
+every column plus a small JSON manifest (`_columns.json`) describing them.  Numeric and
+plain string columns are stored as a single array (`{name}.npy`); low-cardinality string
+columns are stored as integer codes plus a categories array (`{name}.codes` and
+`{name}.cats`).  Every kind of file has its own suffix, so the files of one column can
+never be mistaken for those of another, whatever the column names.  All arrays are memory-mapped on read, so
+a request only pages in the columns (and rows) it actually touches, and listing columns or
+building the schema never has to open the column data at all.
+
+Edits to a few rows of a categorical column (eg, relabelling some cells) are not written
+by re-encoding the column: `update_column` appends the changed rows, as (row, code) pairs,
+to the column's delta log (`{name}.{generation}.delta`), and reads apply the log on top of
+the stored codes.  Once a log holds more than `COMPACTION_RATIO` of the column's rows it is
+compacted -- merged into the codes -- in a background thread.  The log is only ever
+appended to after breaking any hard link to it (see `clone`), and categories are only
+ever appended to the categories array, so concurrent readers always see consistent codes.
+
+Directories written by older versions (one pickle per column, or categorical columns
+stored as `{name}.codes.npy`) are migrated in place the first time they are opened.
+"""
+
+import json
+import os
+import pickle
+import threading
+import time
+from glob import glob
+
+import numpy as np
+
+import backend.server.common.workspace.fsutils as fsutils
+from backend.common.utils.type_conversion_utils import get_schema_type_hint_of_array
+
+MANIFEST = "_columns.json"
+LOCKFILE = "_columns.lock"
+VERSION = 2
+
+# string columns with fewer unique values than this fraction of their length are
+# stored as integer codes + categories.
+CATEGORICAL_RATIO = 0.5
+
+# updates changing more than this fraction of a column's rows rewrite the column instead of
+# appending to its delta log; logs longer than COMPACTION_RATIO of the rows are compacted.
+DELTA_MAX_RATIO = 0.1
+COMPACTION_RATIO = 0.05
+DELTA_RECORD = np.dtype([("row", "<i4"), ("code", "<i4")])
+
+_manifest_cache = {}
+_compacting = set()
+_compacting_lock = threading.Lock()
+
+
+def _directory_lock(directory):
+    return fsutils.directory_lock(os.path.join(directory, LOCKFILE))
+
+
+def _write_manifest(directory, manifest):
+    fn = os.path.join(directory, MANIFEST)
+    fsutils.atomic_write_json(fn, manifest)
+    _manifest_cache[fn] = (fsutils.stat_key(fn), manifest)
+
+
+def _read_manifest(directory):
+    fn = os.path.join(directory, MANIFEST)
+    try:
+        key = fsutils.stat_key(fn)
+    except FileNotFoundError:
+        _migrate_legacy_columns(directory)
+        key = fsutils.stat_key(fn)
+
+    cached = _manifest_cache.get(fn)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    with open(fn) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != VERSION:
+        return _upgrade_manifest(directory)
+    _manifest_cache[fn] = (key, manifest)
+    return manifest
+
+
+def _copy_manifest(manifest):
+    # cached manifests are shared between threads, so never update them in place
+    return {**manifest, "columns": dict(manifest["columns"])}
+
+
+def _upgrade_manifest(directory):
+    """rename the data files of categorical columns written before they had their own suffixes"""
+    with _directory_lock(directory):
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get("version") == VERSION:
+            return manifest
+        for name, entry in manifest["columns"].items():
+            if entry["kind"] != "categorical":
+                continue
+            base = os.path.join(directory, name)
+            _, codes_fn, cats_fn = _column_files(directory, name)
+            for src, tgt in ((f"{base}.codes.npy", codes_fn), (f"{base}.cats.npy", cats_fn)):
+                if os.path.exists(src):
+                    os.replace(src, tgt)
+        manifest = {**manifest, "version": VERSION}
+        _write_manifest(directory, manifest)
+        return manifest
+
+
+def _migrate_legacy_columns(directory):
+    """convert a directory of one-pickle-per-column files into the columnar layout"""
+    os.makedirs(directory, exist_ok=True)
+    with _directory_lock(directory):
+        if os.path.exists(os.path.join(directory, MANIFEST)):
+            return
+        manifest = {"version": VERSION, "columns": {}}
+        legacy = glob(os.path.join(directory, "*.p"))
+        for fn in legacy:
+            name = os.path.basename(fn)[:-2]
+            with open(fn, "rb") as f:
+                vals = pickle.load(f)
+            manifest["columns"][name] = _store_column(directory, name, vals)
+        _write_manifest(directory, manifest)
+        for name, entry in manifest["columns"].items():
+            _remove_stale_files(directory, name, entry)
+        for fn in legacy:
+            os.remove(fn)
+
+
+def _normalize_values(vals):
+    vals = np.asarray(vals)
+    if vals.dtype.kind == "O":
+        if all(isinstance(v, str) for v in vals):
+            vals = vals.astype("str")
+        else:
+            try:
+                vals = vals.astype("float")
+            except (TypeError, ValueError):
+                vals = vals.astype("str")
+    elif vals.dtype.kind == "S":
+        vals = vals.astype("str")
+    return vals
+
+
+def _column_files(directory, name):
+    base = os.path.join(directory, name)
+    return f"{base}.npy", f"{base}.codes", f"{base}.cats"
+
+
+def _store_column(directory, name, vals):
+    """write column data files and return the manifest entry describing them"""
+    vals = _normalize_values(vals)
+    values_fn, codes_fn, cats_fn = _column_files(directory, name)
+
+    if vals.size > 0:
+        uniques, codes, counts = np.unique(vals, return_inverse=True, return_counts=True)
+        writable = not (uniques.size > 2000 or counts.max() < 5)
+    else:
+        uniques, codes = vals, np.zeros(0, dtype="int32")
+        writable = True
+
+    entry = {
+        "dtype": vals.dtype.str,
+        "length": int(vals.size),
+        "writable": writable,
+        "type_hint": get_schema_type_hint_of_array(vals),
+    }
+
+    if vals.dtype.kind == "U" and uniques.size < CATEGORICAL_RATIO * vals.size:
+        fsutils.atomic_save(codes_fn, codes.astype("int32" if uniques.size > 32767 else "int16"))
+        fsutils.atomic_save(cats_fn, uniques)
+        entry["kind"] = "categorical"
+    else:
+        fsutils.atomic_save(values_fn, vals)
+        entry["kind"] = "array"
+    return entry
+
+
+def _remove_stale_files(directory, name, entry):
+    """remove data files left over from a previous encoding of the column"""
+    values_fn, codes_fn, cats_fn = _column_files(directory, name)
+    stale = (values_fn,) if entry["kind"] == "categorical" else (codes_fn, cats_fn)
+    for fn in stale:
+        if os.path.exists(fn):
+            os.remove(fn)
+
+
+def _remove_column_files(directory, name, entry=None):
+    files = list(_column_files(directory, name))
+    if entry is not None and entry.get("delta") is not None:
+        files.append(_delta_file(directory, name, entry))
+    for fn in files:
+        if os.path.exists(fn):
+            os.remove(fn)
+
+
+def _delta_file(directory, name, entry):
+    return os.path.join(directory, f"{name}.{entry['delta']}.delta")
+
+
+def _read_delta(directory, name, entry):
+    """return the delta log records of a column, or None if the log was compacted away"""
+    try:
+        with open(_delta_file(directory, name, entry), "rb") as f:
+            buf = f.read()
+    except FileNotFoundError:
+        return None
+    # ignore a partially appended trailing record
+    return np.frombuffer(buf, dtype=DELTA_RECORD, count=len(buf) // DELTA_RECORD.itemsize)
+
+
+def _apply_delta(codes, delta):
+    codes = np.array(codes, dtype="int32")
+    # later records win
+    rows, last = np.unique(delta["row"][::-1], return_index=True)
+    codes[rows] = delta["code"][::-1][last]
+    return codes
+
+
+def column_files(directory, name):
+    """return the existing data files of a column, including its delta log"""
+    files = list(_column_files(directory, name))
+    entry = _read_manifest(directory)["columns"].get(name)
+    if entry is not None and entry.get("delta") is not None:
+        files.append(_delta_file(directory, name, entry))
+    return [fn for fn in files if os.path.exists(fn)]
+
+
+def list_columns(directory):
+    """return the names of all columns stored in `directory`"""
+    return list(_read_manifest(directory)["columns"].keys())
+
+
+def has_column(directory, name):
+    return name in _read_manifest(directory)["columns"]
+
+
+def column_info(directory, name):
+    """return the manifest entry for a column (dtype, length, writable, type_hint)"""
+    try:
+        return _read_manifest(directory)["columns"][name]
+    except KeyError:
+        raise KeyError(f"Annotation {name} does not exist.")
+
+
+def read_column(directory, name):
+    """
+    Return the values of a single column.  Array columns are returned as read-only
+    memory-mapped arrays; categorical columns are decoded from their codes.
+    """
+    values_fn, codes_fn, cats_fn = _column_files(directory, name)
+    for _ in range(3):
+        entry = column_info(directory, name)
+        if entry["kind"] != "categorical":
+            return np.load(values_fn, mmap_mode="r")
+        codes = np.load(codes_fn, mmap_mode="r")
+        cats = np.load(cats_fn, mmap_mode="r")
+        if entry.get("delta") is None:
+            return cats[codes]
+        delta = _read_delta(directory, name, entry)
+        if delta is not None:
+            return cats[_apply_delta(codes, delta)]
+        # the log was compacted since the manifest was read; the codes are up to date once
+        # the new manifest is visible
+    return cats[codes]
+
+
+def read_columns(directory, names):
+    """return a dict of name -> values for the requested columns"""
+    return {name: read_column(directory, name) for name in names}
+
+
+def write_column(directory, name, vals):
+    """create or overwrite a column"""
+    _read_manifest(directory)
+    with _directory_lock(directory):
+        manifest = _copy_manifest(_read_manifest(directory))
+        previous = manifest["columns"].get(name)
+        entry = manifest["columns"][name] = _store_column(directory, name, vals)
+        _write_manifest(directory, manifest)
+        _remove_stale_files(directory, name, entry)
+        if previous is not None and previous.get("delta") is not None:
+            os.remove(_delta_file(directory, name, previous))
+
+
+def write_delta(directory, name, rows, vals):
+    """set the values of `rows` of a categorical column to `vals` by appending to its delta log"""
+    vals = _normalize_values(vals).astype("str")
+    _read_manifest(directory)
+    with _directory_lock(directory):
+        manifest = _read_manifest(directory)
+        entry = manifest["columns"].get(name)
+        if entry is None or entry["kind"] != "categorical":
+            raise ValueError(f"Annotation {name} is not a categorical column.")
+
+        _, _, cats_fn = _column_files(directory, name)
+        cats = np.load(cats_fn)
+        new_cats = np.setdiff1d(vals, cats)
+        if new_cats.size > 0:
+            # categories are only ever appended, so stored codes stay valid
+            cats = np.append(cats, new_cats)
+            fsutils.atomic_save(cats_fn, cats)
+        sorter = np.argsort(cats)
+        codes = sorter[np.searchsorted(cats, vals, sorter=sorter)]
+
+        if entry.get("delta") is None:
+            manifest = _copy_manifest(manifest)
+            entry = manifest["columns"][name] = {**entry, "delta": time.time_ns()}
+            _write_manifest(directory, manifest)
+
+        records = np.empty(len(rows), dtype=DELTA_RECORD)
+        records["row"] = rows
+        records["code"] = codes
+        fn = _delta_file(directory, name, entry)
+        fsutils.break_link(fn)
+        with open(fn, "ab") as f:
+            f.write(records.tobytes())
+        n_records = os.path.getsize(fn) // DELTA_RECORD.itemsize
+
+    if n_records > COMPACTION_RATIO * entry["length"]:
+        compact_column_async(directory, name)
+
+
+def update_column(directory, name, vals):
+    """
+    Write `vals` to a column.  If the column is categorical and only a few rows changed,
+    only those rows are recorded, in the column's delta log.  Returns the indices of the
+    changed rows, or None if the column was written in full.
+    """
+    vals = _normalize_values(vals)
+    try:
+        entry = column_info(directory, name)
+    except KeyError:
+        entry = None
+    if entry is None or entry["kind"] != "categorical" or vals.dtype.kind != "U" or vals.size != entry["length"]:
+        write_column(directory, name, vals)
+        return None
+
+    changed = np.flatnonzero(read_column(directory, name) != vals)
+    if changed.size > DELTA_MAX_RATIO * vals.size:
+        write_column(directory, name, vals)
+        return None
+    if changed.size > 0:
+        write_delta(directory, name, changed, vals[changed])
+    return changed
+
+
+def compact_column(directory, name):
+    """merge the delta log of a column into its stored values"""
+    _read_manifest(directory)
+    with _directory_lock(directory):
+        manifest = _copy_manifest(_read_manifest(directory))
+        previous = manifest["columns"].get(name)
+        if previous is None or previous.get("delta") is None:
+            return
+        vals = read_column(directory, name)
+        entry = manifest["columns"][name] = _store_column(directory, name, vals)
+        _write_manifest(directory, manifest)
+        _remove_stale_files(directory, name, entry)
+        delta_fn = _delta_file(directory, name, previous)
+        if os.path.exists(delta_fn):
+            os.remove(delta_fn)
+
+
+def compact_column_async(directory, name):
+    """run `compact_column` in a background thread, unless it is already running for the column"""
+    key = (os.path.normpath(directory), name)
+    with _compacting_lock:
+        if key in _compacting:
+            return
+        _compacting.add(key)
+
+    def run():
+        try:
+            compact_column(directory, name)
+        finally:
+            with _compacting_lock:
+                _compacting.discard(key)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def compact_all(directory):
+    """compact the delta logs of every column in `directory`"""
+    for name, entry in _read_manifest(directory)["columns"].items():
+        if entry.get("delta") is not None:
+            compact_column(directory, name)
+
+
+def delete_column(directory, name):
+    _read_manifest(directory)
+    with _directory_lock(directory):
+        manifest = _copy_manifest(_read_manifest(directory))
+        entry = manifest["columns"].pop(name, None)
+        if entry is not None:
+            _write_manifest(directory, manifest)
+        _remove_column_files(directory, name, entry)
+
+
+def rename_column(directory, old_name, new_name):
+    _read_manifest(directory)
+    with _directory_lock(directory):
+        manifest = _copy_manifest(_read_manifest(directory))
+        if old_name not in manifest["columns"]:
+            return
+        _remove_column_files(directory, new_name, manifest["columns"].get(new_name))
+        old_files = list(_column_files(directory, old_name))
+        new_files = list(_column_files(directory, new_name))
+        entry = manifest["columns"][old_name]
+        if entry.get("delta") is not None:
+            old_files.append(_delta_file(directory, old_name, entry))
+            new_files.append(_delta_file(directory, new_name, entry))
+        for src, tgt in zip(old_files, new_files):
+            if os.path.exists(src):
+                os.replace(src, tgt)
+        manifest["columns"].pop(new_name, None)
+        manifest["columns"][new_name] = manifest["columns"].pop(old_name)
+        _write_manifest(directory, manifest)
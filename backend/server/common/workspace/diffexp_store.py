@@ -0,0 +1,122 @@
+"""
+Columnar storage for differential expression results.
+
+The result of a differential expression run is stored per population in
+`{userID}/diff/{group}` as one `.npy` file per column, with rows in rank order
+(most up-regulated in the population first):
+
+    {pop}_output.index.npy     int32    variable index
+    {pop}_output.lfc.npy       float32  log2 fold change
+    {pop}_output.pval.npy      float64  p-value
+    {pop}_output.pval_adj.npy  float64  adjusted p-value
+    {pop}_output.mean_a.npy    float32  mean of the first group (set1)
+    {pop}_output.mean_b.npy    float32  mean of the second group (set2, or the rest)
+
+Every variable is stored, not just the top of the ranking, so `query` can serve sorted
+pages, threshold filters and arbitrary top-N requests from the memory-mapped columns
+without re-running the test.
+
+Results written by older versions (`{pop}_output.p`, a list of
+[index, lfc, pval, pval_adj] rows) are converted the first time they are read; their
+means are unknown and reported as NaN.
+"""
+
+import os
+import pickle
+
+import numpy as np
+
+import backend.server.common.workspace.fsutils as fsutils
+
+COLUMNS = {
+    "index": "int32",
+    "lfc": "float32",
+    "pval": "float64",
+    "pval_adj": "float64",
+    "mean_a": "float32",
+    "mean_b": "float32",
+}
+SORTABLE = ("lfc", "pval", "pval_adj", "mean_a", "mean_b")
+# length of the ranked lists sent with a result, and of a page of results by default
+TOP_N = 150
+
+
+def _column_file(directory, pop, column):
+    return os.path.join(directory, f"{pop}_output.{column}.npy")
+
+
+def _legacy_file(directory, pop):
+    return os.path.join(directory, f"{pop}_output.p")
+
+
+def _migrate_legacy_result(directory, pop):
+    legacy = _legacy_file(directory, pop)
+    if not os.path.exists(legacy):
+        return False
+    with open(legacy, "rb") as f:
+        rows = np.array(pickle.load(f), dtype="float64").reshape((-1, 4))
+    nans = np.full(rows.shape[0], np.nan)
+    write_result(directory, pop, rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3], nans, nans)
+    os.remove(legacy)
+    return True
+
+
+def write_result(directory, pop, index, lfc, pval, pval_adj, mean_a, mean_b):
+    """store a result; all arrays are in the population's rank order"""
+    os.makedirs(directory, exist_ok=True)
+    values = dict(index=index, lfc=lfc, pval=pval, pval_adj=pval_adj, mean_a=mean_a, mean_b=mean_b)
+    # index is written last: its presence marks the result as complete
+    for column in list(COLUMNS)[1:] + ["index"]:
+        fsutils.atomic_save(_column_file(directory, pop, column), np.asarray(values[column], dtype=COLUMNS[column]))
+
+
+def read_result(directory, pop):
+    """return a dict of column name -> memory-mapped array, in rank order"""
+    if not os.path.exists(_column_file(directory, pop, "index")) and not _migrate_legacy_result(directory, pop):
+        raise KeyError(f"Differential expression result {pop} does not exist.")
+    return {column: np.load(_column_file(directory, pop, column), mmap_mode="r") for column in COLUMNS}
+
+
+def query(
+    directory,
+    pop,
+    sort_by=None,
+    ascending=False,
+    lfc_min=None,
+    pval_max=None,
+    pval_adj_max=None,
+    offset=0,
+    limit=None,
+):
+    """
+    Return `(rows, total)` where `rows` is a dict of column name -> array for the
+    requested page and `total` the number of rows passing the filters.
+
+    Rows are filtered by `lfc_min` (minimum absolute log fold change), `pval_max` and
+    `pval_adj_max`, then ordered by rank (`sort_by=None`) or by one of the SORTABLE
+    columns, then sliced to `[offset, offset + limit)`.
+    """
+    if sort_by is not None and sort_by not in SORTABLE:
+        raise ValueError(f"Cannot sort differential expression results by {sort_by}")
+
+    result = read_result(directory, pop)
+    n = result["index"].size
+
+    keep = np.ones(n, dtype=bool)
+    if lfc_min is not None:
+        keep &= np.abs(result["lfc"]) >= lfc_min
+    if pval_max is not None:
+        keep &= result["pval"] <= pval_max
+    if pval_adj_max is not None:
+        keep &= result["pval_adj"] <= pval_adj_max
+    rows = np.flatnonzero(keep)
+
+    if sort_by is not None:
+        order = np.argsort(result[sort_by][rows], kind="stable")
+        rows = rows[order if ascending else order[::-1]]
+    elif ascending:
+        rows = rows[::-1]
+
+    total = rows.size
+    rows = rows[offset:] if limit is None else rows[offset : offset + limit]
+    return {column: np.asarray(result[column][rows]) for column in COLUMNS}, total
@@ -0,0 +1,95 @@
+"""
+On-disk storage for per-user embeddings.
+
+Embeddings live in `{userID}/emb` as one float32 `.npy` file per layout (NaN-padded to the
+full number of observations, as before).  Reads are memory-mapped, so serving a layout
+only pages in the columns that are sent to the client instead of unpickling the whole
+array.  `fingerprint` identifies the current contents of an embedding file and is used
+by the data adaptor to cache encoded layouts until the file changes.
+
+Embeddings written by older versions (`{name}.p` pickles) are converted the first time
+they are read.  Embeddings are listed from the workspace manifest.
+"""
+
+import os
+import pickle
+
+import numpy as np
+
+import backend.server.common.workspace.fsutils as fsutils
+import backend.server.common.workspace.manifest as manifest
+
+EXT = ".npy"
+LEGACY_EXT = ".p"
+
+
+def embedding_path(directory, name):
+    return os.path.join(directory, f"{name}{EXT}")
+
+
+def _workspace(directory):
+    return os.path.dirname(os.path.normpath(directory))
+
+
+def _migrate_legacy_embedding(directory, name):
+    legacy = os.path.join(directory, f"{name}{LEGACY_EXT}")
+    if not os.path.exists(legacy):
+        return False
+    with open(legacy, "rb") as f:
+        embedding = pickle.load(f)
+    write_embedding(directory, name, embedding)
+    os.remove(legacy)
+    return True
+
+
+def list_embeddings(directory):
+    """return the names of all embeddings stored in `directory`"""
+    return manifest.list_artifacts(_workspace(directory), "emb")
+
+
+def has_embedding(directory, name):
+    return manifest.exists(_workspace(directory), "emb", name)
+
+
+def read_embedding(directory, name, dims=None):
+    """
+    Return the embedding as a read-only memory-mapped float32 array.  If `dims` is
+    specified, only a view of the first `dims` columns is returned.
+    """
+    fn = embedding_path(directory, name)
+    if not os.path.exists(fn) and not _migrate_legacy_embedding(directory, name):
+        raise KeyError(f"Embedding {name} does not exist.")
+    embedding = np.load(fn, mmap_mode="r")
+    return embedding if dims is None else embedding[:, 0:dims]
+
+
+def write_embedding(directory, name, embedding):
+    """create or overwrite an embedding, storing it as float32"""
+    embedding = np.ascontiguousarray(embedding, dtype=np.float32)
+    fsutils.atomic_save(embedding_path(directory, name), embedding)
+    manifest.record(_workspace(directory), "emb", name, embedding.dtype, embedding.shape)
+
+
+def delete_embedding(directory, name):
+    for fn in (embedding_path(directory, name), os.path.join(directory, f"{name}{LEGACY_EXT}")):
+        if os.path.exists(fn):
+            os.remove(fn)
+    manifest.forget(_workspace(directory), "emb", name)
+
+
+def rename_embedding(directory, old_name, new_name):
+    if not has_embedding(directory, old_name):
+        return
+    if not os.path.exists(embedding_path(directory, old_name)):
+        _migrate_legacy_embedding(directory, old_name)
+    os.replace(embedding_path(directory, old_name), embedding_path(directory, new_name))
+    manifest.rename(_workspace(directory), "emb", old_name, new_name)
+
+
+def fingerprint(directory, name):
+    """return a value that changes whenever the embedding file is rewritten"""
+    fn = embedding_path(directory, name)
+    if not os.path.exists(fn) and not _migrate_legacy_embedding(directory, name):
+        raise KeyError(f"Embedding {name} does not exist.")
+    st = os.stat(fn)
+    return (fn, st.st_mtime_ns, st.st_size, st.st_ino)
@@ -0,0 +1,126 @@
+"""
+File system helpers shared by the workspace stores.
+
+Workspace files may be hard-linked into several user workspaces (see `clone`), so they
+must never be rewritten in place: every writer goes through `atomic_save`,
+`atomic_save_arrays`, `atomic_write_json` or `atomic_dump`, which write a temporary file
+and `os.replace` it.
+The only files appended to (annotation delta logs) go through `break_link` first.
+"""
+
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+_thread_lock = threading.RLock()
+
+
+def _tmp_name(fn):
+    return f"{fn}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+@contextmanager
+def directory_lock(lockfile, timeout=30.0):
+    """
+    Serialize updates guarded by `lockfile`, across threads and processes (the compute
+    workers write to the workspace too).  Uses an O_EXCL lock file, which works on any
+    file system; a lock older than `timeout` seconds is assumed stale.
+    """
+    with _thread_lock:
+        start = time.time()
+        while True:
+            try:
+                fd = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lockfile) > timeout:
+                        os.remove(lockfile)
+                        continue
+                except OSError:
+                    continue
+                if time.time() - start > timeout:
+                    raise TimeoutError(f"Timed out waiting for lock {lockfile}")
+                time.sleep(0.005)
+        try:
+            yield
+        finally:
+            try:
+                os.remove(lockfile)
+            except OSError:
+                pass
+
+
+def atomic_save(fn, arr):
+    """np.save `arr` to `fn`, replacing any existing file"""
+    tmp = _tmp_name(fn)
+    with open(tmp, "wb") as f:
+        np.save(f, arr, allow_pickle=False)
+    os.replace(tmp, fn)
+
+
+def atomic_save_arrays(fn, arrays):
+    """np.save each of `arrays`, one after the other, to `fn`, replacing any existing file"""
+    tmp = _tmp_name(fn)
+    with open(tmp, "wb") as f:
+        for arr in arrays:
+            np.save(f, arr, allow_pickle=False)
+    os.replace(tmp, fn)
+
+
+def load_arrays(fn):
+    """return the arrays saved to `fn` by `atomic_save_arrays`, as read-only memory maps"""
+    arrays = []
+    size = os.path.getsize(fn)
+    with open(fn, "rb") as f:
+        while f.tell() < size:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            if nbytes == 0:
+                arrays.append(np.zeros(shape, dtype=dtype))
+            else:
+                order = "F" if fortran_order else "C"
+                arrays.append(np.memmap(fn, dtype=dtype, mode="r", offset=offset, shape=shape, order=order))
+            f.seek(offset + nbytes)
+    return arrays
+
+
+def atomic_write_json(fn, obj):
+    tmp = _tmp_name(fn)
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, fn)
+
+
+def atomic_dump(obj, fn):
+    """pickle `obj` to `fn`, replacing any existing file"""
+    tmp = _tmp_name(fn)
+    with open(tmp, "wb") as f:
+        pickle.dump(obj, f)
+    os.replace(tmp, fn)
+
+
+def stat_key(fn):
+    """a value which changes whenever `fn` is rewritten or replaced"""
+    st = os.stat(fn)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def break_link(fn):
+    """give `fn` an inode of its own before it is modified in place, so hard-linked copies are unaffected"""
+    if os.path.exists(fn) and os.stat(fn).st_nlink > 1:
+        tmp = _tmp_name(fn)
+        shutil.copy2(fn, tmp)
+        os.replace(tmp, fn)
@@ -0,0 +1,327 @@
+"""
+Per-workspace gene set store.
+
+All gene sets of a workspace live in `{userID}/set` as a single catalog plus a few flat
+arrays, instead of one pickle per set:
+
+    _genesets.json                    the sets, in order: group, name, offset and length of
+                                      their members, and any members which are not var
+                                      names; and the generation of the arrays
+    _genesets.{gen}.members.npy       int32, the var indices of every set's members, in order
+    _genesets.{gen}.gene_indptr.npy   int64, inverted index: for var i, the positions in
+    _genesets.{gen}.gene_members.npy  int64  `members` at gene_members[gene_indptr[i]:gene_indptr[i+1]]
+
+Members are stored as indices into the workspace's var names (`{userID}/var/name_0`); the
+rare members which are not var names are kept as strings and listed after the others.  The
+inverted index makes "which sets contain this gene" a slice instead of a scan.
+Group names are stored as seen by the client (eg, "" for ungrouped sets and a "//;;//"
+suffix for sets derived from differential expression).
+
+Every update writes the arrays (they are small) under a new generation and then the
+catalog, whose atomic replacement switches readers to the new generation all at once.
+The previous generation is kept for readers which loaded the catalog just before; older
+ones are removed.  Workspaces written by older versions (`{userID}/set/{group}/{name}.p`)
+are migrated the first time they are opened.
+"""
+
+import json
+import os
+import shutil
+import time
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+import backend.server.common.workspace.artifact_cache as artifact_cache
+import backend.server.common.workspace.column_store as column_store
+import backend.server.common.workspace.fsutils as fsutils
+
+CATALOG = "_genesets.json"
+LOCKFILE = "_genesets.lock"
+ARRAYS = ("members", "gene_indptr", "gene_members")
+
+_cache = {}
+
+
+def _directory(workspace):
+    return os.path.join(workspace, "set")
+
+
+def _array_file(workspace, name, generation):
+    # catalogs written before arrays had generations have none
+    prefix = "_genesets" if generation is None else f"_genesets.{generation}"
+    return os.path.join(_directory(workspace), f"{prefix}.{name}.npy")
+
+
+def _lock(workspace):
+    return fsutils.directory_lock(os.path.join(_directory(workspace), LOCKFILE))
+
+
+def _var_names(workspace):
+    return pd.Index(column_store.read_column(os.path.join(workspace, "var"), "name_0"))
+
+
+def _legacy_group_name(dirname):
+    group = "" if dirname == "__blank__" else dirname
+    return group.replace("__DEG__", "//;;//") if group.endswith("__DEG__") else group
+
+
+def _migrate_legacy_sets(workspace):
+    directory = _directory(workspace)
+    os.makedirs(directory, exist_ok=True)
+    with _lock(workspace):
+        if os.path.exists(os.path.join(directory, CATALOG)):
+            return
+        var_names = _var_names(workspace)
+        entries = {}
+        legacy = [d for d in glob(os.path.join(directory, "*")) if os.path.isdir(d)]
+        for d in legacy:
+            group = _legacy_group_name(os.path.basename(d))
+            entries[group] = {}
+            for fn in glob(os.path.join(d, "*.p")):
+                entries[group][os.path.basename(fn)[:-2]] = _resolve(var_names, artifact_cache.load(fn))
+        _write(workspace, _build(entries, var_names.size))
+        for d in legacy:
+            shutil.rmtree(d)
+
+
+def _resolve(var_names, genes):
+    """return the var indices of `genes` and the list of genes which are not var names"""
+    genes = np.asarray(list(genes), dtype="object").astype("str")
+    idx = var_names.get_indexer(genes) if genes.size > 0 else np.zeros(0, dtype="int64")
+    return idx[idx >= 0].astype("int32"), list(genes[idx < 0])
+
+
+def _build(entries, n_var):
+    """encode {group: {name: (var indices, unresolved)}} into the catalog and arrays"""
+    sets = []
+    members = []
+    offset = 0
+    for group in entries:
+        for name, (idx, unresolved) in entries[group].items():
+            members.append(np.asarray(idx, dtype="int32"))
+            sets.append({"group": group, "name": name, "offset": offset, "length": len(idx), "unresolved": unresolved})
+            offset += len(idx)
+
+    members = np.concatenate(members) if members else np.zeros(0, dtype="int32")
+    gene_members = np.argsort(members, kind="stable").astype("int64")
+    gene_indptr = np.zeros(n_var + 1, dtype="int64")
+    np.cumsum(np.bincount(members, minlength=n_var), out=gene_indptr[1:])
+    catalog = {"sets": sets, "n_var": int(n_var)}
+    return catalog, {"members": members, "gene_indptr": gene_indptr, "gene_members": gene_members}
+
+
+def _entries(state):
+    """decode the stored sets into {group: {name: (var indices, unresolved)}}"""
+    catalog, arrays = state
+    entries = {}
+    members = np.asarray(arrays["members"])
+    for s in catalog["sets"]:
+        idx = members[s["offset"] : s["offset"] + s["length"]]
+        entries.setdefault(s["group"], {})[s["name"]] = (idx, s["unresolved"])
+    return entries
+
+
+def _write(workspace, state):
+    catalog, arrays = state
+    fn = os.path.join(_directory(workspace), CATALOG)
+    try:
+        with open(fn) as f:
+            previous = json.load(f).get("generation")
+    except FileNotFoundError:
+        previous = None
+    generation = time.time_ns()
+    for name in ARRAYS:
+        fsutils.atomic_save(_array_file(workspace, name, generation), arrays[name])
+    fsutils.atomic_write_json(fn, {**catalog, "generation": generation})
+    _cache.pop(fn, None)
+
+    kept = {_array_file(workspace, name, g) for name in ARRAYS for g in (generation, previous)}
+    for stale in glob(os.path.join(_directory(workspace), "_genesets.*.npy")):
+        if stale not in kept:
+            os.remove(stale)
+
+
+def _load(workspace):
+    fn = os.path.join(_directory(workspace), CATALOG)
+    try:
+        key = fsutils.stat_key(fn)
+    except FileNotFoundError:
+        _migrate_legacy_sets(workspace)
+        key = fsutils.stat_key(fn)
+
+    while True:
+        cached = _cache.get(fn)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        with open(fn) as f:
+            catalog = json.load(f)
+        generation = catalog.get("generation")
+        try:
+            arrays = {name: np.load(_array_file(workspace, name, generation), mmap_mode="r") for name in ARRAYS}
+        except FileNotFoundError:
+            # superseded by two updates since the catalog was read
+            previous, key = key, fsutils.stat_key(fn)
+            if key == previous:
+                raise
+            continue
+        _cache[fn] = (key, (catalog, arrays))
+        return catalog, arrays
+
+
+def _decode(state, var_names):
+    entries = _entries(state)
+    return {
+        group: {name: list(var_names[idx]) + unresolved for name, (idx, unresolved) in sets.items()}
+        for group, sets in entries.items()
+    }
+
+
+def read_genesets(workspace):
+    """return all gene sets, as {group: {name: [var names]}}"""
+    return _decode(_load(workspace), _var_names(workspace))
+
+
+def has_group(workspace, group):
+    return any(s["group"] == group for s in _load(workspace)[0]["sets"])
+
+
+def read_group(workspace, group):
+    """return the gene sets of a group as {name: [var names]}"""
+    return read_genesets(workspace).get(group, {})
+
+
+def read_group_indices(workspace, group):
+    """return the gene sets of a group as {name: var indices}, ignoring unresolved members"""
+    catalog, arrays = _load(workspace)
+    return {
+        s["name"]: np.asarray(arrays["members"][s["offset"] : s["offset"] + s["length"]])
+        for s in catalog["sets"]
+        if s["group"] == group
+    }
+
+
+def sets_containing(workspace, var_index):
+    """return [(group, name, position)] for every set containing the var with index `var_index`"""
+    catalog, arrays = _load(workspace)
+    sets = catalog["sets"]
+    offsets = np.array([s["offset"] for s in sets], dtype="int64")
+    positions = arrays["gene_members"][arrays["gene_indptr"][var_index] : arrays["gene_indptr"][var_index + 1]]
+    result = []
+    # empty sets share their offset with the next set, so take the last set starting at or before p
+    for p, i in zip(positions, np.searchsorted(offsets, positions, side="right") - 1):
+        result.append((sets[i]["group"], sets[i]["name"], int(p - offsets[i])))
+    return result
+
+
+def first_set_per_var(workspace, group, unassigned="unassigned"):
+    """
+    Assign every var to the set of `group` in which it appears earliest (ties go to the
+    set listed first) and return the set names as an array, with `unassigned` for vars
+    which are in no set of the group.
+    """
+    catalog, arrays = _load(workspace)
+    sets = [s for s in catalog["sets"] if s["group"] == group]
+    labels = np.array([s["name"] for s in sets] + [unassigned], dtype="object")
+    assignment = np.full(catalog["n_var"], len(sets), dtype="int64")
+    if not sets:
+        return labels[assignment]
+
+    lengths = np.array([s["length"] for s in sets], dtype="int64")
+    starts = np.array([s["offset"] for s in sets], dtype="int64")
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    genes = np.asarray(arrays["members"][offsets]).astype("int64")
+    set_ids = np.repeat(np.arange(len(sets)), lengths)
+    positions = offsets - np.repeat(starts, lengths)
+
+    order = np.lexsort((set_ids, positions, genes))
+    genes, set_ids = genes[order], set_ids[order]
+    first = np.ones(genes.size, dtype=bool)
+    first[1:] = genes[1:] != genes[:-1]
+    assignment[genes[first]] = set_ids[first]
+    return labels[assignment]
+
+
+def _update(workspace, fn):
+    """apply `fn` to the stored {group: {name: (var indices, unresolved)}} and write the result back"""
+    _load(workspace)
+    with _lock(workspace):
+        state = _load(workspace)
+        entries = _entries(state)
+        fn(entries)
+        _write(workspace, _build(entries, state[0]["n_var"]))
+
+
+def put_genesets(workspace, genesets):
+    """add or replace the given gene sets, {group: {name: [var names]}}"""
+    var_names = _var_names(workspace)
+    resolved = {
+        group: {name: _resolve(var_names, genes) for name, genes in sets.items()} for group, sets in genesets.items()
+    }
+
+    def update(current):
+        for group in resolved:
+            current.setdefault(group, {}).update(resolved[group])
+
+    _update(workspace, update)
+
+
+def replace_group(workspace, group, genesets):
+    """replace all sets of `group` with `genesets`, {name: [var names]}"""
+    var_names = _var_names(workspace)
+    resolved = {name: _resolve(var_names, genes) for name, genes in genesets.items()}
+
+    def update(current):
+        current[group] = resolved
+
+    _update(workspace, update)
+
+
+def move_members(workspace, group, var_indices, names, unassigned="unassigned"):
+    """
+    Move the vars `var_indices` of `group` to the sets `names` (one per var), removing
+    them from the sets they were in; vars moved to `unassigned` are left out of every
+    set, and sets left empty are deleted.  This is how an edit to an annotation is
+    applied to the sets derived from it, without rebuilding the group.
+    """
+    var_indices = np.asarray(var_indices, dtype="int32")
+    names = np.asarray(names)
+
+    def update(current):
+        sets = current.setdefault(group, {})
+        for name, (idx, unresolved) in list(sets.items()):
+            sets[name] = (idx[~np.isin(idx, var_indices)], unresolved)
+        for name in np.unique(names):
+            if name != unassigned:
+                idx, unresolved = sets.get(name, (np.zeros(0, dtype="int32"), []))
+                sets[name] = (np.append(idx, var_indices[names == name]), unresolved)
+        for name in [name for name, (idx, unresolved) in sets.items() if len(idx) + len(unresolved) == 0]:
+            del sets[name]
+
+    _update(workspace, update)
+
+
+def delete_group(workspace, group):
+    _update(workspace, lambda current: current.pop(group, None))
+
+
+def rename_group(workspace, old_group, new_group):
+    def update(current):
+        if old_group in current:
+            current[new_group] = current.pop(old_group)
+
+    _update(workspace, update)
+
+
+def delete_geneset(workspace, group, name):
+    _update(workspace, lambda current: current.get(group, {}).pop(name, None))
+
+
+def rename_geneset(workspace, group, name, new_group, new_name):
+    def update(current):
+        if name in current.get(group, {}):
+            current.setdefault(new_group, {})[new_name] = current[group].pop(name)
+
+    _update(workspace, update)
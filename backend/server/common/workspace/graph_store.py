@@ -0,0 +1,161 @@
+"""
+On-disk storage for per-user nearest-neighbor graphs.
+
+Graphs live in `{userID}/nnm` as the three CSR components of the (square) adjacency
+matrix, saved one after the other as `.npy` records of a single file, `{name}.graph`, so
+they can be memory-mapped:
+
+    indptr   int64
+    indices  int32
+    data     float32
+
+The file is replaced atomically on every write, so a reader never mixes the components of
+two writes.
+
+`read_subgraph` returns the subgraph induced by a subset of the nodes while only touching
+the rows of the selected nodes, so clustering or sankey on a small selection no longer
+loads (and twice copies) the full N x N matrix.
+
+Graphs written by older versions (`{name}.p` pickles, or one `{name}.{component}.npy`
+file per component) are converted the first time they are read.
+"""
+
+import os
+import pickle
+
+import numpy as np
+import scipy.sparse as sparse
+
+import backend.server.common.workspace.fsutils as fsutils
+import backend.server.common.workspace.manifest as manifest
+
+EXT = ".graph"
+LEGACY_EXT = ".p"
+COMPONENTS = ("indptr", "indices", "data")
+
+
+def _graph_file(directory, name):
+    return os.path.join(directory, f"{name}{EXT}")
+
+
+def _component_files(directory, name):
+    return {c: os.path.join(directory, f"{name}.{c}.npy") for c in COMPONENTS}
+
+
+def _legacy_file(directory, name):
+    return os.path.join(directory, f"{name}{LEGACY_EXT}")
+
+
+def _workspace(directory):
+    return os.path.dirname(os.path.normpath(directory))
+
+
+def graph_files(directory, name):
+    """every file a graph may be stored in, in the current or an older layout"""
+    files = [_graph_file(directory, name), _legacy_file(directory, name)]
+    return files + list(_component_files(directory, name).values())
+
+
+def _migrate_legacy_graph(directory, name):
+    legacy = _legacy_file(directory, name)
+    files = _component_files(directory, name)
+    if os.path.exists(legacy):
+        with open(legacy, "rb") as f:
+            graph = pickle.load(f)
+        write_graph(directory, name, graph)
+        os.remove(legacy)
+        return True
+    if os.path.exists(files["indptr"]):
+        indptr, indices, data = (np.load(files[c]) for c in COMPONENTS)
+        n = indptr.size - 1
+        write_graph(directory, name, sparse.csr_matrix((data, indices, indptr), shape=(n, n)))
+        for fn in files.values():
+            if os.path.exists(fn):
+                os.remove(fn)
+        return True
+    return False
+
+
+def _load_components(directory, name):
+    fn = _graph_file(directory, name)
+    if not os.path.exists(fn) and not _migrate_legacy_graph(directory, name):
+        raise KeyError(f"Graph {name} does not exist.")
+    return tuple(fsutils.load_arrays(fn))
+
+
+def has_graph(directory, name):
+    return manifest.exists(_workspace(directory), "nnm", name)
+
+
+def write_graph(directory, name, graph):
+    """store a square sparse adjacency matrix"""
+    graph = sparse.csr_matrix(graph)
+    components = {
+        "indptr": graph.indptr.astype("int64"),
+        "indices": graph.indices.astype("int32"),
+        "data": graph.data.astype("float32"),
+    }
+    fsutils.atomic_save_arrays(_graph_file(directory, name), [components[c] for c in COMPONENTS])
+    manifest.record(_workspace(directory), "nnm", name, components["data"].dtype, graph.shape)
+
+
+def read_graph(directory, name):
+    """return the full graph as a CSR matrix backed by memory-mapped components"""
+    indptr, indices, data = _load_components(directory, name)
+    n = indptr.size - 1
+    return sparse.csr_matrix((data, indices, indptr), shape=(n, n), copy=False)
+
+
+def read_subgraph(directory, name, selection):
+    """
+    Return the subgraph induced by `selection` (a boolean mask or an array of distinct node
+    indices), equivalent to `graph[selection][:, selection]`.  Only the rows of the
+    selected nodes are read.
+    """
+    indptr, indices, data = _load_components(directory, name)
+    n = indptr.size - 1
+
+    selection = np.asarray(selection)
+    rows = np.flatnonzero(selection) if selection.dtype == bool else selection.astype("int64")
+    if selection.dtype != bool and np.unique(rows).size != rows.size:
+        raise ValueError("The selection of a subgraph must not repeat nodes.")
+    if rows.size == n and np.all(rows == np.arange(n)):
+        return sparse.csr_matrix((np.array(data), np.array(indices), np.array(indptr)), shape=(n, n))
+
+    starts = np.asarray(indptr[rows])
+    lengths = np.asarray(indptr[rows + 1]) - starts
+
+    # positions of the selected rows' entries in indices/data
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    cols = indices[offsets]
+
+    remap = np.full(n, -1, dtype="int64")
+    remap[rows] = np.arange(rows.size)
+    cols = remap[cols]
+    keep = cols >= 0
+
+    row_ids = np.repeat(np.arange(rows.size), lengths)[keep]
+    sub_indptr = np.zeros(rows.size + 1, dtype="int64")
+    np.cumsum(np.bincount(row_ids, minlength=rows.size), out=sub_indptr[1:])
+
+    sub = sparse.csr_matrix(
+        (np.asarray(data[offsets[keep]]), cols[keep].astype("int32"), sub_indptr), shape=(rows.size, rows.size)
+    )
+    sub.sort_indices()
+    return sub
+
+
+def delete_graph(directory, name):
+    for fn in graph_files(directory, name):
+        if os.path.exists(fn):
+            os.remove(fn)
+    manifest.forget(_workspace(directory), "nnm", name)
+
+
+def rename_graph(directory, old_name, new_name):
+    if not has_graph(directory, old_name):
+        return
+    if not os.path.exists(_graph_file(directory, old_name)):
+        _migrate_legacy_graph(directory, old_name)
+    os.replace(_graph_file(directory, old_name), _graph_file(directory, new_name))
+    manifest.rename(_workspace(directory), "nnm", old_name, new_name)
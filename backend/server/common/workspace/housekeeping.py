@@ -0,0 +1,306 @@
+"""
+Garbage collection and disk quotas for user workspaces.
+
+`collect_garbage` reclaims what no live layout (an embedding in the workspace manifest)
+refers to any more:
+
+    graphs (nnm) and parameters (params) of deleted layouts, except the latest
+    preprocessing parameters (`params/latest`)
+    latent spaces (pca) and var columns suffixed `;;{layout}` of deleted layouts
+    files in the artifact directories which are not indexed by the manifest
+    differential expression results (diff) whose gene set group was deleted
+    leftover exports (output) and temporary files of interrupted writes
+
+and compacts the annotation delta logs (see `column_store`).
+
+Only artifacts untouched for `GRACE_SECONDS` are collected, so the pieces of a layout
+which is still being written (its graph is stored before its embedding) are never
+mistaken for orphans.
+
+`enforce_quota` bounds the disk usage of a user (both modes of `{idhash}`).  Files are
+charged to a workspace in proportion to the number of workspaces they are hard-linked
+into (see `clone`), so a fresh clone of the guest workspace costs nothing.  When a user is
+over quota, the least recently used kNN graphs and latent spaces of deleted layouts are
+evicted without waiting for the grace period (only `EVICTION_GRACE_SECONDS`, which covers
+a layout being written).  The artifacts of live layouts are never evicted: a user whose
+live layouts alone exceed the quota stays over it until they delete some.  Files shared
+with other workspaces are kept too, as evicting them would free next to nothing.  Recency
+is the later of a file's access and modification times.
+
+Usage is kept as a running total per directory, which is only rescanned when its
+modification time changes (a file was added, removed or replaced), so checking the quota
+does not stat every file of the workspace.  Files appended to in place, like delta logs,
+are recounted the next time their directory changes.
+
+`maintain_async` runs both in a background thread, at most once every
+`MAINTENANCE_INTERVAL` seconds per user.  The quota is set from the
+`server.limits.workspace_quota_bytes` config (None disables it).
+"""
+
+import os
+import shutil
+import threading
+import time
+import traceback
+
+import backend.server.common.workspace.column_store as column_store
+import backend.server.common.workspace.embedding_store as embedding_store
+import backend.server.common.workspace.gene_set_store as gene_set_store
+import backend.server.common.workspace.graph_store as graph_store
+import backend.server.common.workspace.manifest as manifest
+
+GRACE_SECONDS = 3600
+EVICTION_GRACE_SECONDS = 300
+MAINTENANCE_INTERVAL = 60
+MODES = ("OBS", "VAR")
+TRANSIENT_SUFFIXES = (".tmp",)
+DEG_SUFFIX = "//;;//"
+# parameters which are not those of a layout
+KEPT_PARAMS = ("latest",)
+
+_quota_bytes = None
+_lock = threading.Lock()
+_last_maintained = {}
+_running = set()
+# directory -> (modification time, bytes charged for its files, subdirectories)
+_usage = {}
+
+
+def set_quota_bytes(quota_bytes):
+    global _quota_bytes
+    _quota_bytes = quota_bytes
+
+
+def _artifact_files(workspace, kind, name):
+    directory = os.path.join(workspace, kind)
+    if kind == "emb":
+        return [embedding_store.embedding_path(directory, name), os.path.join(directory, f"{name}.p")]
+    if kind == "nnm":
+        return graph_store.graph_files(directory, name)
+    return [manifest.artifact_path(workspace, kind, name)]
+
+
+def _stat(fn):
+    try:
+        return os.stat(fn)
+    except FileNotFoundError:
+        return None
+
+
+def _last_modified(files):
+    stats = [st for st in map(_stat, files) if st is not None]
+    return max((st.st_mtime for st in stats), default=0)
+
+
+def _last_used(files):
+    stats = [st for st in map(_stat, files) if st is not None]
+    return max((max(st.st_atime, st.st_mtime) for st in stats), default=0)
+
+
+def _charged_size(st):
+    return st.st_size / max(st.st_nlink, 1)
+
+
+def _remove(fn):
+    st = _stat(fn)
+    if st is None:
+        return 0
+    if os.path.isdir(fn):
+        size = sum(_charged_size(s) for s in map(_stat, _walk_files(fn)) if s is not None)
+        shutil.rmtree(fn, ignore_errors=True)
+        return size
+    os.remove(fn)
+    return _charged_size(st)
+
+
+def _walk_files(directory):
+    for root, _, files in os.walk(directory):
+        for f in files:
+            yield os.path.join(root, f)
+
+
+def _delete_artifact(workspace, kind, name):
+    files = _artifact_files(workspace, kind, name)
+    size = sum(_charged_size(st) for st in map(_stat, files) if st is not None)
+    if kind == "nnm":
+        graph_store.delete_graph(os.path.join(workspace, kind), name)
+    elif kind == "emb":
+        embedding_store.delete_embedding(os.path.join(workspace, kind), name)
+    else:
+        manifest.delete_artifact(workspace, kind, name)
+    return size
+
+
+def _layout_of(name):
+    return name.split(";;", 1)[1] if ";;" in name else None
+
+
+def collect_garbage(workspace, grace_seconds=GRACE_SECONDS):
+    """reclaim artifacts of `workspace` which no live layout refers to; returns the bytes freed"""
+    if not os.path.isdir(workspace):
+        return 0
+    cutoff = time.time() - grace_seconds
+    live = set(manifest.list_artifacts(workspace, "emb"))
+    freed = 0
+
+    def stale(files):
+        return _last_modified(files) < cutoff
+
+    # graphs and parameters of deleted layouts
+    for kind in ("nnm", "params"):
+        for name in manifest.list_artifacts(workspace, kind):
+            if kind == "params" and name in KEPT_PARAMS:
+                continue
+            if name not in live and stale(_artifact_files(workspace, kind, name)):
+                freed += _delete_artifact(workspace, kind, name)
+
+    # latent spaces and var columns of deleted derived layouts
+    for name in manifest.list_artifacts(workspace, "pca"):
+        layout = _layout_of(name)
+        if layout is not None and layout not in live and stale(_artifact_files(workspace, "pca", name)):
+            freed += _delete_artifact(workspace, "pca", name)
+
+    for annotations in ("obs", "var"):
+        if os.path.isdir(os.path.join(workspace, annotations)):
+            column_store.compact_all(os.path.join(workspace, annotations))
+
+    var = os.path.join(workspace, "var")
+    if os.path.isdir(var):
+        for name in column_store.list_columns(var):
+            layout = _layout_of(name)
+            if layout is not None and layout not in live and stale(column_store.column_files(var, name)):
+                column_store.delete_column(var, name)
+
+    # files not indexed by the manifest
+    for kind in manifest.KINDS:
+        directory = os.path.join(workspace, kind)
+        if not os.path.isdir(directory):
+            continue
+        indexed = set()
+        for name in manifest.list_artifacts(workspace, kind):
+            indexed.update(_artifact_files(workspace, kind, name))
+        for fn in _walk_files(directory):
+            if fn not in indexed and not fn.endswith(".lock") and stale([fn]):
+                freed += _remove(fn)
+
+    # differential expression results whose gene set group was deleted
+    diff = os.path.join(workspace, "diff")
+    if os.path.isdir(diff):
+        groups = gene_set_store.read_genesets(workspace).keys()
+        deg = {g[: -len(DEG_SUFFIX)].replace("/", "_") for g in groups if g.endswith(DEG_SUFFIX)}
+        for entry in os.listdir(diff):
+            path = os.path.join(diff, entry)
+            if entry not in deg and stale([path] + list(_walk_files(path))):
+                freed += _remove(path)
+
+    # exports and interrupted writes
+    for fn in _walk_files(workspace):
+        transient = fn.endswith(TRANSIENT_SUFFIXES) or os.path.basename(os.path.dirname(fn)) == "output"
+        if transient and stale([fn]):
+            freed += _remove(fn)
+
+    return freed
+
+
+def _forget_usage(directory):
+    prefix = directory + os.sep
+    for d in [d for d in _usage if d == directory or d.startswith(prefix)]:
+        _usage.pop(d, None)
+
+
+def _directory_usage(directory):
+    st = _stat(directory)
+    if st is None:
+        _forget_usage(directory)
+        return 0
+    cached = _usage.get(directory)
+    if cached is None or cached[0] != st.st_mtime_ns:
+        size, subdirectories = 0, []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                    continue
+                try:
+                    size += _charged_size(entry.stat(follow_symlinks=False))
+                except FileNotFoundError:
+                    pass
+        if cached is not None:
+            for d in set(cached[2]) - set(subdirectories):
+                _forget_usage(d)
+        cached = _usage[directory] = (st.st_mtime_ns, size, subdirectories)
+    return cached[1] + sum(_directory_usage(d) for d in cached[2])
+
+
+def disk_usage(idhash):
+    """bytes charged to the user `idhash`, across both modes"""
+    return _directory_usage(os.path.normpath(idhash))
+
+
+def _shared(files):
+    return any(st.st_nlink > 1 for st in map(_stat, files) if st is not None)
+
+
+def _evictable(idhash):
+    """
+    kNN graphs and latent spaces of deleted layouts, as (last used, workspace, kind, name),
+    least recently used first
+    """
+    cutoff = time.time() - EVICTION_GRACE_SECONDS
+    candidates = []
+    for mode in MODES:
+        workspace = os.path.join(idhash, mode)
+        if not os.path.isdir(workspace):
+            continue
+        live = set(manifest.list_artifacts(workspace, "emb"))
+        for kind in ("nnm", "pca"):
+            for name in manifest.list_artifacts(workspace, kind):
+                layout = name if kind == "nnm" else _layout_of(name)
+                if layout is None or layout in live:
+                    continue
+                files = _artifact_files(workspace, kind, name)
+                if _last_modified(files) < cutoff and not _shared(files):
+                    candidates.append((_last_used(files), workspace, kind, name))
+    candidates.sort(key=lambda c: c[0])
+    return candidates
+
+
+def enforce_quota(idhash, quota_bytes=None):
+    """evict artifacts of deleted layouts until `idhash` is within its quota; returns the bytes freed"""
+    quota_bytes = _quota_bytes if quota_bytes is None else quota_bytes
+    if quota_bytes is None:
+        return 0
+    usage = disk_usage(idhash)
+    freed = 0
+    for _, workspace, kind, name in _evictable(idhash):
+        if usage - freed <= quota_bytes:
+            break
+        freed += _delete_artifact(workspace, kind, name)
+    return freed
+
+
+def maintain(idhash):
+    """collect garbage in both modes of `idhash`, then enforce its quota"""
+    freed = sum(collect_garbage(os.path.join(idhash, mode)) for mode in MODES)
+    return freed + enforce_quota(idhash)
+
+
+def maintain_async(idhash):
+    """run `maintain` in the background, unless it ran for `idhash` recently or is running"""
+    with _lock:
+        now = time.time()
+        if idhash in _running or now - _last_maintained.get(idhash, 0) < MAINTENANCE_INTERVAL:
+            return
+        _running.add(idhash)
+        _last_maintained[idhash] = now
+
+    def run():
+        try:
+            maintain(idhash)
+        except Exception as e:
+            traceback.print_exception(type(e), e, e.__traceback__)
+        finally:
+            with _lock:
+                _running.discard(idhash)
+
+    threading.Thread(target=run, daemon=True).start()
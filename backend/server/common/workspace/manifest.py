@@ -0,0 +1,179 @@
+"""
+Per-workspace index of derived artifacts.
+
+Every user workspace (`{idhash}/{MODE}`) keeps a `_manifest.json` describing the
+artifacts stored under it, so that listing embeddings, latent spaces, graphs or
+parameters (and building the schema) is an in-memory lookup instead of a directory glob,
+which is slow on network file systems.  Each entry records:
+
+    kind     the artifact subdirectory: emb, nnm, pca or params
+    name     the artifact name (eg, `parent;;child` for a subset embedding)
+    layout   the layout the artifact belongs to (eg, `child` for `pca;;child`)
+    parent   the parent layout of a subset embedding, or None
+    dtype    dtype of the stored array, when known
+    shape    shape of the stored array, when known
+    version  incremented on every write
+
+The stores update the manifest on every write, rename and delete; workspaces created
+before the manifest existed are indexed by scanning their directories once.
+obs/var annotations are indexed separately by `column_store`.
+"""
+
+import json
+import os
+from glob import glob
+
+import backend.server.common.workspace.artifact_cache as artifact_cache
+import backend.server.common.workspace.fsutils as fsutils
+
+MANIFEST = "_manifest.json"
+LOCKFILE = "_manifest.lock"
+KINDS = ("emb", "nnm", "pca", "params")
+
+_manifest_cache = {}
+
+
+def _lock(workspace):
+    return fsutils.directory_lock(os.path.join(workspace, LOCKFILE))
+
+
+def _key(kind, name):
+    return f"{kind}/{name}"
+
+
+def _entry(kind, name, dtype=None, shape=None, version=0):
+    if kind == "pca" and ";;" in name:
+        layout = name.split(";;", 1)[1]
+    elif kind == "pca":
+        layout = None
+    else:
+        layout = name
+    parent = layout.rsplit(";;", 1)[0] if layout is not None and ";;" in layout else None
+    return {
+        "kind": kind,
+        "name": name,
+        "layout": layout,
+        "parent": parent,
+        "dtype": None if dtype is None else str(dtype),
+        "shape": None if shape is None else [int(i) for i in shape],
+        "version": version,
+    }
+
+
+def _scan(workspace):
+    """index a workspace written before the manifest existed"""
+    artifacts = {}
+    suffixes = {"emb": (".npy", ".p"), "nnm": (".graph", ".indptr.npy", ".p"), "pca": (".p",), "params": (".p",)}
+    for kind in KINDS:
+        for suffix in suffixes[kind]:
+            for fn in glob(os.path.join(workspace, kind, f"*{suffix}")):
+                name = os.path.basename(fn)[: -len(suffix)]
+                artifacts.setdefault(_key(kind, name), _entry(kind, name))
+    return {"artifacts": artifacts}
+
+
+def _write_manifest(workspace, manifest):
+    fn = os.path.join(workspace, MANIFEST)
+    fsutils.atomic_write_json(fn, manifest)
+    _manifest_cache[fn] = (fsutils.stat_key(fn), manifest)
+
+
+def _read_manifest(workspace):
+    fn = os.path.join(workspace, MANIFEST)
+    try:
+        key = fsutils.stat_key(fn)
+    except FileNotFoundError:
+        os.makedirs(workspace, exist_ok=True)
+        with _lock(workspace):
+            if not os.path.exists(fn):
+                _write_manifest(workspace, _scan(workspace))
+        key = fsutils.stat_key(fn)
+
+    cached = _manifest_cache.get(fn)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    with open(fn) as f:
+        manifest = json.load(f)
+    _manifest_cache[fn] = (key, manifest)
+    return manifest
+
+
+def _update(workspace, fn):
+    """apply `fn` to a copy of the manifest and write it back, under the workspace lock"""
+    _read_manifest(workspace)
+    with _lock(workspace):
+        manifest = _read_manifest(workspace)
+        manifest = {**manifest, "artifacts": dict(manifest["artifacts"])}
+        if fn(manifest["artifacts"]) is not False:
+            _write_manifest(workspace, manifest)
+
+
+def record(workspace, kind, name, dtype=None, shape=None):
+    """record that an artifact was (re)written"""
+
+    def update(artifacts):
+        previous = artifacts.get(_key(kind, name))
+        version = previous["version"] + 1 if previous is not None else 1
+        artifacts[_key(kind, name)] = _entry(kind, name, dtype, shape, version)
+
+    _update(workspace, update)
+
+
+def forget(workspace, kind, name):
+    """record that an artifact was deleted"""
+
+    def update(artifacts):
+        return artifacts.pop(_key(kind, name), None) is not None
+
+    _update(workspace, update)
+
+
+def rename(workspace, kind, old_name, new_name):
+    def update(artifacts):
+        entry = artifacts.pop(_key(kind, old_name), None)
+        if entry is None:
+            return False
+        artifacts[_key(kind, new_name)] = _entry(
+            kind, new_name, entry["dtype"], entry["shape"], entry["version"] + 1
+        )
+
+    _update(workspace, update)
+
+
+def get(workspace, kind, name):
+    """return the manifest entry of an artifact, or None if it does not exist"""
+    return _read_manifest(workspace)["artifacts"].get(_key(kind, name))
+
+
+def exists(workspace, kind, name):
+    return get(workspace, kind, name) is not None
+
+
+def list_artifacts(workspace, kind):
+    """return the names of all artifacts of the given kind"""
+    return [e["name"] for e in _read_manifest(workspace)["artifacts"].values() if e["kind"] == kind]
+
+
+def artifact_path(workspace, kind, name):
+    return os.path.join(workspace, kind, f"{name}.p")
+
+
+def dump_artifact(workspace, kind, name, obj):
+    """pickle an artifact (eg, latent spaces or parameters) into the workspace and index it"""
+    artifact_cache.dump(obj, artifact_path(workspace, kind, name))
+    record(workspace, kind, name, getattr(obj, "dtype", None), getattr(obj, "shape", None))
+
+
+def delete_artifact(workspace, kind, name):
+    fn = artifact_path(workspace, kind, name)
+    if os.path.exists(fn):
+        os.remove(fn)
+    forget(workspace, kind, name)
+
+
+def rename_artifact(workspace, kind, old_name, new_name):
+    fn = artifact_path(workspace, kind, old_name)
+    if os.path.exists(fn):
+        os.replace(fn, artifact_path(workspace, kind, new_name))
+    rename(workspace, kind, old_name, new_name)
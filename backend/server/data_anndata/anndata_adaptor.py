@@ -2,20 +2,35 @@ import base64
 import gc
 import json
 import os
-import pickle
 import signal
 import threading
 import time
 import traceback
+import uuid
 import warnings
+import weakref
 from functools import partial, wraps
 from glob import glob
 from hashlib import blake2b
-from os.path import exists
 
 import anndata
 import backend.common.compute.diffexp_generic as diffexp_generic
 import backend.server.common.rest as common_rest
+import backend.server.common.workspace.artifact_cache as artifact_cache
+import backend.server.common.workspace.column_store as column_store
+import backend.server.common.workspace.diffexp_store as diffexp_store
+import backend.server.common.workspace.embedding_store as embedding_store
+import backend.server.common.workspace.graph_store as graph_store
+import backend.server.common.workspace.housekeeping as housekeeping
+import backend.server.common.workspace.manifest as manifest
+import backend.server.data_anndata.backed_layers as backed_layers
+import backend.server.data_anndata.dataset_directory as dataset_directory
+import backend.server.data_anndata.job_scheduler as job_scheduler
+import backend.server.data_anndata.shared_arrays as shared_arrays
+import backend.server.data_anndata.sidecar_cache as sidecar_cache
+import backend.server.data_anndata.streaming_loader as streaming_loader
+import backend.server.data_anndata.virtual_layers as virtual_layers
+import backend.server.data_anndata.worker_pool as worker_pool
 import igraph as ig
 import leidenalg
 import numpy as np
@@ -35,6 +50,7 @@ from backend.common.utils.utils import jsonify_numpy
 from backend.server.common.corpora import corpora_get_props_from_anndata
 from backend.server.data_common.data_adaptor import DataAdaptor
 from flask import current_app, jsonify, session
+import numba
 from numba import njit, prange
 from numba.core import types
 from numba.typed import Dict
@@ -53,6 +69,15 @@ HOSTED_MODE = True
 global process_count
 process_count = 0
 
+# priority class of the jobs of every socket (see `job_scheduler`)
+JOB_CLASSES = {
+    "diffexp": "interactive",
+    "sankey": "interactive",
+    "leiden": "interactive",
+    "reembedding": "batch",
+    "downloadAnndata": "batch",
+}
+
 anndata_version = version.parse(str(anndata.__version__)).release
 
 
@@ -181,49 +206,110 @@ def anndata_version_is_pre_070():
     return major == 0 and minor < 7
 
 
-def _callback_fn(res, ws, cfn, data, post_processing, tstart, pid):
+def _callback_fn(res, ws, cfn, data, post_processing, tstart, pid, idhash, job_id):
     if post_processing is not None:
         res = post_processing(res)
     d = {"response": res, "cfn": cfn, "fail": False}
     d.update(data)
+    d["jobId"] = job_id
     try:
-        ws.send(jsonify_numpy(d))
+        _send(ws, jsonify_numpy(d))
     except Exception as e:
         traceback.print_exception(type(e), e, e.__traceback__)
 
     print("Process count:", pid, "Time elsapsed:", time.time() - tstart, "seconds")
+    housekeeping.maintain_async(idhash)
+
+
+def _user_idhash(da):
+    return da.dataset_config.user_annotations._get_userdata_idhash(da).split("/")[0].split("\\")[0]
+
+
+def _job_user(da, ws):
+    """the user the jobs of the socket `ws` are scheduled for (see `job_scheduler`)"""
+    idhash = _user_idhash(da)
+    if "excxg_profile" in session:
+        return idhash
+    # the idhash of guests only names the dataset, so every guest is a user of their own
+    return f"{idhash}/{id(ws)}"
 
 
 def _multiprocessing_wrapper(da, ws, fn, cfn, data, post_processing, *args):
     shm, shm_csc = da.shm_layers_csr, da.shm_layers_csc
     global process_count
     process_count = process_count + 1
+    idhash = _user_idhash(da)
+    # the client learns the id of the job first, and may cancel it with {"cancel": id}
+    job_id = uuid.uuid4().hex
+    _send_status(ws, cfn, job_id, "queued")
     _new_callback_fn = partial(
-        _callback_fn, ws=ws, cfn=cfn, data=data, post_processing=post_processing, tstart=time.time(), pid=process_count
+        _callback_fn,
+        ws=ws,
+        cfn=cfn,
+        data=data,
+        post_processing=post_processing,
+        tstart=time.time(),
+        pid=process_count,
+        idhash=idhash,
+        job_id=job_id,
+    )
+    _new_error_fn = partial(_error_callback, ws=ws, cfn=cfn, job_id=job_id)
+    _new_cancel_fn = partial(_send_status, ws, cfn, job_id, "cancelled")
+    _new_progress_fn = partial(_progress_callback, ws=ws, cfn=cfn, job_id=job_id)
+
+    job_class = JOB_CLASSES.get(cfn, "interactive")
+    worker_pool.submit(
+        fn,
+        args,
+        shm,
+        shm_csc,
+        _new_callback_fn,
+        _new_error_fn,
+        on_cancel=_new_cancel_fn,
+        on_progress=_new_progress_fn,
+        job_class=job_class,
+        user=_job_user(da, ws),
+        job_id=job_id,
     )
-    _new_error_fn = partial(_error_callback, ws=ws, cfn=cfn)
-    args += (shm, shm_csc)
 
-    if HOSTED_MODE:
-        import ray
 
-        def _ray_getter(i):
-            try:
-                _new_callback_fn(ray.get(i))
-            except Exception as e:
-                _new_error_fn(e)
+# socket -> lock serializing its sends, which come from the dispatcher threads (results,
+# errors, cancellations) and from the progress thread
+_socket_locks = weakref.WeakKeyDictionary()
+_socket_locks_lock = threading.Lock()
 
-        thread = threading.Thread(target=_ray_getter, args=(ray.remote(num_cpus=1)(fn).remote(*args),))
-        thread.start()
-    else:
-        try:
-            _new_callback_fn(fn(*args))
-        except Exception as e:
-            _new_error_fn(e)
+
+def _send(ws, message):
+    with _socket_locks_lock:
+        lock = _socket_locks.get(ws)
+        if lock is None:
+            lock = _socket_locks[ws] = threading.Lock()
+    with lock:
+        ws.send(message)
+
+
+def _send_status(ws, cfn, job_id, status, **details):
+    try:
+        _send(ws, jsonify_numpy({"cfn": cfn, "jobId": job_id, "status": status, **details}))
+    except Exception as e:
+        traceback.print_exception(type(e), e, e.__traceback__)
+
+
+def _progress_callback(stage, fraction, elapsed, ws, cfn, job_id):
+    _send_status(ws, cfn, job_id, "progress", stage=stage, fraction=fraction, elapsed=elapsed)
+
+
+def _cancel_requested(da, ws, data):
+    """cancel the job of a message {"cancel": job id} on the socket `ws`; False for any other message"""
+    if "cancel" not in data:
+        return False
+    if not worker_pool.cancel(data["cancel"], user=_job_user(da, ws)):
+        print("Job", data["cancel"], "was not cancelled: it finished, or it is not the user's.")
+    return True
 
 
-def _error_callback(e, ws, cfn):
-    ws.send(jsonify_numpy({"fail": True, "cfn": cfn}))
+def _error_callback(e, ws, cfn, job_id=None):
+    _send(ws, jsonify_numpy({"fail": True, "cfn": cfn, "jobId": job_id}))
     traceback.print_exception(type(e), e, e.__traceback__)
 
 
@@ -270,20 +356,14 @@ def compute_diffexp_ttest(
     if nA + nB == obs_mask_A.size:
         if nA < nB:
             if nA < CUTOFF:
-                XI = _read_shmem(shm, shm_csc, layer, format="csr", mode=mode)
-                XS = XI[iA]
+                XS = _as_float(_read_shmem_rows(shm, shm_csc, layer, iA, mode=mode))
                 sparse_scaler(XS, scale=scale, mode=mode, mu=mu, std=std)
-                n = XI.shape[0]
+                n = obs_mask_A.size
                 meanA, vA = sf.mean_variance_axis(XS, axis=0)
                 meanAsq = vA - meanA**2
                 meanAsq[meanAsq < 0] = 0
             else:
-                XI = _read_shmem(shm, shm_csc, layer, format="csc", mode=mode)
-                n = XI.shape[0]
-
-                meanA, meanAsq = _partial_summer(
-                    XI.data, XI.indices, XI.indptr, XI.shape[1], iA, niA, mu=mu, std=std, mode=mode, scale=scale
-                )
+                n, meanA, meanAsq = _partial_sums(shm, shm_csc, layer, iA, niA, mu=mu, std=std, mode=mode, scale=scale)
                 meanA /= nA
                 meanAsq /= nA
                 vA = meanAsq - meanA**2
@@ -295,20 +375,14 @@ def compute_diffexp_ttest(
 
         else:
             if nB < CUTOFF:
-                XI = _read_shmem(shm, shm_csc, layer, format="csr", mode=mode)
-                XS = XI[iB]
+                XS = _as_float(_read_shmem_rows(shm, shm_csc, layer, iB, mode=mode))
                 sparse_scaler(XS, scale=scale, mode=mode, mu=mu, std=std)
-                n = XI.shape[0]
+                n = obs_mask_A.size
                 meanB, vB = sf.mean_variance_axis(XS, axis=0)
                 meanBsq = vB - meanB**2
                 meanBsq[meanBsq < 0] = 0
             else:
-                XI = _read_shmem(shm, shm_csc, layer, format="csc", mode=mode)
-                n = XI.shape[0]
-
-                meanB, meanBsq = _partial_summer(
-                    XI.data, XI.indices, XI.indptr, XI.shape[1], iB, niB, mu=mu, std=std, mode=mode, scale=scale
-                )
+                n, meanB, meanBsq = _partial_sums(shm, shm_csc, layer, iB, niB, mu=mu, std=std, mode=mode, scale=scale)
                 meanB /= nB
                 meanBsq /= nB
                 vB = meanBsq - meanB**2
@@ -319,81 +393,72 @@ def compute_diffexp_ttest(
             vA = meanAsq - meanA**2
     else:
         if nA < CUTOFF:
-            XI = _read_shmem(shm, shm_csc, layer, format="csr", mode=mode)
-            XS = XI[iA]
+            XS = _as_float(_read_shmem_rows(shm, shm_csc, layer, iA, mode=mode))
             sparse_scaler(XS, scale=scale, mode=mode, mu=mu, std=std)
-            n = XI.shape[0]
+            n = obs_mask_A.size
             meanA, vA = sf.mean_variance_axis(XS, axis=0)
         else:
-            XI = _read_shmem(shm, shm_csc, layer, format="csc", mode=mode)
-            n = XI.shape[0]
-
-            meanA, meanAsq = _partial_summer(
-                XI.data, XI.indices, XI.indptr, XI.shape[1], iA, niA, mu=mu, std=std, mode=mode, scale=scale
-            )
+            n, meanA, meanAsq = _partial_sums(shm, shm_csc, layer, iA, niA, mu=mu, std=std, mode=mode, scale=scale)
             meanA /= nA
             meanAsq /= nA
             vA = meanAsq - meanA**2
             vA[vA < 0] = 0
 
         if nB < CUTOFF:
-            XI = _read_shmem(shm, shm_csc, layer, format="csr", mode=mode)
-            XS = XI[iB]
+            XS = _as_float(_read_shmem_rows(shm, shm_csc, layer, iB, mode=mode))
             sparse_scaler(XS, scale=scale, mode=mode, mu=mu, std=std)
-            n = XI.shape[0]
+            n = obs_mask_A.size
             meanB, vB = sf.mean_variance_axis(XS, axis=0)
         else:
-            XI = _read_shmem(shm, shm_csc, layer, format="csc", mode=mode)
-            n = XI.shape[0]
-
-            meanB, meanBsq = _partial_summer(
-                XI.data, XI.indices, XI.indptr, XI.shape[1], iB, niB, mu=mu, std=std, mode=mode, scale=scale
-            )
+            n, meanB, meanBsq = _partial_sums(shm, shm_csc, layer, iB, niB, mu=mu, std=std, mode=mode, scale=scale)
             meanB /= nB
             meanBsq /= nB
             vB = meanBsq - meanB**2
             vB[vB < 0] = 0
 
-    res = diffexp_generic.diffexp_ttest(meanA, vA, nA, meanB, vB, nB)
+    res = diffexp_generic.diffexp_ttest_stats(meanA, vA, nA, meanB, vB, nB)
+    ranked = np.argsort(res["score"])
+    orders = {"positive": ranked[::-1], "negative": ranked}
+
+    directory, pop = os.path.split(fname.split("_output.p")[0])
     fname2 = fname.split("_output.p")[0] + "_sg.p"
-    if multiplex:
-        pickle_dumper(res["positive"], fname)
-        pickle_dumper(list(np.arange(150)), fname2)
-    else:
-        pickle_dumper(res["positive"], fname)
-        pickle_dumper(res["negative"], fname.replace("Pop1 high", "Pop2 high"))
-        pickle_dumper(list(np.arange(150)), fname2)
-        pickle_dumper(list(np.arange(150)), fname2.replace("Pop1 high", "Pop2 high"))
+    pops = {"positive": pop} if multiplex else {"positive": pop, "negative": pop.replace("Pop1 high", "Pop2 high")}
+    for k, p in pops.items():
+        o = orders[k]
+        diffexp_store.write_result(
+            directory, p, o, res["lfc"][o], res["pval"][o], res["pval_adj"][o], meanA[o], meanB[o]
+        )
+    pickle_dumper(list(np.arange(diffexp_store.TOP_N)), fname2)
+    if not multiplex:
+        pickle_dumper(list(np.arange(diffexp_store.TOP_N)), fname2.replace("Pop1 high", "Pop2 high"))
 
     m = {}
-    for k in res.keys():
-        m[k] = res[k][:150]
+    for k, o in orders.items():
+        o = o[: diffexp_store.TOP_N]
+        m[k] = [list(row) for row in zip(o, res["lfc"][o], res["pval"][o], res["pval_adj"][o])]
     return m
 
 
 def pickle_loader(fn):
-    with open(fn, "rb") as f:
-        x = pickle.load(f)
-    return x
+    return artifact_cache.load(fn)
 
 
 def save_data(AnnDataDict, labelNames, cids, currentLayout, obs_mask, userID, ihm, shm, shm_csc):
-    fnames = glob(f"{userID}/emb/*.p")
+    fnames = embedding_store.list_embeddings(f"{userID}/emb")
 
     name = currentLayout.split(";")[-1]
 
     embs = {}
-    nnms = {}
+    nnms = []
     params = {}
-    for f in fnames:
-        n = f.split("/")[-1].split("\\")[-1][:-2]
+    for n in fnames:
         if name == n.split(";")[-1] or (";;" not in currentLayout and ";;" not in n):
-            if exists(f) and exists(f"{userID}/nnm/{n}.p") and exists(f"{userID}/params/{n}.p"):
-                embs[n] = pickle_loader(f)
-                nnms[n] = pickle_loader(f"{userID}/nnm/{n}.p")
+            if graph_store.has_graph(f"{userID}/nnm", n) and manifest.exists(userID, "params", n):
+                embs[n] = np.array(embedding_store.read_embedding(f"{userID}/emb", n))
+                nnms.append(n)
                 params[n] = pickle_loader(f"{userID}/params/{n}.p")
-            elif exists(f):
-                embs[n] = pickle_loader(f)
+            else:
+                embs[n] = np.array(embedding_store.read_embedding(f"{userID}/emb", n))
 
     X = embs[currentLayout]
     currParams = params.get(currentLayout, {})
@@ -405,14 +470,12 @@ def save_data(AnnDataDict, labelNames, cids, currentLayout, obs_mask, userID, ih
 
     obs = pd.DataFrame()
     for k in OBS_KEYS:
-        try:
-            obs[k] = pickle_loader(f"{userID}/obs/{k}.p")
-        except:
-            pass
+        if column_store.has_column(f"{userID}/obs", k):
+            obs[k] = column_store.read_column(f"{userID}/obs", k)
     obs.index = pd.Index(np.arange(obs.shape[0]))
 
     var = pd.DataFrame()
-    v = pickle_loader(f"{userID}/var/name_0.p")
+    v = column_store.read_column(f"{userID}/var", "name_0")
     var["name_0"] = v
 
     obs_mask2 = np.zeros(v.size, dtype="bool")
@@ -434,35 +497,32 @@ def save_data(AnnDataDict, labelNames, cids, currentLayout, obs_mask, userID, ih
 
     if labelNames:
         for n in labelNames:
-            l = pickle_loader(f"{userID}/obs/{n}.p")[index]
+            l = column_store.read_column(f"{userID}/obs", n)[index]
             if n != "name_0":
                 adata.obs[n] = pd.Categorical(l)
 
-    fnames = glob(f"{userID}/var/*.p")
-    for f in fnames:
-        n = f.split("/")[-1].split("\\")[-1][:-2]
+    fnames = column_store.list_columns(f"{userID}/var")
+    for n in fnames:
         if ";;" in n:
             tlay = n.split(";;")[-1]
         else:
             tlay = ""
 
         if name == tlay:
-            l = pickle_loader(f"{userID}/var/{n}.p")
             if n != "name_0":
+                l = column_store.read_column(f"{userID}/var", n)
                 adata.var[n.split(";;")[0]] = pd.Series(data=l, index=v)
 
     vkeys = list(adata.var.keys())
-    for f in fnames:
-        n = f.split("/")[-1].split("\\")[-1][:-2]
+    for n in fnames:
         if ";;" not in n:
             if n not in vkeys:
-                l = pickle_loader(f"{userID}/var/{n}.p")
                 if n != "name_0":
+                    l = column_store.read_column(f"{userID}/var", n)
                     adata.var[n] = pd.Series(data=l, index=v)
 
-    fnames = glob(f"{userID}/pca/*.p")
-    for f in fnames:
-        n = f.split("/")[-1].split("\\")[-1][:-2]
+    fnames = manifest.list_artifacts(userID, "pca")
+    for n in fnames:
         if ";;" in n:
             tlay = n.split(";;")[-1]
         else:
@@ -473,16 +533,15 @@ def save_data(AnnDataDict, labelNames, cids, currentLayout, obs_mask, userID, ih
             adata.obsm[f"X_latent_{n.split(';;')[0]}"] = l
 
     vkeys = list(adata.obsm.keys())
-    for f in fnames:
-        n = f.split("/")[-1].split("\\")[-1][:-2]
+    for n in fnames:
         if ";;" not in n:
             if n not in vkeys:
                 l = pickle_loader(f"{userID}/pca/{n}.p")[index]
                 adata.obsm[f"X_latent_{n}"] = l
 
     temp = {}
-    for key in nnms.keys():
-        temp[key] = nnms[key][index][:, index]
+    for key in nnms:
+        temp[key] = graph_store.read_subgraph(f"{userID}/nnm", key, index)
     for key in temp.keys():
         adata.obsp["N_" + key.split(";;")[-1]] = temp[key]
     for key in params.keys():
@@ -492,8 +551,7 @@ def save_data(AnnDataDict, labelNames, cids, currentLayout, obs_mask, userID, ih
 
     for k in AnnDataDict["Xs"]:
         if k != "X":
-            X = _read_shmem(shm, shm_csc, k, format="csr", mode=mode)
-            adata.layers[k] = X[index]
+            adata.layers[k] = _as_float(_read_shmem_rows(shm, shm_csc, k, index, mode=mode))
 
     if ihm:
         if not os.path.exists("output/"):
@@ -535,6 +593,7 @@ def embed(adata, reembedParams, umap=True, kernelPca=False, nobatch=False):
 
     sam = None
     if not doSAM:
+        worker_pool.progress("HVG")
         if samHVG:
             try:
                 adata = adata[
@@ -558,6 +617,7 @@ def embed(adata, reembedParams, umap=True, kernelPca=False, nobatch=False):
                 adata = adata[:, adata.var["highly_variable"]]
             except:
                 print("Error during HVG selection - some of your expressions are probably negative.")
+        worker_pool.progress("PCA", 0.2)
         X = adata.X
         if scaleData:
             sc.pp.scale(adata, max_value=10)
@@ -566,6 +626,7 @@ def embed(adata, reembedParams, umap=True, kernelPca=False, nobatch=False):
         adata.X = X
         vn = np.array(list(adata.var_names))
     else:
+        worker_pool.progress("SAM")
         sam = SAM(counts=adata, inplace=True)
         X = sam.adata.X
         preprocessing = "StandardScaler" if scaleData else "Normalizer"
@@ -586,6 +647,7 @@ def embed(adata, reembedParams, umap=True, kernelPca=False, nobatch=False):
         vn = np.array(list(adata.var_names[np.sort(np.argsort(-np.array(list(adata.var["weights"])))[:nTopGenesHVG])]))
 
     if doBatch and not nobatch:
+        worker_pool.progress("batch correction", 0.5)
         if doSAM:
             adata_batch = sam.adata
         else:
@@ -620,11 +682,13 @@ def embed(adata, reembedParams, umap=True, kernelPca=False, nobatch=False):
 
     if not doSAM or (doSAM and batchMethod == "BBKNN" and not nobatch):
         if not doBatch or doBatch and batchMethod != "BBKNN":
+            worker_pool.progress("kNN", 0.6)
             sc.pp.neighbors(
                 adata, n_neighbors=neighborsKnn, use_rep="X_pca", method=neighborsMethod, metric=distanceMetric
             )
 
         if kernelPca:
+            worker_pool.progress("kPCA", 0.7)
             Z = kernel_svd(
                 adata.obsp["connectivities"].dot(adata.obsp["connectivities"].T), min(min(adata.shape) - 1, numPCs)
             )
@@ -632,9 +696,11 @@ def embed(adata, reembedParams, umap=True, kernelPca=False, nobatch=False):
             adata.obsp["connectivities"] = ut.calc_nnm(Z, neighborsKnn, distanceMetric)
             adata.obsp["connectivities"].data[:] = 1
         elif umap:
+            worker_pool.progress("UMAP", 0.7)
             sc.tl.umap(adata, min_dist=umapMinDist, maxiter=500 if adata.shape[0] <= 10000 else 200)
     else:
         if kernelPca:
+            worker_pool.progress("kPCA", 0.7)
             Z = kernel_svd(
                 sam.adata.obsp["connectivities"].dot(sam.adata.obsp["connectivities"].T),
                 min(min(adata.shape) - 1, numPCs),
@@ -644,6 +710,7 @@ def embed(adata, reembedParams, umap=True, kernelPca=False, nobatch=False):
             adata.obsp["connectivities"] = ut.calc_nnm(Z, neighborsKnn, distanceMetric)
             adata.obsp["connectivities"].data[:] = 1
         elif umap:
+            worker_pool.progress("UMAP", 0.7)
             sam.run_umap(metric=distanceMetric, min_dist=umapMinDist)
             adata.obsm["X_umap"] = sam.adata.obsm["X_umap"]
         adata.obsp["connectivities"] = sam.adata.obsp["connectivities"]
@@ -680,7 +747,7 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
     else:
         name = embName
 
-    if exists(f"{userID}/emb/{name}.p"):
+    if embedding_store.has_embedding(f"{userID}/emb", name):
         name = f"{name}_{str(hex(int(time.time())))[2:]}"
     paired_embeddings = pickle_loader(f"{ID}/paired_embeddings.p")
 
@@ -701,7 +768,7 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
         else:
             name2 = name
 
-        if exists(f"{ID}/{otherMode}/emb/{name2}.p"):
+        if embedding_store.has_embedding(f"{ID}/{otherMode}/emb", name2):
             name2 = f"{name2}_{str(hex(int(time.time())))[2:]}"
 
         paired_embeddings[name] = name2
@@ -734,15 +801,18 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
                 "obs_mask": obs_mask2,
                 "obs_mask2": obs_mask,
             }
-            adata = compute_preprocess(
-                AnnDataDict2, reembedParams, userID, "OBS", shm, shm_csc, other=True
-            )  # subset cells
+            with worker_pool.span(0.0, 0.2):
+                adata = compute_preprocess(
+                    AnnDataDict2, reembedParams, userID, "OBS", shm, shm_csc, other=True
+                )  # subset cells
             X_full = adata.X.T
         elif mode == "OBS":  # obs_mask2 is for genes
-            adata = compute_preprocess(AnnDataDict, reembedParams, userID, "OBS", shm, shm_csc)
+            with worker_pool.span(0.0, 0.2):
+                adata = compute_preprocess(AnnDataDict, reembedParams, userID, "OBS", shm, shm_csc)
             X_full = adata.X
 
-        nnm1, pca1, sam1, vn1 = embed(adata, reembedParams, umap=False, nobatch=mode == "VAR")
+        with worker_pool.span(0.2, 0.5):
+            nnm1, pca1, sam1, vn1 = embed(adata, reembedParams, umap=False, nobatch=mode == "VAR")
         ####### profile FROM HERE #########
         vn1 = vn1.astype("int")
         _, y1 = adata.X.nonzero()
@@ -769,6 +839,7 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
         adata = adata[:, vn1.astype("str")]
         adata2 = adata.X.T
 
+        worker_pool.progress("gene graph", 0.5)
         cl = SAM().leiden_clustering(X=nnm1, res=5)
         clu = np.unique(cl)
         avgs = []
@@ -799,6 +870,7 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
 
         # given nnm1, pca1, sam1, nnm2, pca2
 
+        worker_pool.progress("kNN", 0.6)
         X1 = StandardScaler(with_mean=False).fit_transform(adata.X)  # cells
         X2 = StandardScaler(with_mean=False).fit_transform(adata2)
         mu1 = X1.mean(0).A.flatten()
@@ -829,6 +901,7 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
         X = sp.sparse.bmat([[nnm1c, X1], [X2, nnm2c]]).tocsr()
         ####### TO HERE is slow for lung tabula sapiens #########
 
+        worker_pool.progress("kPCA", 0.7)
         print("Running Kernel PCA...")
         Z = kernel_svd(X, k=pca1.shape[1])
 
@@ -838,10 +911,12 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
         umapMinDist = reembedParams.get("umapMinDist", 0.1)
         neighborsKnn = reembedParams.get("neighborsKnn", 20)
         distanceMetric = reembedParams.get("distanceMetric", "cosine")
+        worker_pool.progress("UMAP", 0.8)
         print("Running UMAP...")
         X_umap = SAM().run_umap(X=Z, metric=distanceMetric, seed=0, min_dist=umapMinDist)[0]
         X_umap = DataAdaptor.normalize_embedding(X_umap)
 
+        worker_pool.progress("graph rebuild", 0.9)
         print("Calculating new graphs from kPCA...")
         nnm1 = ut.calc_nnm(pca1, neighborsKnn, "cosine")
         nnm2 = ut.calc_nnm(pca2, neighborsKnn, "cosine")
@@ -853,10 +928,10 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
         X_umap1 = X_umap[: nnm1.shape[0]]
         X_umap2 = X_umap[nnm1.shape[0] :]
 
-        fns_ = glob(f"{otherID}/emb/*.p")  # delete empty root embedding if it's the only one there in other mode
-        if len(fns_) > 0:
-            if len(fns_) == 1 and "root.p" in fns_[0]:
-                os.remove(fns_[0])
+        worker_pool.checkpoint()
+        fns_ = embedding_store.list_embeddings(f"{otherID}/emb")  # delete empty root embedding if it's the only one there in other mode
+        if fns_ == ["root"]:
+            embedding_store.delete_embedding(f"{otherID}/emb", "root")
 
         if mode == "OBS":
             X_umap = np.full((obs_mask.shape[0], X_umap1.shape[1]), np.NaN)
@@ -876,9 +951,9 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
             x, y = nnm2.nonzero()
             d = nnm2.data
             nnm2 = sp.sparse.coo_matrix((d, (IXer[x].values, IXer[y].values)), shape=(obs_mask2.size,) * 2).tocsr()
-            pickle_dumper(nnm2, f"{ID}/nnm/{name2}.p")
-            pickle_dumper(Xu2, f"{ID}/emb/{name2}.p")
-            pickle_dumper(pc2, f"{ID}/pca/pca;;{name2}.p")
+            graph_store.write_graph(f"{ID}/nnm", name2, nnm2)
+            embedding_store.write_embedding(f"{ID}/emb", name2, Xu2)
+            manifest.dump_artifact(ID, "pca", f"pca;;{name2}", pc2)
 
         else:
             X_umap = np.full((obs_mask.shape[0], X_umap2.shape[1]), np.NaN)
@@ -899,9 +974,9 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
             x, y = nnm1.nonzero()
             d = nnm1.data
             nnm1 = sp.sparse.coo_matrix((d, (IXer[x].values, IXer[y].values)), shape=(obs_mask2.size,) * 2).tocsr()
-            pickle_dumper(nnm1, f"{ID}/nnm/{name2}.p")
-            pickle_dumper(Xu1, f"{ID}/emb/{name2}.p")
-            pickle_dumper(pc1, f"{ID}/pca/pca;;{name2}.p")
+            graph_store.write_graph(f"{ID}/nnm", name2, nnm1)
+            embedding_store.write_embedding(f"{ID}/emb", name2, Xu1)
+            manifest.dump_artifact(ID, "pca", f"pca;;{name2}", pc1)
 
     elif embeddingMode == "Preprocess and run":
         dsampleKey = reembedParams.get("dsampleKey", "None")
@@ -928,10 +1003,15 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
                 "var": AnnDataDict["obs"],
                 "obs_mask": obs_mask2,
             }
-            adata = compute_preprocess(AnnDataDict2, reembedParams, userID, "OBS", shm, shm_csc, other=True)  # cells
+            with worker_pool.span(0.0, 0.2):
+                adata = compute_preprocess(
+                    AnnDataDict2, reembedParams, userID, "OBS", shm, shm_csc, other=True
+                )  # cells
             adata = adata[:, obs_mask]
-            nnm, pca, _, _ = embed(adata, reembedParams, umap=False, nobatch=True)
+            with worker_pool.span(0.2, 0.5):
+                nnm, pca, _, _ = embed(adata, reembedParams, umap=False, nobatch=True)
 
+            worker_pool.progress("gene graph", 0.5)
             cl = SAM().leiden_clustering(X=nnm, res=10)
             clu = np.unique(cl)
             avgs = []
@@ -948,6 +1028,7 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
             )
             nnm.data[:] = 1
             if reembedParams.get("kernelPca", False):
+                worker_pool.progress("kPCA", 0.6)
                 print("Running kernel PCA...")
                 Z = kernel_svd(nnm, reembedParams.get("numPCs", 50))
                 nnm = ut.calc_nnm(
@@ -956,6 +1037,7 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
                 nnm.data[:] = 1
             else:
                 Z = obsm
+            worker_pool.progress("UMAP", 0.7)
             umap = SAM().run_umap(
                 X=Z,
                 min_dist=reembedParams.get("umapMinDist", 0.1),
@@ -963,7 +1045,8 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
                 seed=0,
             )[0]
 
-            adata = compute_preprocess(AnnDataDict, reembedParams, userID, "VAR", shm, shm_csc)  # genes
+            with worker_pool.span(0.8, 0.9):
+                adata = compute_preprocess(AnnDataDict, reembedParams, userID, "VAR", shm, shm_csc)  # genes
             X_full = adata.X
 
             result = np.full((obs_mask.shape[0], umap.shape[1]), np.NaN)
@@ -972,11 +1055,13 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
             pca = np.full((obs_mask.shape[0], obsm.shape[1]), np.NaN)
             pca[obs_mask] = obsm
         else:
-            adata = compute_preprocess(AnnDataDict, reembedParams, userID, mode, shm, shm_csc)
+            with worker_pool.span(0.0, 0.2):
+                adata = compute_preprocess(AnnDataDict, reembedParams, userID, mode, shm, shm_csc)
             X_full = adata.X
-            nnm, obsm, umap, sam, _ = embed(
-                adata, reembedParams, umap=True, kernelPca=reembedParams.get("kernelPca", False)
-            )
+            with worker_pool.span(0.2, 0.9):
+                nnm, obsm, umap, sam, _ = embed(
+                    adata, reembedParams, umap=True, kernelPca=reembedParams.get("kernelPca", False)
+                )
 
             result = np.full((obs_mask.shape[0], umap.shape[1]), np.NaN)
             result[obs_mask] = umap
@@ -998,7 +1083,7 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
             else:
                 name2 = embName
 
-            if exists(f"{ID}/{otherMode}/emb/{name2}.p"):
+            if embedding_store.has_embedding(f"{ID}/{otherMode}/emb", name2):
                 name2 = f"{name2}_{str(hex(int(time.time())))[2:]}"
 
             paired_embeddings[name] = name2
@@ -1007,14 +1092,14 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
 
             # otherMode
             cL = paired_embeddings[currentLayout]
-            umap = pickle_loader(f"{ID}/{otherMode}/emb/{cL}.p")
+            umap = embedding_store.read_embedding(f"{ID}/{otherMode}/emb", cL)
             result = np.full((obs_mask2.shape[0], umap.shape[1]), np.NaN)
             result[obs_mask2] = umap[obs_mask2]
             X_umap = result
 
             try:
-                nnm = pickle_loader(f"{ID}/{otherMode}/nnm/{cL}.p")
-            except:
+                nnm = graph_store.read_graph(f"{ID}/{otherMode}/nnm", cL)
+            except KeyError:
                 nnm = None
 
             try:
@@ -1031,30 +1116,30 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
                 pca[obs_mask2] = obsm[obs_mask2]
 
             if nnm is not None:
-                pickle_dumper(nnm, f"{ID}/{otherMode}/nnm/{name2}.p")
+                graph_store.write_graph(f"{ID}/{otherMode}/nnm", name2, nnm)
             if pca is not None:
-                pickle_dumper(pca, f"{ID}/{otherMode}/pca/pca;;{name2}.p")
+                manifest.dump_artifact(f"{ID}/{otherMode}", "pca", f"pca;;{name2}", pca)
 
             Xu2 = X_umap
-            umap = pickle_loader(f"{userID}/emb/{currentLayout}.p")
+            umap = embedding_store.read_embedding(f"{userID}/emb", currentLayout)
             result = np.full((obs_mask.shape[0], umap.shape[1]), np.NaN)
             result[obs_mask] = umap[obs_mask]
             X_umap = result
 
             x = DataAdaptor.normalize_embedding(np.vstack((Xu2, X_umap)))
             Xu2 = x[: Xu2.shape[0]]
-            pickle_dumper(Xu2, f"{ID}/{otherMode}/emb/{name2}.p")
+            embedding_store.write_embedding(f"{ID}/{otherMode}/emb", name2, Xu2)
 
             X_umap = x[Xu2.shape[0] :]
         else:
-            umap = pickle_loader(f"{userID}/emb/{currentLayout}.p")
+            umap = embedding_store.read_embedding(f"{userID}/emb", currentLayout)
             result = np.full((obs_mask.shape[0], umap.shape[1]), np.NaN)
             result[obs_mask] = umap[obs_mask]
             X_umap = DataAdaptor.normalize_embedding(result)
 
         try:
-            nnm = pickle_loader(f"{userID}/nnm/{currentLayout}.p")[obs_mask][:, obs_mask]
-        except:
+            nnm = graph_store.read_subgraph(f"{userID}/nnm", currentLayout, obs_mask)
+        except KeyError:
             nnm = None
 
         try:
@@ -1095,6 +1180,7 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
         adata = AnnData(X=np.zeros(obsm.shape)[obs_mask], obsm={"X_pca": obsm[obs_mask]})
 
         if doBatch:
+            worker_pool.progress("batch correction", 0.1)
             if batchMethod == "Harmony":
                 sce.pp.harmony_integrate(adata, batchKey, adjusted_basis="X_pca")
             elif batchMethod == "BBKNN":
@@ -1118,9 +1204,11 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
                 )
 
         if not doBatch or doBatch and batchMethod != "BBKNN":
+            worker_pool.progress("kNN", 0.4)
             sc.pp.neighbors(
                 adata, n_neighbors=neighborsKnn, use_rep="X_pca", method=neighborsMethod, metric=distanceMetric
             )
+        worker_pool.progress("UMAP", 0.6)
         sc.tl.umap(adata, min_dist=umapMinDist, maxiter=500 if adata.shape[0] <= 10000 else 200)
         umap = adata.obsm["X_umap"]
         nnm = adata.obsp["connectivities"]
@@ -1144,12 +1232,12 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
         nnm = sp.sparse.coo_matrix((d, (IXer[x].values, IXer[y].values)), shape=(obs_mask.size,) * 2).tocsr()
 
     # direc
-    if exists(f"{userID}/params/latest.p"):
+    if manifest.exists(userID, "params", "latest"):
         latestPreParams = pickle_loader(f"{userID}/params/latest.p")
     else:
         latestPreParams = None
 
-    if exists(f"{userID}/params/{parentName}.p"):
+    if manifest.exists(userID, "params", parentName):
         parentParams = pickle_loader(f"{userID}/params/{parentName}.p")
     else:
         parentParams = None
@@ -1165,10 +1253,13 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
         dataLayer = reembedParams.get("dataLayer", "X")
         obs_mask = AnnDataDict["obs_mask"]
         obs_mask2 = AnnDataDict["obs_mask2"]
-        X_full = _read_shmem(shm, shm_csc, dataLayer, format="csr", mode=mode)[obs_mask][:, obs_mask2]
+        X_full = _as_float(_read_shmem_rows(shm, shm_csc, dataLayer, obs_mask, mode=mode)[:, obs_mask2])
 
+    # a checkpoint before the results are written
+    worker_pool.checkpoint()
     if nnm is not None:
         if reembedParams.get("calculateSamWeights", False):
+            worker_pool.progress("SAM weights", 0.9)
             var = dispersion_ranking_NN(X_full, nnm_sub)
             for k in var.keys():
                 x = var[k]
@@ -1177,43 +1268,41 @@ def compute_embedding(AnnDataDict, reembedParams, parentName, embName, currentLa
                 var[k] = y
 
             for k in var.keys():
-                fn = "{}/var/{};;{}.p".format(userID, k.replace("/", "_"), name)
-                fn2 = "{}/obs/{};;{}.p".format(otherID, k.replace("/", "_"), name)
-                if not os.path.exists(fn.split(";;")[0] + ".p"):
-                    pickle_dumper(np.array(list(var[k])).astype("float"), fn.split(";;")[0] + ".p")
+                col = k.replace("/", "_")
+                vals = np.array(list(var[k])).astype("float")
+                if not column_store.has_column(f"{userID}/var", col):
+                    column_store.write_column(f"{userID}/var", col, vals)
                     if jointMode:
-                        pickle_dumper(np.array(list(var[k])).astype("float"), fn2.split(";;")[0] + ".p")
-                pickle_dumper(np.array(list(var[k])).astype("float"), fn)
+                        column_store.write_column(f"{otherID}/obs", col, vals)
+                column_store.write_column(f"{userID}/var", f"{col};;{name}", vals)
                 if jointMode:
-                    pickle_dumper(np.array(list(var[k])).astype("float"), fn2)
+                    column_store.write_column(f"{otherID}/obs", f"{col};;{name}", vals)
 
-        pickle_dumper(nnm, f"{userID}/nnm/{name}.p")
+        graph_store.write_graph(f"{userID}/nnm", name, nnm)
 
-    pickle_dumper(X_umap, f"{userID}/emb/{name}.p")
-    pickle_dumper(reembedParams, f"{userID}/params/{name}.p")
+    embedding_store.write_embedding(f"{userID}/emb", name, X_umap)
+    manifest.dump_artifact(userID, "params", name, reembedParams)
     if pca is not None:
-        pickle_dumper(pca, f"{userID}/pca/pca;;{name}.p")
+        manifest.dump_artifact(userID, "pca", f"pca;;{name}", pca)
 
     return layout_schema
 
 
 def pickle_dumper(x, fn):
-    with open(fn, "wb") as f:
-        pickle.dump(x, f)
+    artifact_cache.dump(x, fn)
 
 
 def compute_leiden(obs_mask, name, resolution, userID, shm, shm_csc):
     # direc
     try:
-        nnm = pickle_loader(f"{userID}/nnm/{name}.p")
-        nnm = nnm[obs_mask][:, obs_mask]
-    except:
-        emb = pickle_loader(f"{userID}/emb/{name}.p")
+        nnm = graph_store.read_subgraph(f"{userID}/nnm", name, obs_mask)
+    except KeyError:
+        emb = embedding_store.read_embedding(f"{userID}/emb", name)
         emb = emb[obs_mask]
         nnm = ut.calc_nnm(emb, 20, "euclidean")
         nnm.data[:] = 1
         if np.all(obs_mask):
-            pickle_dumper(nnm, f"{userID}/nnm/{name}.p")
+            graph_store.write_graph(f"{userID}/nnm", name, nnm)
 
     X = nnm
 
@@ -1254,15 +1343,14 @@ def compute_sankey_df(labels, name, obs_mask, userID, numEdges, shm, shm_csc):
         return x, y
 
     try:
-        nnm = pickle_loader(f"{userID}/nnm/{name}.p")
-        nnm = nnm[obs_mask][:, obs_mask]
-    except:
-        emb = pickle_loader(f"{userID}/emb/{name}.p")
+        nnm = graph_store.read_subgraph(f"{userID}/nnm", name, obs_mask)
+    except KeyError:
+        emb = embedding_store.read_embedding(f"{userID}/emb", name)
         emb = emb[obs_mask]
         nnm = ut.calc_nnm(emb, 20, "euclidean")
         nnm.data[:] = 1
         if np.all(obs_mask):
-            pickle_dumper(nnm, f"{userID}/nnm/{name}.p")
+            graph_store.write_graph(f"{userID}/nnm", name, nnm)
 
     cl = []
     clu = []
@@ -1385,7 +1473,8 @@ def generate_correlation_map(x, y):
 
 def compute_sankey_df_corr(labels, obs_mask, params, var, userID, shm, shm_csc):
     mode = userID.split("/")[-1].split("\\")[-1]
-    adata = AnnData(X=_read_shmem(shm, shm_csc, params["dataLayer"], format="csr", mode=mode)[obs_mask], var=var)
+    X = _as_float(_read_shmem_rows(shm, shm_csc, params["dataLayer"], obs_mask, mode=mode))
+    adata = AnnData(X=X, var=var)
 
     if params["samHVG"]:
         adata = adata[
@@ -1444,7 +1533,7 @@ def get_avgs(X, c, cu):
 
 def compute_sankey_df_corr_sg(labels, obs_mask, params, var, userID, shm, shm_csc):
     mode = userID.split("/")[-1].split("\\")[-1]
-    adata = AnnData(X=_read_shmem(shm, shm_csc, params["dataLayer"], format="csr", mode=mode)[obs_mask])
+    adata = AnnData(X=_as_float(_read_shmem_rows(shm, shm_csc, params["dataLayer"], obs_mask, mode=mode)))
     adata = adata[:, var[params["selectedGenes"]].values]
 
     cl = []
@@ -1542,6 +1631,7 @@ def compute_sankey_df_coclustering(labels, obs_mask, numEdges, shm, shm_csc):
 
 
 def compute_preprocess(AnnDataDict, reembedParams, userID, mode, shm, shm_csc, other=False):
+    worker_pool.progress("preprocess")
     layers = AnnDataDict["Xs"]
     obs = AnnDataDict["obs"]
     var = AnnDataDict["var"]
@@ -1549,18 +1639,18 @@ def compute_preprocess(AnnDataDict, reembedParams, userID, mode, shm, shm_csc, o
     obs_mask2 = AnnDataDict["obs_mask2"].copy()
     kkk = layers[0]
     if np.all(obs_mask2):
-        X = _read_shmem(shm, shm_csc, kkk, format="csr", mode=mode)[obs_mask]
+        X = _as_float(_read_shmem_rows(shm, shm_csc, kkk, obs_mask, mode=mode))
     else:
-        X = _read_shmem(shm, shm_csc, kkk, format="csr", mode=mode)[obs_mask][:, obs_mask2]
+        X = _as_float(_read_shmem_rows(shm, shm_csc, kkk, obs_mask, mode=mode)[:, obs_mask2])
 
     adata = AnnData(X=X, obs=obs[obs_mask], var=var[obs_mask2])
     adata.layers[layers[0]] = X
     for k in layers[1:]:
         kkk = k
         if np.all(obs_mask2):
-            X = _read_shmem(shm, shm_csc, kkk, format="csr", mode=mode)[obs_mask]
+            X = _as_float(_read_shmem_rows(shm, shm_csc, kkk, obs_mask, mode=mode))
         else:
-            X = _read_shmem(shm, shm_csc, kkk, format="csr", mode=mode)[obs_mask][:, obs_mask2]
+            X = _as_float(_read_shmem_rows(shm, shm_csc, kkk, obs_mask, mode=mode)[:, obs_mask2])
         adata.layers[k] = X
 
     doBatchPrep = reembedParams.get("doBatchPrep", False)
@@ -1728,9 +1818,10 @@ def compute_preprocess(AnnDataDict, reembedParams, userID, mode, shm, shm_csc, o
         "dataLayer": dataLayer,
         "sumNormalizeCells": sumNormalizeCells,
     }
+    worker_pool.checkpoint()
     ID = userID.split("/")[0].split("\\")[0]
-    pickle_dumper(prepParams, f"{ID}/OBS/params/latest.p")
-    pickle_dumper(prepParams, f"{ID}/VAR/params/latest.p")
+    manifest.dump_artifact(f"{ID}/OBS", "params", "latest", prepParams)
+    manifest.dump_artifact(f"{ID}/VAR", "params", "latest", prepParams)
     return adata_raw[filt][:, a]
 
 
@@ -1744,6 +1835,8 @@ def initialize_socket(da):
             data = ws.receive()
             if data is not None:
                 data = json.loads(data)
+                if _cancel_requested(da, ws, data):
+                    continue
                 obsFilterA = data.get("set1", {"filter": {}})["filter"]
                 obsFilterB = data.get("set2", {"filter": {}})["filter"]
                 layer = data.get("layer", "X")
@@ -1758,6 +1851,7 @@ def initialize_socket(da):
                 userID = f"{annotations._get_userdata_idhash(da)}"
                 mode = userID.split("/")[-1].split("\\")[-1]
 
+                da.ensure_layers([layer])
                 tMean = da.tMeans[mode][layer]
                 tMeanSq = da.tMeanSqs[mode][layer]
                 tMeanObs = da.tMeans["OBS"][layer]
@@ -1804,6 +1898,8 @@ def initialize_socket(da):
             data = ws.receive()
             if data is not None:
                 data = json.loads(data)
+                if _cancel_requested(da, ws, data):
+                    continue
 
                 filter = data["filter"]
                 if (not current_app.hosted_mode) or (
@@ -1826,7 +1922,7 @@ def initialize_socket(da):
                     dataLayer = reembedParams.get("dataLayer", "X")
                     OBS_KEYS = ["name_0", "sam_weights"]
                     if doBatchPrep and batchPrepKey != "" and batchPrepLabel != "":
-                        cl = pickle_loader(f"{userID}/obs/{batchPrepKey}.p")
+                        cl = column_store.read_column(f"{userID}/obs", batchPrepKey)
                         batches = np.unique(cl)
                         for k in batches:
                             params = batchPrepParams[batchPrepKey].get(k, {})
@@ -1839,30 +1935,27 @@ def initialize_socket(da):
                         OBS_KEYS.append(batchKey)
 
                     layers = list(np.unique(layers))
+                    da.ensure_layers(layers)
                     # direc
 
                     obs = pd.DataFrame()
                     for k in OBS_KEYS:
-                        try:
-                            obs[k] = pickle_loader(f"{userID}/obs/{k}.p")
-                        except:
-                            pass
+                        if column_store.has_column(f"{userID}/obs", k):
+                            obs[k] = column_store.read_column(f"{userID}/obs", k)
                     obs.index = pd.Index(np.arange(obs.shape[0]))
 
-                    fnames = glob(f"{userID}/var/*.p")
-                    v = pickle_loader(f"{userID}/var/name_0.p")
+                    fnames = column_store.list_columns(f"{userID}/var")
+                    v = column_store.read_column(f"{userID}/var", "name_0")
                     var = pd.DataFrame(data=v[:, None], index=v, columns=["name_0"])
-                    for f in fnames:
-                        n = f.split("/")[-1].split("\\")[-1][:-2]
+                    for n in fnames:
                         if ";;" in n:
                             tlay = n.split(";;")[-1]
                         else:
                             tlay = parentName
 
                         if parentName == tlay:
-                            l = pickle_loader(f"{userID}/var/{n}.p")
                             if n != "name_0":
-                                var[n] = l
+                                var[n] = column_store.read_column(f"{userID}/var", n)
                     var.index = pd.Index(np.arange(var.shape[0]))
                     obs_mask2 = np.zeros(var.shape[0], dtype="bool")
                     if len(otherSelector) == 0:
@@ -1902,6 +1995,8 @@ def initialize_socket(da):
             data = ws.receive()
             if data is not None:
                 data = json.loads(data)
+                if _cancel_requested(da, ws, data):
+                    continue
                 labels = data.get("labels", None)
                 name = data.get("name", None)
                 filter = data.get("filter", None)
@@ -1920,22 +2015,21 @@ def initialize_socket(da):
                 userID = f"{annotations._get_userdata_idhash(da)}"
 
                 # direc
-                fnames = glob(f"{userID}/var/*.p")
-                v = pickle_loader(f"{userID}/var/name_0.p")
+                fnames = column_store.list_columns(f"{userID}/var")
+                v = column_store.read_column(f"{userID}/var", "name_0")
                 var = pd.DataFrame(data=v[:, None], index=v, columns=["name_0"])
-                for f in fnames:
-                    n = f.split("/")[-1].split("\\")[-1][:-2]
+                for n in fnames:
                     if ";;" in n:
                         tlay = n.split(";;")[-1]
                     else:
                         tlay = name
 
                     if name == tlay:
-                        l = pickle_loader(f"{userID}/var/{n}.p")
                         if n != "name_0":
-                            var[n] = l
+                            var[n] = column_store.read_column(f"{userID}/var", n)
                 del var["name_0"]
 
+                da.ensure_layers([params.get("dataLayer", "X")])
                 obs_mask = da._axis_filter_to_mask(Axis.OBS, filter["obs"], da.get_shape()[0])
                 if params["sankeyMethod"] == "Graph alignment":
                     _multiprocessing_wrapper(
@@ -1989,6 +2083,8 @@ def initialize_socket(da):
             data = ws.receive()
             if data is not None:
                 data = json.loads(data)
+                if _cancel_requested(da, ws, data):
+                    continue
                 labelNames = data.get("labelNames", None)
                 currentLayout = data.get("currentLayout", None)
                 filter = data["filter"] if data else None
@@ -2000,12 +2096,13 @@ def initialize_socket(da):
                 userID = f"{annotations._get_userdata_idhash(da)}"
 
                 layers = list(da.data.layers.keys())
+                da.ensure_layers(layers)
                 varm = {}
                 for k in da.data.varm.keys():
                     varm[k] = da.data.varm[k]
 
                 AnnDataDict = {"Xs": layers, "varm": varm}
-                name_0 = pickle_loader(f"{userID}/obs/name_0.p")
+                name_0 = column_store.read_column(f"{userID}/obs", "name_0")
                 _multiprocessing_wrapper(
                     da,
                     ws,
@@ -2029,6 +2126,8 @@ def initialize_socket(da):
             data = ws.receive()
             if data is not None:
                 data = json.loads(data)
+                if _cancel_requested(da, ws, data):
+                    continue
                 name = data.get("name", None)
                 resolution = data.get("resolution", 1.0)
                 filter = data.get("filter", None)
@@ -2041,6 +2140,36 @@ def initialize_socket(da):
                 )
 
 
+def _partial_sums(shm, shm_csc, layer, inc, ninc, mu, std, mode="OBS", scale=False):
+    """
+    The sums and sums of squares per gene (OBS) or cell (VAR) of a layer over the cells
+    (genes) `inc`, as `_partial_summer` computes them, and the number of cells (genes).
+    Backed layers are summed block by block (see `backed_layers`).
+    """
+    backed = shm_csc.get(layer)
+    if not (backed_layers.is_backed(backed) and mode == "OBS"):
+        XI = _read_shmem(shm, shm_csc, layer, format="csc", mode=mode)
+        s, s2 = _partial_summer(
+            XI.data, XI.indices, XI.indptr, XI.shape[1], inc, ninc, mu=mu, std=std, mode=mode, scale=scale
+        )
+        return XI.shape[0], s, s2
+
+    member = np.zeros(backed.shape[0], dtype=bool)
+    member[inc] = True
+    s, s2 = np.zeros(backed.shape[1]), np.zeros(backed.shape[1])
+    for start, end, X in backed_layers.iter_blocks(backed):
+        cols = np.repeat(np.arange(end - start), np.diff(X.indptr))
+        keep = member[X.indices]
+        cols, vals = cols[keep], X.data[keep].astype("float64")
+        if scale:
+            denom = std[start:end][cols]
+            denom[denom <= 0] = 1
+            vals = np.clip((vals - mu[start:end][cols]) / denom, 0, 10)
+        s[start:end] = np.bincount(cols, weights=vals, minlength=end - start)
+        s2[start:end] = np.bincount(cols, weights=vals**2, minlength=end - start)
+    return backed.shape[0], s, s2
+
+
 @njit(parallel=True)
 def _partial_summer(
     d, x, ptr, m, inc, ninc, calculate_sq=True, mu=np.array([]), std=np.array([]), mode="OBS", scale=False
@@ -2060,9 +2189,9 @@ def _partial_summer(
     for i in prange(m):
         di = d[ptr[i] : ptr[i + 1]]
         xi = x[ptr[i] : ptr[i + 1]]
-        s = 0
+        s = 0.0
         if calculate_sq:
-            s2 = 0
+            s2 = 0.0
         for j in prange(xi.size):
             ps = di[j] if htable[xi[j]] else 0
             if scale:
@@ -2090,42 +2219,218 @@ def _partial_summer(
     return res, res2
 
 
-@njit(parallel=True)
-def _fmt_swapper(indices, indptr, data, n):  # x,y,d,ptr):
-    pair = np.zeros_like(indices)
-    for i in prange(indptr.size):
-        pair[indptr[i] : indptr[i + 1]] = i
-
-    indptr2 = np.zeros(n, dtype=indices.dtype)
-    for i in range(indices.size):
-        indptr2[indices[i] + 1] += 1
+@njit(parallel=True, nogil=True)
+def _gather_minor(indices, indptr, data, position, n_out, nthreads):
+    """
+    Build the compressed matrix, along the minor axis, of the minor indices `i` with
+    `position[i] >= 0` of a compressed sparse matrix, `position[i]` being their index in
+    the result (so a CSC matrix gives the CSR block of the selected rows, and the other
+    way around).  The major axis is split into `nthreads` blocks of about equal nnz; each
+    block counts its entries per output index, a prefix sum over (output index, block)
+    gives every block its own write offsets, and the blocks then scatter in parallel.
+    Entries stay sorted.
+    """
+    n_major = indptr.size - 1
+    nnz = indptr[n_major]
+
+    bounds = np.zeros(nthreads + 1, dtype=np.int64)
+    for t in range(1, nthreads):
+        bounds[t] = np.searchsorted(indptr, nnz * t // nthreads)
+    bounds[nthreads] = n_major
+
+    counts = np.zeros((nthreads, n_out), dtype=np.int64)
+    for t in prange(nthreads):
+        for i in range(indptr[bounds[t]], indptr[bounds[t + 1]]):
+            p = position[indices[i]]
+            if p >= 0:
+                counts[t, p] += 1
+
+    indptr2 = np.zeros(n_out + 1, dtype=np.int64)
+    for j in prange(n_out):
+        total = 0
+        for t in range(nthreads):
+            c = counts[t, j]
+            counts[t, j] = total
+            total += c
+        indptr2[j + 1] = total
     indptr2 = np.cumsum(indptr2)
 
-    res = np.zeros_like(pair)
-    dres = np.zeros_like(data)
-    indptr3 = indptr2[:-1].copy()
-    for i in range(indices.size):
-        j = indices[i]
-        k = indptr3[j]
-        res[k] = pair[i]
-        dres[k] = data[i]
-        indptr3[j] += 1
+    res = np.empty(indptr2[n_out], dtype=indices.dtype)
+    dres = np.empty(indptr2[n_out], dtype=data.dtype)
+    for t in prange(nthreads):
+        for r in range(bounds[t], bounds[t + 1]):
+            for i in range(indptr[r], indptr[r + 1]):
+                j = position[indices[i]]
+                if j >= 0:
+                    k = indptr2[j] + counts[t, j]
+                    res[k] = r
+                    dres[k] = data[i]
+                    counts[t, j] += 1
     return dres, res, indptr2
 
 
+@njit(nogil=True)
+def _fmt_swapper(indices, indptr, data, n, nthreads):  # x,y,d,ptr):
+    """Transpose a compressed sparse matrix (CSR <-> CSC) with `n - 1` minor indices."""
+    return _gather_minor(indices, indptr, data, np.arange(n - 1), n - 1, nthreads)
+
+
+@njit(parallel=True, nogil=True)
+def _major_axis_mean_var(indptr, data, n_minor):
+    """mean and (population) variance of every major row/column of a compressed sparse matrix"""
+    n_major = indptr.size - 1
+    means = np.zeros(n_major, dtype=np.float64)
+    variances = np.zeros(n_major, dtype=np.float64)
+    for i in prange(n_major):
+        s = 0.0
+        for k in range(indptr[i], indptr[i + 1]):
+            s += data[k]
+        mu = s / n_minor
+        ss = 0.0
+        for k in range(indptr[i], indptr[i + 1]):
+            ss += (data[k] - mu) ** 2
+        ss += (n_minor - (indptr[i + 1] - indptr[i])) * mu**2
+        means[i] = mu
+        variances[i] = ss / n_minor
+    return means, variances
+
+
+# numba's default threading layer does not support concurrent parallel regions, so kernels
+# started from different threads (the background preparation thread and requests preparing
+# a layer on access) take turns; each already uses every core
+_kernel_lock = threading.Lock()
+
+# entries per block when computing statistics along the minor axis
+MINOR_STATS_BLOCK = 1 << 24
+# upper bound on the per-thread histograms of `_fmt_swapper`
+SWAPPER_HISTOGRAM_MAX_BYTES = 1 << 28
+
+
+def _kernel_threads(n):
+    """threads for `_gather_minor` with `n` output indices, within the histogram memory bound"""
+    return max(1, min(numba.get_num_threads(), SWAPPER_HISTOGRAM_MAX_BYTES // (8 * n)))
+
+
 def fmt_swapper(X):
     if X.getformat() == "csc":
-        return sp.sparse.csr_matrix(_fmt_swapper(X.indices, X.indptr, X.data, X.shape[0] + 1), shape=X.shape)
+        n = X.shape[0] + 1
     elif X.getformat() == "csr":
-        return sp.sparse.csc_matrix(_fmt_swapper(X.indices, X.indptr, X.data, X.shape[1] + 1), shape=X.shape)
+        n = X.shape[1] + 1
+    else:
+        return None
+    nthreads = _kernel_threads(n)
+    with _kernel_lock:
+        data, indices, indptr = _fmt_swapper(X.indices, X.indptr, X.data, n, nthreads)
+    if indptr[-1] <= np.iinfo(np.int32).max:
+        indptr = indptr.astype(X.indptr.dtype)
+    if X.getformat() == "csc":
+        return sp.sparse.csr_matrix((data, indices, indptr), shape=X.shape)
+    return sp.sparse.csc_matrix((data, indices, indptr), shape=X.shape)
+
+
+def _as_float(X):
+    """a float32 copy of a slice of a layer stored as integer counts (see `_compact_layer`)"""
+    return X.astype("float32") if X.dtype.kind in "ui" else X
+
+
+def _compact_layer(X):
+    """
+    Store a sparse layer with int32 indices when its nnz and shape allow and, if its values
+    are integer counts, as uint16 or uint32, which hold them exactly; the dtype itself
+    marks such layers.  The kernels read both natively; code which computes on a slice of
+    a layer in place converts it with `_as_float`.
+    """
+    if X.getformat() not in ("csr", "csc"):
+        X = X.tocsr()
+    if X.dtype.kind == "f" and X.data.size > 0:
+        integral = X.data.min() >= 0 and bool(np.all(X.data == np.floor(X.data)))
+        dtype = streaming_loader.count_dtype(integral, X.data.max())
+    else:
+        dtype = X.dtype
+    idx_dtype = np.int32 if max(X.nnz, *X.shape) < np.iinfo(np.int32).max else np.int64
+    if dtype == X.dtype and X.indices.dtype == idx_dtype and X.indptr.dtype == idx_dtype:
+        return X
+    return type(X)(
+        (
+            X.data.astype(dtype, copy=False),
+            X.indices.astype(idx_dtype, copy=False),
+            X.indptr.astype(idx_dtype, copy=False),
+        ),
+        shape=X.shape,
+        copy=False,
+    )
 
 
-"""def _create_shm(X,dtype):
-    ra = RawArray(dtype,X.size)
-    ntype = "int32" if dtype == "I" else "float32"
-    X_np = np.frombuffer(ra, dtype = ntype)
-    np.copyto(X_np, X)
-    return ra"""
+def gather_major(X, idx):
+    """
+    Return the block of the rows (if `X` is CSC) or columns (if CSR) `idx` of `X`, in the
+    other format: the CSR matrix of those rows or the CSC matrix of those columns.
+    `idx` is a boolean mask or an array of distinct indices, in the order wanted.
+    """
+    idx = np.flatnonzero(idx) if np.asarray(idx).dtype == bool else np.asarray(idx, dtype="int64")
+    n_minor = X.shape[0] if X.getformat() == "csc" else X.shape[1]
+    position = np.full(n_minor, -1, dtype="int64")
+    position[idx] = np.arange(idx.size)
+    with _kernel_lock:
+        data, indices, indptr = _gather_minor(
+            X.indices, X.indptr, X.data, position, idx.size, _kernel_threads(idx.size + 1)
+        )
+    if indptr[-1] <= np.iinfo(np.int32).max:
+        indptr = indptr.astype(X.indptr.dtype)
+    if X.getformat() == "csc":
+        return sp.sparse.csr_matrix((data, indices, indptr), shape=(idx.size, X.shape[1]))
+    return sp.sparse.csc_matrix((data, indices, indptr), shape=(X.shape[0], idx.size))
+
+
+def _prepare_layer(X):
+    """
+    Return the CSR and CSC orientations of a layer (see `_compact_layer`) and its means and
+    mean squares per gene (OBS) and per cell (VAR), as computed by `mean_variance_axis` on
+    each axis.
+    """
+    X = _compact_layer(X)
+    if X.getformat() == "csr":
+        csr, csc = X, fmt_swapper(X)
+    else:
+        csr, csc = fmt_swapper(X), X
+    return csr, csc, _layer_stats(csr, csc)
+
+
+def _minor_axis_mean_var(indices, data, n_minor, n_major):
+    """mean and (population) variance of every minor row/column of a compressed sparse matrix"""
+    sums = np.zeros(n_minor)
+    squares = np.zeros(n_minor)
+    for start in range(0, data.size, MINOR_STATS_BLOCK):
+        idx = indices[start : start + MINOR_STATS_BLOCK]
+        d = np.asarray(data[start : start + MINOR_STATS_BLOCK], dtype="float64")
+        sums += np.bincount(idx, weights=d, minlength=n_minor)
+        squares += np.bincount(idx, weights=d * d, minlength=n_minor)
+    means = sums / n_major
+    return means, np.maximum(squares / n_major - means**2, 0)
+
+
+def _layer_stats(csr, csc):
+    """
+    means, variances and mean squares of a layer per gene (OBS) and per cell (VAR); either
+    orientation may be None
+    """
+    n_obs, n_var = _some_orientation({"csr": csr, "csc": csc}).shape
+    stats = {}
+    for mode, Y, other, n_major, n_minor in (("OBS", csc, csr, n_var, n_obs), ("VAR", csr, csc, n_obs, n_var)):
+        if Y is not None:
+            with _kernel_lock:
+                mean, v = _major_axis_mean_var(Y.indptr, Y.data, n_minor)
+        else:
+            # per row/column of the dropped orientation
+            mean, v = _minor_axis_mean_var(other.indices, other.data, n_major, n_minor)
+        mean, v = mean.astype("float32"), v.astype("float32")
+        stats[mode] = (mean, v, v - mean**2)
+    return stats
+
+
+def _some_orientation(layer):
+    """the CSR matrix of a prepared layer, or its CSC matrix if it keeps only that orientation"""
+    return layer["csr"] if layer["csr"] is not None else layer["csc"]
 
 
 def _create_shm_from_data(X):
@@ -2141,51 +2446,127 @@ def _create_shm_from_data(X):
         d = ray.put(X.shape)
         gc.collect()
     else:
-        a, b, c, d = X.indices, X.indptr, X.data, X.shape
+        # shared with the local compute processes (see `worker_pool.start_local`)
+        a, b, c = (shared_arrays.share(x) for x in (X.indices, X.indptr, X.data))
+        d = X.shape
     return (a, b, c, d)
 
 
-def _read_shmem(shm, shm_csc, layer, format="csr", mode="OBS"):
+def _stored(shm, shm_csc, layer, format, mode):
+    """
+    The stored orientation which holds `layer` in `format` for `mode` (in VAR mode, CSR
+    rows are stored CSC columns), and the other one, as matrices; either is None if the
+    layer keeps a single orientation (see `_store_layer`).
+    """
+    if (format == "csr") == (mode == "OBS"):
+        store, other = shm.get(layer), shm_csc.get(layer)
+        return (
+            None if store is None else _create_data_from_shm(*store),
+            None if other is None else _create_data_from_shm_csc(*other),
+        )
+    store, other = shm_csc.get(layer), shm.get(layer)
+    return (
+        None if store is None else _create_data_from_shm_csc(*store),
+        None if other is None else _create_data_from_shm(*other),
+    )
+
+
+def _obs_format(format, mode):
+    """the format, in the cell-by-gene orientation, of a read in `format` in `mode`"""
     if mode == "OBS":
-        if format == "csr":
-            return _create_data_from_shm(*shm[layer])
+        return format
+    return "csc" if format == "csr" else "csr"
+
+
+def _read_shmem(shm, shm_csc, layer, format="csr", mode="OBS"):
+    if virtual_layers.is_virtual(shm.get(layer)):
+        # computed from the base layer, in the cell-by-gene orientation
+        vl = shm[layer]
+        X = virtual_layers.transform_full(vl, _read_shmem(shm, shm_csc, vl.base, _obs_format(format, mode), "OBS"))
+        return X if mode == "OBS" else X.T
+    if backed_layers.is_backed(shm_csc.get(layer)):
+        X = backed_layers.read(shm_csc[layer])
+        X = fmt_swapper(X) if _obs_format(format, mode) == "csr" else X
+        return X if mode == "OBS" else X.T
+
+    X, other = _stored(shm, shm_csc, layer, format, mode)
+    if X is None:
+        # single-orientation layer: transpose the stored orientation
+        X = fmt_swapper(other)
+    return X if mode == "OBS" else X.T
+
+
+def _read_shmem_major(shm, shm_csc, layer, idx, format="csr", mode="OBS"):
+    """
+    Return the rows (`format` "csr") or columns ("csc") `idx` of a layer, in `format`.
+    For a single-orientation layer, only the requested block is gathered from the stored
+    orientation (see `gather_major`), and for a virtual layer, only its values.  Genes of
+    a backed layer are read from disk, cells in a pass over the layer (see `backed_layers`).
+    """
+    if virtual_layers.is_virtual(shm.get(layer)):
+        vl = shm[layer]
+        obs_format = _obs_format(format, mode)
+        X = _read_shmem_major(shm, shm_csc, vl.base, idx, obs_format, "OBS")
+        idx = np.flatnonzero(idx) if np.asarray(idx).dtype == bool else np.asarray(idx, dtype="int64")
+        if obs_format == "csr":
+            X = virtual_layers.transform(vl, X, rows=idx)
         else:
-            return _create_data_from_shm_csc(*shm_csc[layer])
-    else:
-        if format == "csr":
-            return _create_data_from_shm_csc(*shm_csc[layer]).T
+            X = virtual_layers.transform(vl, X, cols=idx)
+        return X if mode == "OBS" else X.T
+    if backed_layers.is_backed(shm_csc.get(layer)):
+        if _obs_format(format, mode) == "csc":
+            X = backed_layers.read_columns(shm_csc[layer], idx)
         else:
-            return _create_data_from_shm(*shm[layer]).T
+            X = backed_layers.read_rows(shm_csc[layer], idx)
+        return X if mode == "OBS" else X.T
 
+    X, other = _stored(shm, shm_csc, layer, format, mode)
+    if X is None:
+        X = gather_major(other, idx)
+        return X if mode == "OBS" else X.T
+    X = X if mode == "OBS" else X.T
+    return X[idx] if format == "csr" else X[:, idx]
 
-def _create_data_from_shm(indices, indptr, data, Xsh):
+
+def _read_shmem_rows(shm, shm_csc, layer, rows, mode="OBS"):
+    """the CSR block of the rows `rows` (a mask or distinct indices) of a layer"""
+    return _read_shmem_major(shm, shm_csc, layer, rows, format="csr", mode=mode)
+
+
+def _resolve_shm(*entry):
+    """the components of a shared layer, fetching those not yet resolved (see `worker_pool`)"""
     if HOSTED_MODE:
         import ray
 
-        indices = ray.get(indices)
-        indptr = ray.get(indptr)
-        data = ray.get(data)
-        Xsh = ray.get(Xsh)
+        return tuple(ray.get(a) if isinstance(a, ray.ObjectRef) else a for a in entry)
+    return tuple(shared_arrays.attach(a) if shared_arrays.is_shared(a) else a for a in entry)
+
+
+def _create_data_from_shm(indices, indptr, data, Xsh):
+    indices, indptr, data, Xsh = _resolve_shm(indices, indptr, data, Xsh)
     return sp.sparse.csr_matrix((data, indices, indptr), shape=Xsh)
 
 
 def _create_data_from_shm_csc(indices, indptr, data, Xsh):
-    if HOSTED_MODE:
-        import ray
-
-        indices = ray.get(indices)
-        indptr = ray.get(indptr)
-        data = ray.get(data)
-        Xsh = ray.get(Xsh)
+    indices, indptr, data, Xsh = _resolve_shm(indices, indptr, data, Xsh)
     return sp.sparse.csc_matrix((data, indices, indptr), shape=Xsh)
 
 
-"""def _initializer(ishm,ishm_csc):
+def _warm_up():
+    """import the compute modules and compile the kernels, on a small layer"""
+    X = sp.sparse.random(64, 32, density=0.25, format="csr", dtype="float32", random_state=0)
+    csr, csc, _ = _prepare_layer(X)
+    gather_major(csc, np.arange(8))
+    _partial_summer(csc.data, csc.indices, csc.indptr, csc.shape[1], np.arange(32), np.arange(32, 64))
+
+
+def _initializer():
+    """set up a local compute process (see `worker_pool.start_local`)"""
+    global HOSTED_MODE
+    HOSTED_MODE = False
+    # interrupts are handled by the server, which shuts the pool down
     signal.signal(signal.SIGINT, signal.SIG_IGN)
-    global shm
-    global shm_csc
-    shm = ishm
-    shm_csc = ishm_csc"""
+    _warm_up()
 
 
 def dispersion_ranking_NN(X, nnm, weight_mode="rms"):
@@ -2241,6 +2622,26 @@ def dispersion_ranking_NN(X, nnm, weight_mode="rms"):
     return VARS
 
 
+def _read_h5ad_metadata(fn, var_mask):
+    """
+    Read everything but the expression matrices of an h5ad file, keeping the genes in
+    `var_mask`.  X is left empty, as it is after the layers have been prepared.
+    """
+    adata = anndata.read_h5ad(fn, backed="r")
+    var_mask = np.asarray(var_mask)
+    metadata = AnnData(
+        X=sp.sparse.csc_matrix((adata.shape[0], int(var_mask.sum()))).astype("float32"),
+        obs=adata.obs.copy(),
+        var=adata.var[var_mask].copy(),
+        obsm={k: np.asarray(v) for k, v in adata.obsm.items()},
+        varm={k: np.asarray(v)[var_mask] for k, v in adata.varm.items()},
+        obsp={k: v for k, v in adata.obsp.items()},
+        uns=dict(adata.uns),
+    )
+    adata.file.close()
+    return metadata
+
+
 class AnndataAdaptor(DataAdaptor):
     def __init__(self, data_locator, app_config=None, dataset_config=None):
         super().__init__(data_locator, app_config, dataset_config)
@@ -2268,9 +2669,17 @@ class AnndataAdaptor(DataAdaptor):
                 )
             except RuntimeError:
                 pass
+
+            # warmed up while the data loads
+            n_workers = self.server_config.adaptor__anndata_adaptor__compute_workers
+            worker_pool.start(n_workers or int(ray.available_resources().get("CPU", 1)), initializer=_warm_up)
         else:
             global HOSTED_MODE
             HOSTED_MODE = False
+            # one user on the desktop, who may use every worker
+            job_scheduler.set_max_running_per_user(None)
+            n_workers = self.server_config.adaptor__anndata_adaptor__compute_workers
+            worker_pool.start_local(n_workers or os.cpu_count(), initializer=_initializer)
 
         self._load_data(
             data_locator,
@@ -2278,28 +2687,12 @@ class AnndataAdaptor(DataAdaptor):
             sam_weights=app_config.sam_weights,
             preprocess=app_config.preprocess,
         )
-        # self._create_pool()
+        print("Warming up compute workers...")
+        worker_pool.wait_ready()
 
         print("Validating and initializing...")
         self._validate_and_initialize()
 
-        """print("Stabilizing multiprocessor...")
-        loop=True
-        while loop:
-            try:
-                self.pool.apply_async(_dummy).get(timeout=0.1)
-                loop=False
-            except TimeoutError:
-                pass"""
-
-    # def _create_pool(self):
-    #    self.pool = Pool(os.cpu_count(), initializer=_initializer, initargs=(self.shm_layers_csr,self.shm_layers_csc), maxtasksperchild=None)
-    # def _reset_pool(self):
-    #    self.pool.close()
-    #    self.pool.terminate()
-    #    self.pool.join()
-    #    self._create_pool()
-
     def cleanup(self):
         pass
 
@@ -2401,58 +2794,56 @@ class AnndataAdaptor(DataAdaptor):
                 raise KeyError(f"Annotation name {name}, specified in --{ax_name}-name does not exist.")
 
     def _load_data(self, data_locator, preprocess=False, sam_weights=False, root_embedding=None):
+        # with `preprocess`, X is a virtual layer over the raw counts (by default, their log1p);
+        # otherwise it is the stored matrix
+        self._virtual_layer_defs = dict(self.server_config.adaptor__anndata_adaptor__virtual_layers or {})
+        if preprocess:
+            self._virtual_layer_defs.setdefault("X", {"base": "raw_counts", "transforms": ["log1p"]})
+        else:
+            self._virtual_layer_defs.pop("X", None)
+        self._virtual_bases = {}
+
         with data_locator.local_handle() as lh:
             backed = "r" if self.server_config.adaptor__anndata_adaptor__backed else None
+            # the matrices of CSC-encoded h5ad files are read from disk on demand
+            serve_backed = backed is not None and os.path.isfile(lh) and backed_layers.is_csc(lh)
 
-            # load data from variety of formats
-            if os.path.isdir(lh) and len(glob(lh + "/*.gz")) == 0:
-                filenames = glob(lh + "/*")
-                adatas = []
-                batch = []
-                for file in filenames:
-                    if os.path.isdir(file):
-                        backed = False
-
-                for file in filenames:
-                    if os.path.isdir(file):
-                        adata = sc.read_10x_mtx(file)
-                        filt1, _ = sc.pp.filter_cells(adata, min_counts=100, inplace=False)
-                        filt2, _ = sc.pp.filter_cells(adata, min_genes=100, inplace=False)
-                        filt = np.logical_and(filt1, filt2)
-                        adata = adata[filt].copy()
-                    elif file.split(".")[-1] == "csv":
-                        adata = sc.read_csv(file)
-                        adata.X = sp.sparse.csc_matrix(adata.X)
-                    else:
-                        adata = anndata.read_h5ad(file, backed=backed)
-
-                    adatas.append(adata)
-                    batch.append([file.split(".h5ad")[0].split("/")[-1].split("\\")[-1]] * adata.shape[0])
+            # layers prepared by a previous start are reused from the sidecar cache
+            sidecar_dir = self.server_config.adaptor__anndata_adaptor__sidecar_dir
+            sidecar = None
+            if sidecar_dir is not None and os.path.isfile(lh) and not serve_backed:
+                fp = sidecar_cache.fingerprint(lh, preprocess=preprocess, sam_weights=sam_weights)
+                sidecar = sidecar_cache.sidecar_path(sidecar_dir, fp)
+            prepared = sidecar_cache.load(sidecar) if sidecar is not None else None
 
-                adata = anndata.concat(adatas, join="inner", axis=0)
-                if "orig.ident" not in adata.obs.keys():
-                    key = "orig.ident"
-                else:
-                    key = f"orig.ident.{str(hex(int(time.time())))[2:]}"
-                adata.obs[key] = pd.Categorical(np.concatenate(batch))
+            # load data from variety of formats
+            if serve_backed:
+                print("Serving layers from disk:", lh)
+                served_layers, var_mask = backed_layers.open_layers(lh)
+                adata = _read_h5ad_metadata(lh, var_mask)
+            elif prepared is None and os.path.isfile(lh) and streaming_loader.is_streamable(lh):
+                print("Streaming layers from", lh)
+                adata, prepared = self._stream_layers(lh, preprocess, sam_weights, sidecar, data_locator.islocal())
+            elif prepared is not None:
+                print("Found precomputed layers in", sidecar)
+                adata = _read_h5ad_metadata(lh, prepared["var_mask"])
+            elif os.path.isdir(lh) and len(glob(lh + "/*.gz")) == 0:
+                adata = dataset_directory.read_directory(lh)
             elif len(glob(lh + "/*.gz")) > 0:
                 adata = sc.read_10x_mtx(lh)
             else:
                 adata = anndata.read_h5ad(lh, backed=backed)
 
-            if not sparse.issparse(adata.X):
-                adata.X = sparse.csr_matrix(adata.X)
+            if prepared is None and not serve_backed:
+                if not sparse.issparse(adata.X):
+                    adata.X = sparse.csr_matrix(adata.X)
 
-            for k in adata.layers.keys():
-                if not sparse.issparse(adata.layers[k]):
-                    adata.layers[k] = sparse.csr_matrix(adata.layers[k])
+                for k in adata.layers.keys():
+                    if not sparse.issparse(adata.layers[k]):
+                        adata.layers[k] = sparse.csr_matrix(adata.layers[k])
 
-            if preprocess:
-                # target_sum = np.median(np.array(adata.X.sum(1)).flatten())
-                adata.layers["raw_counts"] = adata.X.copy()
-                # sc.pp.normalize_total(adata,target_sum=target_sum)
-                sc.pp.log1p(adata)
-                adata.layers["X"] = adata.X
+                if preprocess:
+                    adata.layers["raw_counts"] = adata.X
 
             self.rootName = self.find_valid_root_embedding(adata.obsm)
             if root_embedding is not None:
@@ -2471,65 +2862,12 @@ class AnndataAdaptor(DataAdaptor):
 
             adata.obs_names_make_unique()
 
-            _, yi = adata.X.nonzero()
-            yia, yic = np.unique(yi, return_counts=True)
-            yics = np.zeros(adata.shape[1])
-            yics[yia] = yic
-            adata = adata[:, yics >= 10].copy()
-
-            # cast all expressions to float32 if they're not already
-            if adata.X.dtype != "float32":
-                adata.X = adata.X.astype("float32")
-            for k in adata.layers.keys():
-                if adata.layers[k].dtype != "float32":
-                    adata.layers[k] = adata.layers[k].astype("float32")
-
-            adata.layers["X"] = adata.X
-            if adata.raw is not None:
-                # adata.layers[".raw"] = adata.raw.X
-                del adata.raw
-                gc.collect()
-
-            if "connectivities" in adata.obsp.keys() and sam_weights:
-                print("Found connectivities adjacency matrix. Computing SAM gene weights...")
-                var = dispersion_ranking_NN(adata.X, adata.obsp["connectivities"])
-                for k in var.keys():
-                    adata.var[k] = var[k]
-
-            print("Loading and precomputing layers necessary for fast differential expression and reembedding...")
-            self.tMeans = {"OBS": {}, "VAR": {}}
-            self.tMeanSqs = {"OBS": {}, "VAR": {}}
-
-            self.shm_layers_csr = {}
-            self.shm_layers_csc = {}
-            for k in adata.layers.keys():
-                print("Layer", k, "...")
-                if adata.X.getformat() == "csr":
-                    self.shm_layers_csr[k] = _create_shm_from_data(adata.layers[k])
-                    self.shm_layers_csc[k] = _create_shm_from_data(fmt_swapper(adata.layers[k]))
-                elif adata.X.getformat() != "csc":
-                    self.shm_layers_csr[k] = _create_shm_from_data(adata.layers[k].tocsr())
-                    self.shm_layers_csc[k] = _create_shm_from_data(adata.layers[k].tocsc())
-                else:
-                    self.shm_layers_csc[k] = _create_shm_from_data(adata.layers[k])
-                    self.shm_layers_csr[k] = _create_shm_from_data(fmt_swapper(adata.layers[k]))
-
-                mean, v = sf.mean_variance_axis(adata.layers[k], axis=0)
-                meansq = v - mean**2
-                self.tMeans["OBS"][k] = mean
-                self.tMeanSqs["OBS"][k] = meansq
-                adata.var["mean"] = mean
-                adata.var["variance"] = v
-
-                mean, v = sf.mean_variance_axis(adata.layers[k], axis=1)
-                meansq = v - mean**2
-                self.tMeans["VAR"][k] = mean
-                self.tMeanSqs["VAR"][k] = meansq
-
-                adata.layers[k] = sp.sparse.csc_matrix(adata.shape).astype("float32")
-                gc.collect()
-            adata.X = sp.sparse.csc_matrix(adata.shape).astype("float32")
-            gc.collect()
+            if serve_backed:
+                self._serve_backed_layers(adata, served_layers)
+            elif prepared is not None:
+                self._restore_layers(adata, prepared)
+            else:
+                adata = self._prepare_layers(adata, sam_weights, sidecar)
 
             for curr_axis in [adata.obs, adata.var]:
                 for ann in curr_axis:
@@ -2546,6 +2884,368 @@ class AnndataAdaptor(DataAdaptor):
             self.data = adata
             print("Finished loading the data.")
 
+    def _prepare_layers(self, adata, sam_weights, sidecar=None):
+        """
+        Filter genes, cast to float32 and build both orientations of every layer, plus
+        their means, writing the result to the `sidecar` directory if one is given.  Unless
+        `layer_preparation` is "startup", only X is prepared before returning.  Returns the
+        filtered AnnData, with its layers emptied.
+        """
+        _, yi = adata.X.nonzero()
+        yia, yic = np.unique(yi, return_counts=True)
+        yics = np.zeros(adata.shape[1])
+        yics[yia] = yic
+        var_mask = yics >= 10
+        adata = adata[:, var_mask].copy()
+
+        # cast all expressions to float32 if they're not already
+        if adata.X.dtype != "float32":
+            adata.X = adata.X.astype("float32")
+        for k in adata.layers.keys():
+            if adata.layers[k].dtype != "float32":
+                adata.layers[k] = adata.layers[k].astype("float32")
+
+        if "X" not in self._virtual_layer_defs:
+            adata.layers["X"] = adata.X
+        if adata.raw is not None:
+            # adata.layers[".raw"] = adata.raw.X
+            del adata.raw
+            gc.collect()
+
+        var_columns = {}
+        if "connectivities" in adata.obsp.keys() and sam_weights:
+            print("Found connectivities adjacency matrix. Computing SAM gene weights...")
+            var = dispersion_ranking_NN(self._full_layer("X", adata.layers), adata.obsp["connectivities"])
+            for k in var.keys():
+                adata.var[k] = var[k]
+                var_columns[k] = var[k]
+
+        # with `layer_preparation` "on_access", layers which are never used are never prepared,
+        # so no sidecar would ever be complete
+        policy = self.server_config.adaptor__anndata_adaptor__layer_preparation
+        tmp = None
+        if sidecar is not None and policy != "on_access":
+            try:
+                tmp = sidecar_cache.begin(sidecar)
+            except OSError as e:
+                print("Could not create the sidecar cache:", e)
+
+        print("Loading and precomputing layers necessary for fast differential expression and reembedding...")
+        self.tMeans = {"OBS": {}, "VAR": {}}
+        self.tMeanSqs = {"OBS": {}, "VAR": {}}
+
+        self.shm_layers_csr = {}
+        self.shm_layers_csc = {}
+        layers = list(adata.layers.keys())
+        self._register_virtual_layers(adata, adata.layers)
+
+        # X (or its base layer) is prepared now; with `layer_preparation` "background" or
+        # "on_access", the other layers are kept as they are until they are prepared (see
+        # `ensure_layers`)
+        eager = layers if policy == "startup" else [self._virtual_bases.get("X", "X")]
+        self.layer_states = {k: "preparing" if k in eager else "pending" for k in layers}
+        self._pending_layers = {k: partial(_prepare_layer, adata.layers[k]) for k in layers if k not in eager}
+        self._layer_cv = threading.Condition()
+        self._sidecar_job = None
+        if tmp is not None:
+            self._sidecar_job = {
+                "tmp": tmp,
+                "directory": sidecar,
+                "shape": adata.shape,
+                "layers": layers,
+                "var_mask": var_mask,
+                "var_columns": var_columns,
+                "written": set(),
+            }
+
+        # layers are prepared one after the other: the kernels already use every core, and
+        # numba's default threading layer runs a single parallel region at a time
+        matrices = {k: adata.layers[k] for k in eager}
+        for k in layers:
+            adata.layers[k] = sp.sparse.csc_matrix(adata.shape).astype("float32")
+        for k in eager:
+            print("Layer", k, "...")
+            # drop each layer once it is prepared, so finished layers are not held twice
+            csr, csc, stats = _prepare_layer(matrices.pop(k))
+            if k == "X":
+                mean, v, _ = stats["OBS"]
+                adata.var["mean"] = mean
+                adata.var["variance"] = v
+                var_columns["mean"] = mean
+                var_columns["variance"] = v
+            self._publish_layer(k, csr, csc, stats)
+
+            del csr, csc, stats
+            gc.collect()
+        adata.X = sp.sparse.csc_matrix(adata.shape).astype("float32")
+        gc.collect()
+
+        if self._pending_layers and policy == "background":
+            threading.Thread(target=self._prepare_pending_layers, daemon=True).start()
+        return adata
+
+    def _publish_layer(self, k, csr, csc, stats):
+        """make a prepared layer available to the compute paths, and add it to the sidecar"""
+        self._store_layer(k, csr, csc)
+        for mode in ("OBS", "VAR"):
+            mean, v, meansq = stats[mode]
+            self.tMeans[mode][k] = mean
+            self.tMeanSqs[mode][k] = meansq
+
+        with self._layer_cv:
+            job = self._sidecar_job
+        if job is not None:
+            try:
+                sidecar_cache.write_layer(
+                    job["tmp"],
+                    k,
+                    csr,
+                    csc,
+                    {m: self.tMeans[m][k] for m in self.tMeans},
+                    {m: self.tMeanSqs[m][k] for m in self.tMeanSqs},
+                )
+                with self._layer_cv:
+                    job["written"].add(k)
+                    complete = len(job["written"]) == len(job["layers"])
+                    if complete:
+                        self._sidecar_job = None
+                if complete:
+                    sidecar_cache.commit(
+                        job["tmp"], job["directory"], job["shape"], job["layers"], job["var_mask"], job["var_columns"]
+                    )
+                    print("Wrote precomputed layers to", job["directory"])
+            except OSError as e:
+                print("Could not write the sidecar cache:", e)
+                with self._layer_cv:
+                    self._sidecar_job = None
+                sidecar_cache.abort(job["tmp"])
+
+        with self._layer_cv:
+            self.layer_states[k] = "ready"
+            self._layer_cv.notify_all()
+
+    def _materialize_layer(self, k):
+        """prepare the pending layer `k`, or wait for the thread preparing it"""
+        with self._layer_cv:
+            if self.layer_states.get(k) != "pending":
+                self._layer_cv.wait_for(lambda: self.layer_states.get(k, "ready") in ("ready", "failed"))
+                return
+            self.layer_states[k] = "preparing"
+            prepare = self._pending_layers.pop(k)
+
+        print("Layer", k, "...")
+        try:
+            csr, csc, stats = prepare()
+            del prepare
+            self._publish_layer(k, csr, csc, stats)
+        except Exception as e:
+            traceback.print_exception(type(e), e, e.__traceback__)
+            with self._layer_cv:
+                self.layer_states[k] = "failed"
+                self._layer_cv.notify_all()
+        gc.collect()
+
+    def _prepare_pending_layers(self):
+        for k in list(self._pending_layers.keys()):
+            self._materialize_layer(k)
+
+    def ensure_layers(self, layers):
+        """prepare any of `layers` which are still pending, and wait until all are prepared"""
+        for k in layers:
+            k = self._virtual_bases.get(k, k)
+            if self.layer_states.get(k, "ready") != "ready":
+                self._materialize_layer(k)
+
+    def get_layer_states(self):
+        states = dict(self.layer_states)
+        for k, base in self._virtual_bases.items():
+            states[k] = self.layer_states.get(base, "ready")
+        return states
+
+    def _register_virtual_layers(self, adata, matrices):
+        """
+        Fit the virtual layers defined over the layers `matrices` (see `virtual_layers`) and
+        make them available like prepared layers.  They take their base layer's state.
+        """
+        for k, definition in self._virtual_layer_defs.items():
+            base, _ = virtual_layers.parse(definition)
+            if k in matrices or base not in matrices:
+                print(f"Skipping virtual layer {k}: {'it is a stored layer' if k in matrices else f'no layer {base}'}.")
+                continue
+            print("Virtual layer", k, "...")
+            layer, stats = virtual_layers.fit(k, definition, matrices[base])
+            self.shm_layers_csr[k] = self.shm_layers_csc[k] = layer
+            for mode in ("OBS", "VAR"):
+                mean, v, meansq = stats[mode]
+                self.tMeans[mode][k] = mean
+                self.tMeanSqs[mode][k] = meansq
+            if k == "X":
+                adata.var["mean"], adata.var["variance"], _ = stats["OBS"]
+            self._virtual_bases[k] = base
+            adata.layers[k] = sp.sparse.csc_matrix(adata.shape).astype("float32")
+
+    def _full_layer(self, k, matrices):
+        """the layer `k` of `matrices`, computed if it is a virtual layer"""
+        definition = self._virtual_layer_defs.get(k)
+        if definition is None:
+            return matrices[k]
+        layer, _ = virtual_layers.fit(k, definition, matrices[definition["base"]])
+        return virtual_layers.transform(layer, matrices[layer.base])
+
+    def _stream_layers(self, fn, preprocess, sam_weights, sidecar=None, lazy=False):
+        """
+        Prepare the layers of a CSR-encoded h5ad file out of core (see `streaming_loader`).
+        With a `sidecar` directory (unless `layer_preparation` is "on_access"), every layer is
+        written straight into it, in both orientations, and then served from it.  Otherwise
+        only the orientations kept by `layer_orientation` are built, in shared memory, and if
+        `lazy` (`fn` stays in place) and `layer_preparation` is not "startup", only X and the
+        bases of virtual layers are prepared now; the other layers are streamed from `fn`
+        when they are needed or in the background (see `ensure_layers`).  Returns the
+        metadata AnnData and the prepared state, as `sidecar_cache.load` would, plus the
+        preparations of the pending layers.
+        """
+        policy = self.server_config.adaptor__anndata_adaptor__layer_preparation
+        orientation = self.server_config.adaptor__anndata_adaptor__layer_orientation
+        shared = not HOSTED_MODE
+        tmp = None
+        if sidecar is not None and policy != "on_access":
+            try:
+                tmp = sidecar_cache.begin(sidecar)
+            except OSError as e:
+                print("Could not create the sidecar cache:", e)
+
+        names = streaming_loader.layer_names(fn, preprocess)
+        eager = names
+        if tmp is None and lazy and policy != "startup":
+            bases = {virtual_layers.parse(d)[0] for d in self._virtual_layer_defs.values()}
+            eager = [k for k in names if k == "X" or k in bases]
+
+        try:
+            layers, var_mask = streaming_loader.prepare_layers(
+                fn, preprocess=preprocess, out_dir=tmp, orientation=orientation, layers=eager, shared=shared
+            )
+        except OSError as e:
+            if tmp is None:
+                raise
+            print("Could not write the sidecar cache:", e)
+            sidecar_cache.abort(tmp)
+            tmp = None
+            layers, var_mask = streaming_loader.prepare_layers(
+                fn, preprocess=preprocess, orientation=orientation, shared=shared
+            )
+
+        tMeans = {"OBS": {}, "VAR": {}}
+        tMeanSqs = {"OBS": {}, "VAR": {}}
+        var_columns = {}
+        for k, layer in layers.items():
+            stats = _layer_stats(layer["csr"], layer["csc"])
+            for mode in ("OBS", "VAR"):
+                mean, v, meansq = stats[mode]
+                tMeans[mode][k] = mean
+                tMeanSqs[mode][k] = meansq
+            if k == "X":
+                var_columns["mean"], var_columns["variance"], _ = stats["OBS"]
+            if tmp is not None:
+                sidecar_cache.write_stats(
+                    tmp, k, {m: tMeans[m][k] for m in tMeans}, {m: tMeanSqs[m][k] for m in tMeanSqs}
+                )
+
+        adata = _read_h5ad_metadata(fn, var_mask)
+        if "connectivities" in adata.obsp.keys() and sam_weights:
+            print("Found connectivities adjacency matrix. Computing SAM gene weights...")
+            X = self._full_layer("X", {k: _some_orientation(layer) for k, layer in layers.items()})
+            var_columns.update(dispersion_ranking_NN(X, adata.obsp["connectivities"]))
+
+        prepared = {
+            "shape": adata.shape,
+            "layers": layers,
+            "tMeans": tMeans,
+            "tMeanSqs": tMeanSqs,
+            "var_mask": var_mask,
+            "var_columns": var_columns,
+        }
+        if tmp is not None:
+            try:
+                sidecar_cache.commit(tmp, sidecar, adata.shape, layers, var_mask, var_columns)
+                print("Wrote precomputed layers to", sidecar)
+                # served from the committed files, which are shared without copying them
+                prepared = sidecar_cache.load(sidecar) or prepared
+            except OSError as e:
+                print("Could not write the sidecar cache:", e)
+                sidecar_cache.abort(tmp)
+
+        prepared["pending"] = {
+            k: partial(self._stream_pending_layer, fn, preprocess, k, var_mask) for k in names if k not in eager
+        }
+        return adata, prepared
+
+    def _stream_pending_layer(self, fn, preprocess, k, var_mask):
+        """stream the layer `k` left pending by `_stream_layers`; returns it as `_prepare_layer` would"""
+        orientation = self.server_config.adaptor__anndata_adaptor__layer_orientation
+        layers, _ = streaming_loader.prepare_layers(
+            fn, preprocess=preprocess, orientation=orientation, layers=[k], var_mask=var_mask, shared=not HOSTED_MODE
+        )
+        csr, csc = layers[k]["csr"], layers[k]["csc"]
+        return csr, csc, _layer_stats(csr, csc)
+
+    def _store_layer(self, k, csr, csc):
+        """
+        Share a prepared layer with the compute workers, in the orientations kept by its
+        `layer_orientation` policy: "both", or only "csr" or "csc" for half the memory.
+        Blocks of the dropped orientation are gathered on demand (see `_read_shmem_major`).
+        """
+        kept = streaming_loader.orientations(self.server_config.adaptor__anndata_adaptor__layer_orientation, k)
+        self.shm_layers_csr[k] = _create_shm_from_data(csr) if "csr" in kept and csr is not None else None
+        self.shm_layers_csc[k] = _create_shm_from_data(csc) if "csc" in kept and csc is not None else None
+
+    def _restore_layers(self, adata, prepared):
+        """
+        use the layers and statistics prepared by a previous start (see `_prepare_layers`),
+        or streamed (see `_stream_layers`), with the preparations of any pending layers
+        """
+        pending = prepared.get("pending", {})
+        self.layer_states = {k: "ready" for k in prepared["layers"]}
+        self.layer_states.update({k: "pending" for k in pending})
+        self._pending_layers = dict(pending)
+        self._layer_cv = threading.Condition()
+        self._sidecar_job = None
+        self.tMeans = prepared["tMeans"]
+        self.tMeanSqs = prepared["tMeanSqs"]
+        self.shm_layers_csr = {}
+        self.shm_layers_csc = {}
+        for k, layer in prepared["layers"].items():
+            self._store_layer(k, layer["csr"], layer["csc"])
+        for k in self.layer_states:
+            adata.layers[k] = sp.sparse.csc_matrix(adata.shape).astype("float32")
+        for k, vals in prepared["var_columns"].items():
+            adata.var[k] = np.asarray(vals)
+        self._register_virtual_layers(adata, {k: _some_orientation(layer) for k, layer in prepared["layers"].items()})
+        if pending and self.server_config.adaptor__anndata_adaptor__layer_preparation == "background":
+            threading.Thread(target=self._prepare_pending_layers, daemon=True).start()
+
+    def _serve_backed_layers(self, adata, layers):
+        """serve `layers`, read from disk on demand (see `backed_layers`), with their statistics"""
+        if self._virtual_layer_defs:
+            print("Virtual layers, and preprocessing, are not available for layers served from disk.")
+            self._virtual_layer_defs = {}
+        self.layer_states = {k: "ready" for k in layers}
+        self.tMeans = {"OBS": {}, "VAR": {}}
+        self.tMeanSqs = {"OBS": {}, "VAR": {}}
+        self.shm_layers_csr = {}
+        self.shm_layers_csc = {}
+        for k, layer in layers.items():
+            print("Layer", k, "...")
+            stats = backed_layers.stats(layer)
+            self.shm_layers_csr[k] = None
+            self.shm_layers_csc[k] = layer
+            for mode in ("OBS", "VAR"):
+                mean, v, meansq = stats[mode]
+                self.tMeans[mode][k] = mean
+                self.tMeanSqs[mode][k] = meansq
+            if k == "X":
+                adata.var["mean"], adata.var["variance"], _ = stats["OBS"]
+            adata.layers[k] = sp.sparse.csc_matrix(adata.shape).astype("float32")
+
     def find_valid_root_embedding(self, obsm):
         root = "X_root"
         for k in obsm.keys():
@@ -2567,7 +3267,7 @@ class AnndataAdaptor(DataAdaptor):
             os.makedirs(f"{userID}/diff/")
             os.makedirs(f"{userID}/set/")
             os.makedirs(f"{userID}/output/")
-            pickle.dump("OBS", open(f"{self.guest_idhash}/mode.p", "wb"))
+            pickle_dumper("OBS", f"{self.guest_idhash}/mode.p")
 
             os.makedirs(f"{ID}/VAR/nnm/")
             os.makedirs(f"{ID}/VAR/emb/")
@@ -2591,7 +3291,7 @@ class AnndataAdaptor(DataAdaptor):
                 if dtype_name == "object" and dtype_kind == "O" or dtype.type is np.str_ or dtype.type is np.string_:
                     vals = np.array([i.replace(".", "_").replace("/", "_") for i in vals])
                 self._obs_init[k] = vals
-            pickle_dumper(np.array(list(self._obs_init.index)), f"{userID}/obs/name_0.p")
+            column_store.write_column(f"{userID}/obs", "name_0", np.array(list(self._obs_init.index)))
 
             for k in self._var_init.keys():
                 vals = np.array(list(self._var_init[k]))
@@ -2605,11 +3305,11 @@ class AnndataAdaptor(DataAdaptor):
                 if dtype_name == "object" and dtype_kind == "O" or dtype.type is np.str_ or dtype.type is np.string_:
                     vals = np.array([i.replace(".", "_").replace("/", "_") for i in vals])
                 self._var_init[k] = vals
-            pickle_dumper(np.array(list(self._var_init.index)), f"{userID}/var/name_0.p")
+            column_store.write_column(f"{userID}/var", "name_0", np.array(list(self._var_init.index)))
 
             if self._joint_mode:
-                pickle_dumper(np.array(list(self._obs_init.index)), f"{ID}/VAR/var/name_0.p")
-                pickle_dumper(np.array(list(self._var_init.index)), f"{ID}/VAR/obs/name_0.p")
+                column_store.write_column(f"{ID}/VAR/var", "name_0", np.array(list(self._obs_init.index)))
+                column_store.write_column(f"{ID}/VAR/obs", "name_0", np.array(list(self._var_init.index)))
                 common_rest.annotations_put_worker(
                     self, self._var_init, userID=self.guest_idhash + "/VAR", initVar=True
                 )
@@ -2620,33 +3320,35 @@ class AnndataAdaptor(DataAdaptor):
                     if isinstance(vals[0], np.integer):
                         if len(set(vals)) < 500:
                             vals = vals.astype("str")
-                    pickle_dumper(vals, "{}/obs/{}.p".format(userID, col.replace("/", "_")))
+                    column_store.write_column(f"{userID}/obs", col.replace("/", "_"), vals)
 
                 for col in self._var_init:
                     vals = np.array(list(self._var_init[col]))
                     if isinstance(vals[0], np.integer):
                         if len(set(vals)) < 500:
                             vals = vals.astype("str")
-                    pickle_dumper(vals, "{}/var/{}.p".format(userID, col.replace("/", "_")))
+                    column_store.write_column(f"{userID}/var", col.replace("/", "_"), vals)
 
             obsm_flag = False
             for k in self._obsm_init.keys():
                 k2 = k[2:] if k.startswith("X_") else k
-                pickle_dumper(DataAdaptor.normalize_embedding(self._obsm_init[k]), f"{userID}/emb/{k2}.p")
+                embedding_store.write_embedding(
+                    f"{userID}/emb", k2, DataAdaptor.normalize_embedding(self._obsm_init[k])
+                )
                 if self._obsm_init[k].shape[1] > 2:
-                    pickle_dumper(self._obsm_init[k], f"{userID}/pca/{k2}.p")
+                    manifest.dump_artifact(userID, "pca", k2, self._obsm_init[k])
 
                 r = self._obsp_init.get("N_" + k2, self._obsp_init.get("connectivities", None))
                 if r is None and len(self._obsp_init) > 0:
                     r = list(self._obsp_init.values())[0]
                 p = self._uns_init.get("N_" + k2 + "_params", {})
                 if r is not None:
-                    pickle_dumper(r, f"{userID}/nnm/{k2}.p")
-                    pickle_dumper(p, f"{userID}/params/{k2}.p")
+                    graph_store.write_graph(f"{userID}/nnm", k2, r)
+                    manifest.dump_artifact(userID, "params", k2, p)
                 obsm_flag = True
 
             if not obsm_flag:
-                pickle_dumper(np.zeros((self.data.shape[0], 2)), f"{ID}/OBS/emb/root.p")
+                embedding_store.write_embedding(f"{ID}/OBS/emb", "root", np.zeros((self.data.shape[0], 2)))
 
             pickle_dumper({}, f"{ID}/paired_embeddings.p")
 
@@ -2654,20 +3356,22 @@ class AnndataAdaptor(DataAdaptor):
                 varm_flag = False
                 for k in self._varm_init.keys():
                     k2 = k[2:] if k.startswith("X_") else k
-                    pickle_dumper(DataAdaptor.normalize_embedding(self._varm_init[k]), f"{ID}/VAR/emb/{k2}.p")
+                    embedding_store.write_embedding(
+                        f"{ID}/VAR/emb", k2, DataAdaptor.normalize_embedding(self._varm_init[k])
+                    )
                     if self._varm_init[k].shape[1] > 2:
-                        pickle_dumper(self._varm_init[k], f"{ID}/VAR/pca/{k2}.p")
+                        manifest.dump_artifact(f"{ID}/VAR", "pca", k2, self._varm_init[k])
 
                     r = self._varp_init.get("N_" + k2, self._varp_init.get("connectivities", None))
                     if r is None and len(self._varp_init) > 0:
                         r = list(self._varp_init.values())[0]
                     if r is not None:
-                        pickle_dumper(r, f"{ID}/VAR/nnm/{k2}.p")
-                        pickle_dumper({}, f"{ID}/VAR/params/{k2}.p")
+                        graph_store.write_graph(f"{ID}/VAR/nnm", k2, r)
+                        manifest.dump_artifact(f"{ID}/VAR", "params", k2, {})
                     varm_flag = True
 
                 if not varm_flag:
-                    pickle_dumper(np.zeros((self.data.shape[1], 2)), f"{ID}/VAR/emb/root.p")
+                    embedding_store.write_embedding(f"{ID}/VAR/emb", "root", np.zeros((self.data.shape[1], 2)))
 
     def _validate_and_initialize(self):
         if anndata_version_is_pre_070():
@@ -2791,13 +3495,13 @@ class AnndataAdaptor(DataAdaptor):
         userID = f"{annotations._get_userdata_idhash(self)}"
         if axis == Axis.OBS:
             if labels is not None and not labels.empty:
-                labels["name_0"] = pickle_loader(f"{userID}/obs/name_0.p")
+                labels["name_0"] = column_store.read_column(f"{userID}/obs", "name_0")
                 df = labels
             else:
                 df = self.data.obs
         else:
             if labels is not None and not labels.empty:
-                labels["name_0"] = pickle_loader(f"{userID}/var/name_0.p")
+                labels["name_0"] = column_store.read_column(f"{userID}/var", "name_0")
                 df = labels
             else:
                 df = self.data.var
@@ -2810,20 +3514,24 @@ class AnndataAdaptor(DataAdaptor):
     def get_embedding_names(self):
         annotations = self.dataset_config.user_annotations
         userID = f"{annotations._get_userdata_idhash(self)}"
-        fns = glob(f"{userID}/emb/*.p")
+        fns = embedding_store.list_embeddings(f"{userID}/emb")
 
         x = []
         for ann in fns:
-            ann = ann.split(".p")[0].split("/")[-1].split("\\")[-1]
-            x.push(ann[2:] if ann.startswith("X_") else ann)
+            x.append(ann[2:] if ann.startswith("X_") else ann)
         return x
 
     def get_embedding_array(self, ename, dims=2):
         annotations = self.dataset_config.user_annotations
         userID = f"{annotations._get_userdata_idhash(self)}"
-        full_embedding = pickle_loader(f"{userID}/emb/{ename}.p")[:, 0:dims]
+        full_embedding = embedding_store.read_embedding(f"{userID}/emb", ename, dims)
         return full_embedding
 
+    def get_embedding_fingerprint(self, ename):
+        annotations = self.dataset_config.user_annotations
+        userID = f"{annotations._get_userdata_idhash(self)}"
+        return embedding_store.fingerprint(f"{userID}/emb", ename)
+
     def get_embedding_array_joint(self, ename, dims=2):
         annotations = self.dataset_config.user_annotations
         userID = f"{annotations._get_userdata_idhash(self)}"
@@ -2832,11 +3540,23 @@ class AnndataAdaptor(DataAdaptor):
         otherMode = "VAR" if (userID.split("/")[-1].split("\\")[-1] == "OBS") else "OBS"
 
         if ename in paired_embeddings:
-            suffix_embedding = pickle_loader(f"{ID}/{otherMode}/emb/{paired_embeddings[ename]}.p")[:, 0:dims]
+            suffix_embedding = embedding_store.read_embedding(f"{ID}/{otherMode}/emb", paired_embeddings[ename], dims)
             return suffix_embedding
         else:
             return np.zeros((self.NAME[otherMode]["obs"].size, 2)) + 0.5
 
+    def get_embedding_fingerprint_joint(self, ename):
+        annotations = self.dataset_config.user_annotations
+        userID = f"{annotations._get_userdata_idhash(self)}"
+        ID = userID.split("/")[0].split("\\")[0]
+        paired_embeddings = pickle_loader(f"{ID}/paired_embeddings.p")
+        otherMode = "VAR" if (userID.split("/")[-1].split("\\")[-1] == "OBS") else "OBS"
+
+        if ename in paired_embeddings:
+            return embedding_store.fingerprint(f"{ID}/{otherMode}/emb", paired_embeddings[ename])
+        else:
+            return ("unpaired", otherMode, self.NAME[otherMode]["obs"].size)
+
     def get_colors(self):
         return convert_anndata_category_colors_to_cxg_category_colors(self.data)
 
@@ -2854,13 +3574,14 @@ class AnndataAdaptor(DataAdaptor):
         #    row_idx = np.arange(self.data.shape[0])
         mode = self.mode_getter()
 
-        XI = _read_shmem(self.shm_layers_csr, self.shm_layers_csc, layer, format="csc", mode=mode)
-
         if col_idx is None:
             col_idx = np.arange(self.data.shape[1])
 
+        self.ensure_layers([layer])
+        XI = _read_shmem_major(self.shm_layers_csr, self.shm_layers_csc, layer, col_idx, format="csc", mode=mode)
+
         if col_idx.size == 1:
-            i1 = col_idx[0]
+            i1 = 0
 
             d = XI.data[XI.indptr[i1] : XI.indptr[i1 + 1]]
             i = XI.indices[XI.indptr[i1] : XI.indptr[i1 + 1]]
@@ -2875,7 +3596,7 @@ class AnndataAdaptor(DataAdaptor):
                 x[x > 10] = 10
                 x[x < -10] = -10
         else:
-            x = XI[:, col_idx]
+            x = _as_float(XI)
             if logscale:
                 if sparse.issparse(x):
                     x.data[:] = bisym_log_transform(x.data)
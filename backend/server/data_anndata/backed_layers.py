@@ -0,0 +1,225 @@
+"""
+Layers read on demand from a CSC-encoded h5ad file.
+
+With `backed` set, an h5ad file whose X and layers are all stored as CSC matrices is
+served without loading its matrices: a BackedLayer names a matrix of the file and the
+genes kept by the gene filter, and the compute paths read its columns through h5py.
+Columns are read in blocks of BLOCK_COLUMNS genes of the file, which are kept in a
+process-wide LRU of at most `set_max_bytes` bytes, so the genes being explored are read
+from disk once while the matrices are never held in full.
+
+Reading genes is what backed layers are for.  Reading cells, and computing statistics,
+takes a pass over all blocks of the layer; passes bypass the cache, so they do not evict
+the blocks being explored.
+"""
+
+import threading
+from collections import OrderedDict
+
+import h5py
+import numpy as np
+import scipy.sparse as sparse
+
+BLOCK_COLUMNS = 256
+DEFAULT_MAX_BYTES = 1 << 30
+# genes with fewer nonzero entries in X are dropped, as when the whole file is loaded
+MIN_CELLS = 10
+
+_lock = threading.Lock()
+_files = {}  # file name -> h5py.File, opened once per process
+_blocks = OrderedDict()  # (file name, matrix, block) -> (indptr, indices, data)
+_nbytes = 0
+_max_bytes = DEFAULT_MAX_BYTES
+
+
+class BackedLayer:
+    """the CSC matrix `path` of the h5ad file `fn`, restricted to the file's columns `columns`"""
+
+    def __init__(self, fn, path, columns, n_obs, dtype):
+        self.fn = fn
+        self.path = path
+        self.columns = columns
+        self.shape = (n_obs, columns.size)
+        self.dtype = dtype
+
+
+def set_max_bytes(max_bytes):
+    """set the block cache size bound.  A bound of 0 (or None) disables the cache."""
+    global _max_bytes
+    with _lock:
+        _max_bytes = max_bytes or 0
+        _evict()
+
+
+def _evict():
+    global _nbytes
+    while _blocks and _nbytes > _max_bytes:
+        _, block = _blocks.popitem(last=False)
+        _nbytes -= sum(a.nbytes for a in block)
+
+
+def _encoding(group):
+    if not isinstance(group, h5py.Group):
+        return None
+    encoding = group.attrs.get("encoding-type", group.attrs.get("h5sparse_format"))
+    return encoding.decode() if isinstance(encoding, bytes) else encoding
+
+
+def is_csc(fn):
+    """True if X and every layer of the h5ad file `fn` are stored as CSC matrices"""
+    try:
+        with h5py.File(fn, "r") as f:
+            paths = ["X"] + [f"layers/{k}" for k in f.get("layers", {})]
+            return all(_encoding(f.get(path)) in ("csc_matrix", "csc") for path in paths)
+    except (OSError, KeyError, TypeError):
+        return False
+
+
+def _file(fn):
+    with _lock:
+        f = _files.get(fn)
+        if f is None or not f.id.valid:
+            f = _files[fn] = h5py.File(fn, "r")
+        return f
+
+
+def open_layers(fn):
+    """
+    Return the BackedLayers of X (as "X") and of every layer of the h5ad file `fn` (see
+    `is_csc`), keeping the genes with at least MIN_CELLS nonzero entries in X, and the mask
+    of the genes kept.  X is read once, a block at a time, to count them.
+    """
+    f = _file(fn)
+    X = f["X"]
+    n_obs, n_var = (int(i) for i in X.attrs.get("shape", X.attrs.get("h5sparse_shape")))
+
+    # explicit zeros are not counted, as by the other loaders
+    nonzeros = np.zeros(n_var, dtype="int64")
+    for start, end, M in iter_blocks(BackedLayer(fn, "X", np.arange(n_var), n_obs, X["data"].dtype)):
+        cols = np.repeat(np.arange(end - start), np.diff(M.indptr))
+        nonzeros[start:end] = np.bincount(cols[M.data != 0], minlength=end - start)
+    var_mask = nonzeros >= MIN_CELLS
+    columns = np.flatnonzero(var_mask)
+
+    layers = {"X": BackedLayer(fn, "X", columns, n_obs, X["data"].dtype)}
+    for k in f.get("layers", {}):
+        layers[k] = BackedLayer(fn, f"layers/{k}", columns, n_obs, f["layers"][k]["data"].dtype)
+    return layers, var_mask
+
+
+def _block(layer, b, cache=True):
+    """the column pointers, rows and values of the columns of block `b` of the file's matrix"""
+    global _nbytes
+    key = (layer.fn, layer.path, b)
+    with _lock:
+        block = _blocks.get(key)
+        if block is not None:
+            _blocks.move_to_end(key)
+            return block
+
+    group = _file(layer.fn)[layer.path]
+    n = group["indptr"].shape[0] - 1
+    indptr = group["indptr"][b * BLOCK_COLUMNS : min((b + 1) * BLOCK_COLUMNS, n) + 1].astype("int64")
+    lo, hi = indptr[0], indptr[-1]
+    block = (indptr - lo, group["indices"][lo:hi], group["data"][lo:hi])
+
+    if cache:
+        with _lock:
+            if key not in _blocks:
+                _blocks[key] = block
+                _nbytes += sum(a.nbytes for a in block)
+                _evict()
+    return block
+
+
+def _ranges(starts, lengths):
+    """the concatenated ranges [start, start + length)"""
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(offsets.size)
+
+
+def read_columns(layer, idx, cache=True):
+    """the CSC matrix of the genes `idx` (a mask or indices, in the order wanted) of `layer`"""
+    idx = np.flatnonzero(idx) if np.asarray(idx).dtype == bool else np.asarray(idx, dtype="int64").ravel()
+    cols = layer.columns[idx]
+    blocks = cols // BLOCK_COLUMNS
+
+    parts = []
+    lengths = np.zeros(idx.size, dtype="int64")
+    for b in np.unique(blocks):
+        indptr, indices, data = _block(layer, b, cache)
+        sel = np.flatnonzero(blocks == b)
+        local = cols[sel] - b * BLOCK_COLUMNS
+        lengths[sel] = indptr[local + 1] - indptr[local]
+        parts.append((sel, _ranges(indptr[local], lengths[sel]), indices, data))
+
+    out_indptr = np.zeros(idx.size + 1, dtype="int64")
+    np.cumsum(lengths, out=out_indptr[1:])
+    out_indices = np.empty(out_indptr[-1], dtype="int64")
+    out_data = np.empty(out_indptr[-1], dtype=layer.dtype)
+    for sel, source, indices, data in parts:
+        destination = _ranges(out_indptr[sel], lengths[sel])
+        out_indices[destination] = indices[source]
+        out_data[destination] = data[source]
+    return sparse.csc_matrix((out_data, out_indices, out_indptr), shape=(layer.shape[0], idx.size))
+
+
+def iter_blocks(layer):
+    """yield (first gene, last gene + 1, CSC matrix of those genes) for all genes of `layer`"""
+    blocks = layer.columns // BLOCK_COLUMNS
+    bounds = np.flatnonzero(np.diff(blocks)) + 1
+    for start, end in zip(np.r_[0, bounds], np.r_[bounds, blocks.size]):
+        yield start, end, read_columns(layer, np.arange(start, end), cache=False)
+
+
+def read(layer):
+    """the whole of `layer`, as a CSC matrix"""
+    return sparse.hstack([X for _, _, X in iter_blocks(layer)], format="csc")
+
+
+def read_rows(layer, rows):
+    """the CSR matrix of the cells `rows` (a mask or distinct indices, in the order wanted) of `layer`"""
+    rows = np.flatnonzero(rows) if np.asarray(rows).dtype == bool else np.asarray(rows, dtype="int64").ravel()
+    position = np.full(layer.shape[0], -1, dtype="int64")
+    position[rows] = np.arange(rows.size)
+
+    r, c, d = [], [], []
+    for start, _, X in iter_blocks(layer):
+        p = position[X.indices]
+        keep = p >= 0
+        r.append(p[keep])
+        c.append(np.repeat(np.arange(start, start + X.shape[1]), np.diff(X.indptr))[keep])
+        d.append(X.data[keep])
+    shape = (rows.size, layer.shape[1])
+    if not r:
+        return sparse.csr_matrix(shape, dtype=layer.dtype)
+    return sparse.csr_matrix((np.concatenate(d), (np.concatenate(r), np.concatenate(c))), shape=shape)
+
+
+def stats(layer):
+    """
+    The statistics of `layer`, as {mode: (mean, variance, variance - mean**2)} per gene
+    (OBS) and per cell (VAR), like those of loaded layers; computed in one pass.
+    """
+    n_obs, n_var = layer.shape
+    col_sum, col_sq = np.zeros(n_var), np.zeros(n_var)
+    row_sum, row_sq = np.zeros(n_obs), np.zeros(n_obs)
+    for start, end, X in iter_blocks(layer):
+        data = X.data.astype("float64")
+        cols = np.repeat(np.arange(end - start), np.diff(X.indptr))
+        col_sum[start:end] = np.bincount(cols, weights=data, minlength=end - start)
+        col_sq[start:end] = np.bincount(cols, weights=data**2, minlength=end - start)
+        row_sum += np.bincount(X.indices, weights=data, minlength=n_obs)
+        row_sq += np.bincount(X.indices, weights=data**2, minlength=n_obs)
+
+    result = {}
+    for mode, (s, sq, n) in (("OBS", (col_sum, col_sq, n_obs)), ("VAR", (row_sum, row_sq, n_var))):
+        mean = s / n
+        v = np.maximum(sq / n - mean**2, 0)
+        mean, v = mean.astype("float32"), v.astype("float32")
+        result[mode] = (mean, v, v - mean**2)
+    return result
+
+
+def is_backed(entry):
+    return isinstance(entry, BackedLayer)
@@ -0,0 +1,162 @@
+"""
+Scheduling of the compute jobs of the server onto its workers (see `worker_pool`).
+
+Every job has a priority class: "interactive" for the short jobs a user waits on (eg,
+diffexp) and "batch" for long ones (eg, reembedding).  A free worker takes the next job
+
+    1. of the first class in JOB_CLASSES with a job which may start, so interactive jobs
+       never queue behind batch jobs; batch jobs leave one worker free for interactive
+       ones (if there is more than one worker);
+    2. within that class, from the users in turn, skipping users who already run
+       `set_max_running_per_user` jobs, so that one user's burst of jobs does not hold
+       back everyone else's.
+
+A queued job may be taken off the queue again with `remove` (see `worker_pool.cancel`).
+Queue depth, wait times and run times are counted per class (see `stats`).
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+JOB_CLASSES = ("interactive", "batch")
+DEFAULT_MAX_RUNNING_PER_USER = 2
+
+_cv = threading.Condition()
+_queues = {c: OrderedDict() for c in JOB_CLASSES}  # class -> user -> deque of (job, time queued)
+_running = {}  # user -> number of running jobs
+_running_per_class = {c: 0 for c in JOB_CLASSES}
+_max_running_per_user = DEFAULT_MAX_RUNNING_PER_USER
+_max_batch_running = None
+_metrics = {
+    c: {
+        "submitted": 0,
+        "started": 0,
+        "completed": 0,
+        "failed": 0,
+        "cancelled": 0,
+        "wait_total": 0.0,
+        "wait_max": 0.0,
+        "run_total": 0.0,
+        "run_max": 0.0,
+    }
+    for c in JOB_CLASSES
+}
+
+
+def set_max_running_per_user(max_running):
+    """set the number of jobs a user may run at once.  A bound of 0 (or None) disables it."""
+    global _max_running_per_user
+    with _cv:
+        _max_running_per_user = max_running or 0
+        _cv.notify_all()
+
+
+def set_workers(n_workers):
+    """set the number of workers taking jobs, of which batch jobs leave one to interactive jobs"""
+    global _max_batch_running
+    with _cv:
+        _max_batch_running = n_workers - 1 if n_workers > 1 else None
+        _cv.notify_all()
+
+
+def submit(job, job_class, user):
+    """queue `job` for `user` in `job_class`"""
+    if job_class not in JOB_CLASSES:
+        raise ValueError(f"Unknown job class {job_class}, expected one of {', '.join(JOB_CLASSES)}.")
+    with _cv:
+        _queues[job_class].setdefault(user, deque()).append((job, time.time()))
+        _metrics[job_class]["submitted"] += 1
+        _cv.notify()
+
+
+def remove(job, job_class, user):
+    """take `job` off the queue, if it has not started; True if it was taken off"""
+    with _cv:
+        jobs = _queues[job_class].get(user)
+        for i, (queued_job, _) in enumerate(jobs or ()):
+            if queued_job is job:
+                del jobs[i]
+                if not jobs:
+                    del _queues[job_class][user]
+                _metrics[job_class]["cancelled"] += 1
+                return True
+        return False
+
+
+def _pick():
+    for job_class in JOB_CLASSES:
+        if job_class == "batch" and _max_batch_running is not None:
+            if _running_per_class[job_class] >= _max_batch_running:
+                continue
+        users = _queues[job_class]
+        for user in list(users):
+            if _max_running_per_user and _running.get(user, 0) >= _max_running_per_user:
+                continue
+            jobs = users.pop(user)
+            job, queued = jobs.popleft()
+            if jobs:
+                # to the back of the line
+                users[user] = jobs
+            return job_class, user, job, queued
+    return None
+
+
+def next_job():
+    """
+    Wait for the next job which may start, and return it with the ticket to pass to `done`
+    when it finishes.
+    """
+    with _cv:
+        picked = _pick()
+        while picked is None:
+            _cv.wait()
+            picked = _pick()
+        job_class, user, job, queued = picked
+        started = time.time()
+        _running[user] = _running.get(user, 0) + 1
+        _running_per_class[job_class] += 1
+        metrics = _metrics[job_class]
+        metrics["started"] += 1
+        metrics["wait_total"] += started - queued
+        metrics["wait_max"] = max(metrics["wait_max"], started - queued)
+    return job, (job_class, user, started)
+
+
+def done(ticket, outcome="completed"):
+    """record the end of the job of `ticket` (see `next_job`) as "completed", "failed" or "cancelled" (`outcome`)"""
+    job_class, user, started = ticket
+    elapsed = time.time() - started
+    with _cv:
+        _running[user] -= 1
+        if _running[user] == 0:
+            del _running[user]
+        _running_per_class[job_class] -= 1
+        metrics = _metrics[job_class]
+        metrics[outcome] += 1
+        metrics["run_total"] += elapsed
+        metrics["run_max"] = max(metrics["run_max"], elapsed)
+        _cv.notify_all()
+
+
+def stats():
+    """return per-class queue depth, running jobs and wait and run times (in seconds)"""
+    with _cv:
+        result = {}
+        for job_class in JOB_CLASSES:
+            metrics = _metrics[job_class]
+            started = metrics["started"]
+            finished = started - _running_per_class[job_class]
+            result[job_class] = {
+                "queued": sum(len(jobs) for jobs in _queues[job_class].values()),
+                "running": _running_per_class[job_class],
+                "submitted": metrics["submitted"],
+                "completed": metrics["completed"],
+                "failed": metrics["failed"],
+                "cancelled": metrics["cancelled"],
+                "wait_mean": metrics["wait_total"] / started if started else 0.0,
+                "wait_max": metrics["wait_max"],
+                "run_mean": metrics["run_total"] / finished if finished else 0.0,
+                "run_max": metrics["run_max"],
+            }
+        return result
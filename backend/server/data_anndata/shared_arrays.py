@@ -0,0 +1,143 @@
+"""
+Arrays shared with the local compute processes (see `worker_pool.start_local`).
+
+`share` copies an array into a `multiprocessing.shared_memory` segment once (or, for an
+array memory-mapped from a file, such as a layer of the sidecar cache, or one allocated in
+a segment with `empty`, only records where it is) and returns a small picklable
+descriptor.  `attach` returns a zero-copy view of the
+array of a descriptor, in any process, mapping every segment or file once per process.
+Views are read-only, as are the layers fetched from the Ray object store when hosted.
+Segments are owned by the process which created them, and unlinked when it exits.
+"""
+
+import atexit
+import mmap
+import os
+import threading
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+_lock = threading.Lock()
+_owned = {}  # segment name -> SharedMemory created by this process
+_segments = {}  # segment name -> SharedMemory attached by this process
+_views = {}  # descriptor key -> array
+_allocated = {}  # id of an array returned by `empty` -> (weak reference to it, segment name)
+
+
+class SharedArray:
+    """the location of a shared array: a shared memory segment, or a file and an offset"""
+
+    def __init__(self, dtype, shape, name=None, filename=None, offset=0):
+        self.dtype = dtype
+        self.shape = shape
+        self.name = name
+        self.filename = filename
+        self.offset = offset
+
+    @property
+    def key(self):
+        return self.name if self.name is not None else (self.filename, self.offset)
+
+
+def _is_mapped_file(a):
+    # a whole memory-mapped file, not a view of one, whose file is still in place
+    return (
+        isinstance(a, np.memmap)
+        and isinstance(a.base, mmap.mmap)
+        and a.filename is not None
+        and os.path.isfile(a.filename)
+    )
+
+
+def _allocated_segment(a):
+    with _lock:
+        ref, name = _allocated.get(id(a), (None, None))
+    return name if ref is not None and ref() is a else None
+
+
+def empty(shape, dtype):
+    """
+    Return an uninitialized array in a new shared memory segment, which `share` records
+    without copying.  Arrays built in place this way are only held once.
+    """
+    dtype = np.dtype(dtype)
+    segment = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+    a = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+    with _lock:
+        _owned[segment.name] = segment
+        _allocated[id(a)] = (weakref.ref(a, lambda _, key=id(a): _allocated.pop(key, None)), segment.name)
+    return a
+
+
+def share(a):
+    """return the descriptor of a shared copy of the array `a`"""
+    name = _allocated_segment(a)
+    if name is not None:
+        with _lock:
+            segment = _owned[name]
+        view = np.ndarray(a.shape, dtype=a.dtype, buffer=segment.buf)
+        view.flags.writeable = False
+        shared = SharedArray(a.dtype.str, a.shape, name=name)
+    elif _is_mapped_file(a):
+        shared = SharedArray(a.dtype.str, a.shape, filename=a.filename, offset=a.offset)
+        view = a
+    else:
+        segment = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        view = np.ndarray(a.shape, dtype=a.dtype, buffer=segment.buf)
+        view[...] = a
+        view.flags.writeable = False
+        shared = SharedArray(a.dtype.str, a.shape, name=segment.name)
+        with _lock:
+            _owned[segment.name] = segment
+    with _lock:
+        _views[shared.key] = view
+    return shared
+
+
+def _open(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before Python 3.13 attaching registers the segment with the resource tracker,
+        # which the workers share with the owner (see `ensure_tracker`), so it is only
+        # unlinked by the owner
+        return shared_memory.SharedMemory(name=name)
+
+
+def attach(shared):
+    """return a view of the shared array `shared` (see `share`)"""
+    with _lock:
+        view = _views.get(shared.key)
+        if view is None:
+            if shared.name is None:
+                view = np.memmap(
+                    shared.filename, dtype=shared.dtype, mode="r", offset=shared.offset, shape=shared.shape
+                )
+            else:
+                segment = _segments[shared.name] = _open(shared.name)
+                view = np.ndarray(shared.shape, dtype=shared.dtype, buffer=segment.buf)
+                view.flags.writeable = False
+            _views[shared.key] = view
+    return view
+
+
+def ensure_tracker():
+    """start the resource tracker, so the processes started from now on share it with this one"""
+    resource_tracker.ensure_running()
+
+
+def is_shared(x):
+    return isinstance(x, SharedArray)
+
+
+@atexit.register
+def _unlink():
+    with _lock:
+        for segment in _owned.values():
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+        _owned.clear()
@@ -0,0 +1,161 @@
+"""
+Sidecar cache of the layers prepared when an h5ad file is loaded.
+
+Loading a dataset filters out rarely expressed genes, casts every layer to float32, builds
+both the CSR and the CSC orientation of each layer and computes per-gene and per-cell
+means.  For large datasets this takes much longer than reading the file, so the result is
+written once to a sidecar directory and memory-mapped on later starts:
+
+    {sidecar_dir}/{fingerprint}/
+        meta.json                       layer names, shape, var columns
+        var_mask.npy                    genes kept by the filter
+        var.{column}.npy                var columns computed while loading (eg, mean)
+        {layer}.{csr,csc}.{indices,indptr,data}.npy
+        {layer}.{OBS,VAR}.{mean,meansq}.npy
+
+The fingerprint hashes the file size and modification time and a sample of its contents
+(the head, the tail and evenly spaced blocks in between) together with the load options,
+without reading the whole file.  The modification time catches files rewritten in place
+with the same size; a remote dataset is fetched once into the download cache, where it
+keeps its modification time, so its sidecar is still found on later starts.  A sidecar
+is written to a temporary directory and renamed into place once complete, so a partially
+written one is never used; the temporary directories left by processes which stopped
+before completing theirs are removed by the next `begin`.
+"""
+
+import glob
+import json
+import os
+import shutil
+from hashlib import blake2b
+
+import numpy as np
+import scipy.sparse as sparse
+
+import backend.server.common.workspace.fsutils as fsutils
+
+VERSION = 1
+META = "meta.json"
+SAMPLE_BLOCKS = 64
+SAMPLE_BLOCK_SIZE = 1 << 16
+COMPONENTS = ("indices", "indptr", "data")
+
+
+def fingerprint(path, **options):
+    """return a fingerprint of the file at `path` and the options it is loaded with"""
+    h = blake2b(digest_size=16)
+    st = os.stat(path)
+    size = st.st_size
+    key = {"version": VERSION, "size": size, "mtime": st.st_mtime_ns, "options": options}
+    h.update(json.dumps(key, sort_keys=True).encode())
+    with open(path, "rb") as f:
+        for offset in np.linspace(0, max(size - SAMPLE_BLOCK_SIZE, 0), SAMPLE_BLOCKS, dtype="int64"):
+            f.seek(int(offset))
+            h.update(f.read(SAMPLE_BLOCK_SIZE))
+    return h.hexdigest()
+
+
+def sidecar_path(sidecar_dir, fp):
+    return os.path.join(sidecar_dir, fp)
+
+
+def layer_file(directory, layer, orientation, component):
+    return os.path.join(directory, f"{layer}.{orientation}.{component}.npy")
+
+
+def _stat_file(directory, layer, mode, stat):
+    return os.path.join(directory, f"{layer}.{mode}.{stat}.npy")
+
+
+def load(directory):
+    """
+    Return the prepared state stored in `directory`, or None if there is no complete
+    sidecar.  All arrays are memory-mapped.
+    """
+    try:
+        with open(os.path.join(directory, META)) as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if meta.get("version") != VERSION:
+        return None
+
+    def mmap(fn):
+        return np.load(fn, mmap_mode="r")
+
+    shape = tuple(meta["shape"])
+    layers = {}
+    tMeans = {"OBS": {}, "VAR": {}}
+    tMeanSqs = {"OBS": {}, "VAR": {}}
+    for layer in meta["layers"]:
+        csr = [mmap(layer_file(directory, layer, "csr", c)) for c in COMPONENTS]
+        csc = [mmap(layer_file(directory, layer, "csc", c)) for c in COMPONENTS]
+        layers[layer] = {
+            "csr": sparse.csr_matrix((csr[2], csr[0], csr[1]), shape=shape, copy=False),
+            "csc": sparse.csc_matrix((csc[2], csc[0], csc[1]), shape=shape, copy=False),
+        }
+        for mode in ("OBS", "VAR"):
+            tMeans[mode][layer] = mmap(_stat_file(directory, layer, mode, "mean"))
+            tMeanSqs[mode][layer] = mmap(_stat_file(directory, layer, mode, "meansq"))
+
+    return {
+        "shape": shape,
+        "layers": layers,
+        "tMeans": tMeans,
+        "tMeanSqs": tMeanSqs,
+        "var_mask": mmap(os.path.join(directory, "var_mask.npy")),
+        "var_columns": {c: mmap(os.path.join(directory, f"var.{c}.npy")) for c in meta["var_columns"]},
+    }
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def begin(directory):
+    """start writing a sidecar; returns the temporary directory to write it to"""
+    tmp = f"{directory}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    # those of processes which stopped before committing theirs
+    for stale in glob.glob(f"{glob.escape(directory)}.*.tmp"):
+        pid = stale[len(directory) + 1 : -len(".tmp")]
+        if pid.isdigit() and not _is_running(int(pid)):
+            shutil.rmtree(stale, ignore_errors=True)
+    os.makedirs(tmp)
+    return tmp
+
+
+def write_layer(tmp, layer, csr, csc, tMeans, tMeanSqs):
+    """store a prepared layer: both orientations and the per-mode statistics"""
+    for orientation, X in (("csr", csr), ("csc", csc)):
+        for c in COMPONENTS:
+            np.save(layer_file(tmp, layer, orientation, c), getattr(X, c))
+    write_stats(tmp, layer, tMeans, tMeanSqs)
+
+
+def write_stats(tmp, layer, tMeans, tMeanSqs):
+    """store the per-mode statistics of a layer whose components were written to `layer_file`s"""
+    for mode in ("OBS", "VAR"):
+        np.save(_stat_file(tmp, layer, mode, "mean"), tMeans[mode])
+        np.save(_stat_file(tmp, layer, mode, "meansq"), tMeanSqs[mode])
+
+
+def commit(tmp, directory, shape, layers, var_mask, var_columns):
+    """finish a sidecar started with `begin` and move it into place"""
+    np.save(os.path.join(tmp, "var_mask.npy"), np.asarray(var_mask, dtype=bool))
+    for c, vals in var_columns.items():
+        np.save(os.path.join(tmp, f"var.{c}.npy"), np.asarray(vals))
+    meta = {"version": VERSION, "shape": list(shape), "layers": list(layers), "var_columns": list(var_columns)}
+    fsutils.atomic_write_json(os.path.join(tmp, META), meta)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+
+
+def abort(tmp):
+    shutil.rmtree(tmp, ignore_errors=True)
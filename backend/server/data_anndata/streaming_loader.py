@@ -0,0 +1,231 @@
+"""
+Out-of-core preparation of the layers of an h5ad file.
+
+Reading a dataset with `anndata.read_h5ad` and then filtering, casting and transposing it
+holds several full copies of the matrix at once.  For h5ad files whose X and layers are
+stored as CSR matrices, `prepare_layers` instead streams row blocks of about `CHUNK_NNZ`
+entries from the file, twice per matrix:
+
+    1. count the entries of every column (for X, also the nonzero entries, which decide
+       the genes kept by the gene filter);
+    2. filter the genes, cast to float32 (or, for integer counts, to the smallest unsigned
+       dtype which holds them) and write the block into preallocated CSR and CSC buffers,
+       the latter through per-column write cursors.
+
+Rows are visited in order, so the CSC columns come out sorted.  The buffers are
+memory-mapped `.npy` files when an output directory is given (the sidecar being written,
+see `sidecar_cache`) and arrays otherwise -- allocated in shared memory with `shared`, so
+sharing them with the compute processes copies nothing -- and peak memory stays near the
+size of the prepared layers plus one block.  Without an output directory, only the
+orientations kept by the `orientation` policy (see `_store_layer` in `anndata_adaptor`)
+are built; a sidecar always holds both, so that it serves any policy.
+"""
+
+import h5py
+import numpy as np
+import scipy.sparse as sparse
+
+import backend.server.data_anndata.shared_arrays as shared_arrays
+import backend.server.data_anndata.sidecar_cache as sidecar_cache
+
+CHUNK_NNZ = 1 << 23
+# genes with fewer nonzero entries in X are dropped, as when the whole file is loaded
+MIN_CELLS = 10
+
+
+def _is_csr(group):
+    if not isinstance(group, h5py.Group):
+        return False
+    encoding = group.attrs.get("encoding-type", group.attrs.get("h5sparse_format"))
+    if isinstance(encoding, bytes):
+        encoding = encoding.decode()
+    return encoding in ("csr_matrix", "csr")
+
+
+def _shape(group):
+    return tuple(int(i) for i in group.attrs.get("shape", group.attrs.get("h5sparse_shape")))
+
+
+def is_streamable(fn):
+    """True if X and every layer of the h5ad file `fn` are stored as CSR matrices"""
+    try:
+        with h5py.File(fn, "r") as f:
+            if "X" not in f or not _is_csr(f["X"]):
+                return False
+            return all(_is_csr(f["layers"][k]) for k in f.get("layers", {}))
+    except (OSError, KeyError, TypeError):
+        return False
+
+
+def layer_names(fn, preprocess=False):
+    """the names of the layers `prepare_layers` prepares from the h5ad file `fn`"""
+    with h5py.File(fn, "r") as f:
+        names = list(f.get("layers", {}))
+    return names + ["raw_counts" if preprocess else "X"]
+
+
+def orientations(policy, layer):
+    """the orientations of `layer` kept by an orientation policy ("both", "csr", "csc" or a dict of them)"""
+    orientation = policy.get(layer, "both") if isinstance(policy, dict) else policy
+    return ("csr", "csc") if orientation == "both" else (orientation,)
+
+
+def _chunks(indptr, chunk_nnz=CHUNK_NNZ):
+    """split the rows into blocks of about `chunk_nnz` entries, as (first row, last row + 1)"""
+    n = indptr.size - 1
+    start = 0
+    while start < n:
+        end = int(np.searchsorted(indptr, indptr[start] + chunk_nnz, side="right")) - 1
+        end = min(max(end, start + 1), n)
+        yield start, end
+        start = end
+
+
+def count_dtype(integral, max_value):
+    """the unsigned dtype which stores integer counts up to `max_value` exactly, or float32"""
+    if not integral:
+        return np.dtype("float32")
+    for dtype in ("uint16", "uint32"):
+        if max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype("float32")
+
+
+def _count_columns(group, indptr, n_var, nonzero=False):
+    """
+    Return the number of entries (and, if `nonzero`, of nonzero entries) in every column,
+    and the dtype which stores the values exactly (see `count_dtype`).
+    """
+    counts = np.zeros(n_var, dtype="int64")
+    nonzeros = np.zeros(n_var, dtype="int64") if nonzero else None
+    integral = True
+    max_value = 0
+    for start, end in _chunks(indptr):
+        lo, hi = indptr[start], indptr[end]
+        indices = group["indices"][lo:hi]
+        data = group["data"][lo:hi]
+        counts += np.bincount(indices, minlength=n_var)
+        if nonzero:
+            nonzeros += np.bincount(indices[data != 0], minlength=n_var)
+        if integral and data.size > 0:
+            integral = data.min() >= 0 and bool(np.all(data == np.floor(data)))
+            max_value = max(max_value, data.max())
+    return counts, nonzeros, count_dtype(integral, max_value)
+
+
+def _allocate(out_dir, layer, orientation, component, dtype, size, shared=False):
+    if out_dir is None:
+        return shared_arrays.empty(size, dtype) if shared else np.empty(size, dtype=dtype)
+    fn = sidecar_cache.layer_file(out_dir, layer, orientation, component)
+    return np.lib.format.open_memmap(fn, mode="w+", dtype=dtype, shape=(size,))
+
+
+def _stream_layer(
+    group, indptr, shape, var_mask, counts, dtype, layer, out_dir=None, kept=("csr", "csc"), shared=False
+):
+    n_obs = shape[0]
+    n_var = int(var_mask.sum())
+    remap = np.full(var_mask.size, -1, dtype="int64")
+    remap[var_mask] = np.arange(n_var)
+
+    kept_counts = counts[var_mask]
+    nnz = int(kept_counts.sum())
+    idx_dtype = "int32" if max(nnz, n_obs, n_var) < np.iinfo(np.int32).max else "int64"
+    build_csr = "csr" in kept or out_dir is not None
+    build_csc = "csc" in kept or out_dir is not None
+
+    def allocate(orientation, component, component_dtype, size):
+        return _allocate(out_dir, layer, orientation, component, component_dtype, size, shared)
+
+    if build_csr:
+        csr_indptr = allocate("csr", "indptr", idx_dtype, n_obs + 1)
+        csr_indices = allocate("csr", "indices", idx_dtype, nnz)
+        csr_data = allocate("csr", "data", dtype, nnz)
+        csr_indptr[0] = 0
+    if build_csc:
+        csc_indptr = allocate("csc", "indptr", idx_dtype, n_var + 1)
+        csc_indices = allocate("csc", "indices", idx_dtype, nnz)
+        csc_data = allocate("csc", "data", dtype, nnz)
+        csc_indptr[0] = 0
+        np.cumsum(kept_counts, out=csc_indptr[1:])
+        cursors = np.array(csc_indptr[:-1], dtype="int64")
+    position = 0
+
+    for start, end in _chunks(indptr):
+        lo, hi = indptr[start], indptr[end]
+        cols = remap[group["indices"][lo:hi]]
+        vals = group["data"][lo:hi]
+        rows = np.repeat(np.arange(start, end), np.diff(indptr[start : end + 1]))
+        keep = cols >= 0
+        cols, vals, rows = cols[keep], vals[keep].astype(dtype), rows[keep]
+
+        m = cols.size
+        if build_csr:
+            csr_indices[position : position + m] = cols
+            csr_data[position : position + m] = vals
+            csr_indptr[start + 1 : end + 1] = position + np.cumsum(np.bincount(rows - start, minlength=end - start))
+        position += m
+
+        if build_csc:
+            # stable, so rows stay in order within every column
+            order = np.argsort(cols, kind="stable")
+            sorted_cols = cols[order]
+            rank = np.arange(m) - np.searchsorted(sorted_cols, sorted_cols)
+            destination = cursors[sorted_cols] + rank
+            csc_indices[destination] = rows[order]
+            csc_data[destination] = vals[order]
+            cursors += np.bincount(cols, minlength=n_var)
+
+    shape = (n_obs, n_var)
+    layers = {"csr": None, "csc": None}
+    if build_csr:
+        layers["csr"] = sparse.csr_matrix((csr_data, csr_indices, csr_indptr), shape=shape, copy=False)
+    if build_csc:
+        layers["csc"] = sparse.csc_matrix((csc_data, csc_indices, csc_indptr), shape=shape, copy=False)
+    for X in layers.values():
+        for a in () if X is None else (X.indptr, X.indices, X.data):
+            if isinstance(a, np.memmap):
+                a.flush()
+    return layers
+
+
+def prepare_layers(fn, preprocess=False, out_dir=None, orientation="both", layers=None, var_mask=None, shared=False):
+    """
+    Stream the layers of the h5ad file `fn` (see `is_streamable`) into CSR and CSC
+    matrices, after dropping the genes expressed in fewer than MIN_CELLS cells of X.
+    Layers of integer counts are stored as uint16 or uint32, all others as float32.  As
+    when the whole file is loaded, X is added as the layer "X" or, if `preprocess`, as
+    "raw_counts" (X is then a virtual layer over it, see `virtual_layers`).
+
+    Only the `layers` named (by default, all of `layer_names`) are prepared, in the
+    orientations kept by the `orientation` policy (the others are None), into shared
+    memory if `shared`.  The gene mask of an earlier call can be passed as `var_mask`, so
+    X is not read to find it again.  Returns the layers, as {name: {"csr": matrix, "csc":
+    matrix}}, and the mask of the genes kept.
+    """
+    with h5py.File(fn, "r") as f:
+        X = f["X"]
+        shape = _shape(X)
+        sources = {k: f["layers"][k] for k in f.get("layers", {})}
+        sources["raw_counts" if preprocess else "X"] = X
+        names = list(sources) if layers is None else layers
+
+        X_indptr = X_counts = X_dtype = None
+        if var_mask is None or any(sources[k] is X for k in names):
+            X_indptr = X["indptr"][:]
+            X_counts, nonzeros, X_dtype = _count_columns(X, X_indptr, shape[1], nonzero=True)
+            if var_mask is None:
+                var_mask = nonzeros >= MIN_CELLS
+
+        prepared = {}
+        for name in names:
+            group = sources[name]
+            print("Layer", name, "...")
+            if group is X:
+                indptr, counts, dtype = X_indptr, X_counts, X_dtype
+            else:
+                indptr = group["indptr"][:]
+                counts, _, dtype = _count_columns(group, indptr, shape[1])
+            kept = orientations(orientation, name)
+            prepared[name] = _stream_layer(group, indptr, shape, var_mask, counts, dtype, name, out_dir, kept, shared)
+    return prepared, var_mask
@@ -0,0 +1,197 @@
+"""
+Virtual expression layers.
+
+A virtual layer is defined as a chain of transforms over a stored base layer, eg
+
+    {"base": "raw_counts", "transforms": [{"normalize": {"target_sum": 10000}}, "log1p"]}
+
+and shares the base layer's arrays instead of keeping a transformed copy of them.  Every
+transform maps zeros to zeros, so a virtual layer has the sparsity structure of its base
+and only the values of the entries read are computed:
+
+    log1p           log(1 + x)
+    normalize       scale every cell to `target_sum` total counts (default: the median
+                    total of the cells with any counts)
+    clip_scale      divide every gene by its standard deviation and clip the result to
+                    [-max_value, max_value] (default 10); genes are not centered, which
+                    would make the layer dense
+
+`fit` derives the per-cell and per-gene factors of the transforms, and the statistics of
+the virtual layer, in passes over the base layer in blocks of about CHUNK_NNZ entries.
+`transform` computes the values of a block read from the base layer; whole orientations,
+which the compute paths read for large groups, are computed block by block and kept in a
+process-wide LRU of at most CACHE_MAX_BYTES.
+"""
+
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+TRANSFORMS = ("log1p", "normalize", "clip_scale")
+CHUNK_NNZ = 1 << 24
+CACHE_MAX_BYTES = 1 << 30
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # (layer name, fingerprint, format) -> transformed data
+_cache_bytes = 0
+
+
+class VirtualLayer:
+    """a base layer and the fitted transforms which define a virtual layer over it"""
+
+    def __init__(self, name, base, steps):
+        self.name = name
+        self.base = base
+        # [(transform, {parameter: value})]
+        self.steps = steps
+        # identifies this fit in the cache, across processes the layer is pickled to
+        self.fingerprint = uuid.uuid4().hex
+
+
+def parse(definition):
+    """return the base layer and the [(transform, options)] of a virtual layer definition"""
+    if not isinstance(definition, dict) or not isinstance(definition.get("base"), str):
+        raise ValueError("a virtual layer is defined by a base layer and a list of transforms")
+    steps = []
+    for step in definition.get("transforms", []):
+        if isinstance(step, str):
+            name, options = step, {}
+        elif isinstance(step, dict) and len(step) == 1:
+            name, options = next(iter(step.items()))
+        else:
+            raise ValueError(f"Invalid layer transform {step}, expected a name or {{name: options}}.")
+        if name not in TRANSFORMS:
+            raise ValueError(f"Unknown layer transform {name}, expected one of {', '.join(TRANSFORMS)}.")
+        if options is not None and not isinstance(options, dict):
+            raise ValueError(f"Invalid options for layer transform {name}: {options}.")
+        steps.append((name, dict(options or {})))
+    return definition["base"], steps
+
+
+def _blocks(X):
+    """yield (start, end) bounds of blocks of about CHUNK_NNZ entries along the major axis of X"""
+    n = X.indptr.size - 1
+    start = 0
+    while start < n:
+        end = int(np.searchsorted(X.indptr, X.indptr[start] + CHUNK_NNZ, side="right")) - 1
+        end = min(max(end, start + 1), n)
+        yield start, end
+        start = end
+
+
+def _coordinates(X, start, end, rows=None, cols=None):
+    """the rows and columns of the entries of the major block [start, end) of X"""
+    lo, hi = X.indptr[start], X.indptr[end]
+    major = np.repeat(np.arange(start, end), np.diff(X.indptr[start : end + 1]))
+    minor = X.indices[lo:hi]
+    r, c = (major, minor) if X.getformat() == "csr" else (minor, major)
+    if rows is not None:
+        r = rows[r]
+    if cols is not None:
+        c = cols[c]
+    return r, c
+
+
+def _apply(steps, data, r, c):
+    data = np.array(data, dtype="float32")
+    for name, params in steps:
+        if name == "log1p":
+            np.log1p(data, out=data)
+        elif name == "normalize":
+            data *= params["row_factor"][r]
+        elif name == "clip_scale":
+            data *= params["col_factor"][c]
+            np.clip(data, -params["max_value"], params["max_value"], out=data)
+    return data
+
+
+def _moments(X, steps):
+    """per-cell and per-gene sums and sums of squares of the base layer X after `steps`"""
+    n_obs, n_var = X.shape
+    row_sum, row_sq = np.zeros(n_obs), np.zeros(n_obs)
+    col_sum, col_sq = np.zeros(n_var), np.zeros(n_var)
+    for start, end in _blocks(X):
+        r, c = _coordinates(X, start, end)
+        data = _apply(steps, X.data[X.indptr[start] : X.indptr[end]], r, c).astype("float64")
+        row_sum += np.bincount(r, weights=data, minlength=n_obs)
+        row_sq += np.bincount(r, weights=data**2, minlength=n_obs)
+        col_sum += np.bincount(c, weights=data, minlength=n_var)
+        col_sq += np.bincount(c, weights=data**2, minlength=n_var)
+    return row_sum, row_sq, col_sum, col_sq
+
+
+def fit(name, definition, X):
+    """
+    Fit the virtual layer `name` over the base layer X (CSR or CSC).  Returns the
+    VirtualLayer and its statistics, as {mode: (mean, variance, variance - mean**2)} per
+    gene (OBS) and per cell (VAR), like those of stored layers.
+    """
+    base, options = parse(definition)
+    n_obs, n_var = X.shape
+    steps = []
+    for transform, opts in options:
+        params = {}
+        if transform == "normalize":
+            totals = _moments(X, steps)[0]
+            target = opts.get("target_sum")
+            if target is None:
+                target = float(np.median(totals[totals > 0])) if np.any(totals > 0) else 1.0
+            params["row_factor"] = np.divide(
+                target, totals, out=np.zeros(n_obs, dtype="float32"), where=totals > 0, casting="unsafe"
+            )
+        elif transform == "clip_scale":
+            _, _, col_sum, col_sq = _moments(X, steps)
+            std = np.sqrt(np.maximum(col_sq / n_obs - (col_sum / n_obs) ** 2, 0))
+            params["col_factor"] = np.divide(
+                1.0, std, out=np.zeros(n_var, dtype="float32"), where=std > 0, casting="unsafe"
+            )
+            params["max_value"] = float(opts.get("max_value", 10))
+        steps.append((transform, params))
+
+    row_sum, row_sq, col_sum, col_sq = _moments(X, steps)
+    stats = {}
+    for mode, (s, sq, n) in (("OBS", (col_sum, col_sq, n_obs)), ("VAR", (row_sum, row_sq, n_var))):
+        mean = s / n
+        v = np.maximum(sq / n - mean**2, 0)
+        mean, v = mean.astype("float32"), v.astype("float32")
+        stats[mode] = (mean, v, v - mean**2)
+    return VirtualLayer(name, base, steps), stats
+
+
+def transform(layer, X, rows=None, cols=None):
+    """
+    Return the values of `layer` for X, a CSR or CSC block of its base layer; `rows` and
+    `cols` are the indices of the block's rows and columns in the base layer (None if it
+    has all of them).
+    """
+    data = np.empty(X.data.size, dtype="float32")
+    for start, end in _blocks(X):
+        r, c = _coordinates(X, start, end, rows, cols)
+        data[X.indptr[start] : X.indptr[end]] = _apply(layer.steps, X.data[X.indptr[start] : X.indptr[end]], r, c)
+    return type(X)((data, X.indices, X.indptr), shape=X.shape)
+
+
+def transform_full(layer, X):
+    """`transform` for a whole orientation X of the base layer, through the LRU cache"""
+    global _cache_bytes
+    key = (layer.name, layer.fingerprint, X.getformat())
+    with _lock:
+        data = _cache.get(key)
+        if data is not None:
+            _cache.move_to_end(key)
+    if data is None:
+        data = transform(layer, X).data
+        with _lock:
+            if key not in _cache and data.nbytes <= CACHE_MAX_BYTES:
+                _cache[key] = data
+                _cache_bytes += data.nbytes
+                while _cache_bytes > CACHE_MAX_BYTES:
+                    _, evicted = _cache.popitem(last=False)
+                    _cache_bytes -= evicted.nbytes
+    return type(X)((data, X.indices, X.indptr), shape=X.shape)
+
+
+def is_virtual(entry):
+    return isinstance(entry, VirtualLayer)
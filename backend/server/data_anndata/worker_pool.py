@@ -0,0 +1,364 @@
+"""
+Long-lived workers which run the compute jobs of the server.
+
+A Ray task per job pays for leasing a worker, importing the compute modules and, the
+first time in each worker process, compiling the numba kernels; the task then fetches
+every layer it reads from the object store again.  Instead, `start` creates a fixed set of
+Ray actors once, each running `initializer` (a warm-up of the kernels), and `submit` queues
+jobs for them.  Without Ray (desktop mode), `start_local` starts a pool of local processes
+instead, which read the layers from shared memory (see `shared_arrays`).  Every worker has
+a dispatcher thread in the server, which takes the next job off the queue, runs it on its
+worker and hands the result, or the exception, to the job's callbacks.  Jobs are queued
+by priority class and user (see `job_scheduler`).
+
+The shared layer dicts are passed to the actors with the Ray object references of the
+layers inside them, so Ray does not resolve them per job: each actor resolves a reference
+the first time a job uses it, to a zero-copy view of the object store, and keeps it for
+all later jobs.  Layers published after the pool started are picked up the same way.
+
+Jobs are cancelled cooperatively: `cancel` takes a queued job off the queue, and signals a
+running one to its worker, where the job stops with JobCancelled at its next `checkpoint`.
+A running job without checkpoints, or past its last one, completes as usual.
+
+Jobs report the stages they reach with `progress`, which is also a checkpoint.  The workers
+put the reports on a queue back to the server (a Ray queue, or a multiprocessing queue for
+the local pool), where a thread hands them to the `on_progress` callback of the job.
+"""
+
+import atexit
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import partial
+
+import backend.server.data_anndata.job_scheduler as job_scheduler
+import backend.server.data_anndata.shared_arrays as shared_arrays
+
+_actors = []
+_lock = threading.Lock()
+_local = {}  # "executor", "n_workers", "initializer", "ready", "tokens", "progress" of the local pool
+_jobs = {}  # job id -> _Job, until it ends
+_current = threading.local()  # the id, cancel token, start time and progress span of the job run by this thread
+_cancelled = set()  # ids of the jobs cancelled in this process
+_progress = None  # queue of the (job id, stage, fraction, elapsed) reported by the jobs of this process
+
+
+class JobCancelled(Exception):
+    """raised by `checkpoint` in a job which was cancelled"""
+
+
+class _Job:
+    def __init__(
+        self, job_id, fn, args, shm, shm_csc, callback, error_callback, on_cancel, on_progress, job_class, user
+    ):
+        self.id = job_id
+        self.fn = fn
+        self.args = args
+        self.shm = shm
+        self.shm_csc = shm_csc
+        self.callback = callback
+        self.error_callback = error_callback
+        self.on_cancel = on_cancel
+        self.on_progress = on_progress
+        self.job_class = job_class
+        self.user = user
+        self.cancelled = False
+        self.signal = None  # signals the cancellation to the worker running the job
+
+
+def checkpoint():
+    """raise JobCancelled if the job run by this thread was cancelled (see `cancel`)"""
+    job_id, token = getattr(_current, "job", (None, None))
+    if job_id is None:
+        return
+    if job_id in _cancelled or (token is not None and os.path.exists(token)):
+        raise JobCancelled(job_id)
+
+
+def progress(stage, fraction=0.0):
+    """
+    Report that the job run by this thread reached `stage`, `fraction` of the way through
+    (of the current `span`), and stop it there if it was cancelled (see `checkpoint`).
+    """
+    checkpoint()
+    job_id, _ = getattr(_current, "job", (None, None))
+    if job_id is None or _progress is None:
+        return
+    start, end = _current.span
+    _progress.put((job_id, stage, start + (end - start) * fraction, time.time() - _current.started))
+
+
+@contextmanager
+def span(start, end):
+    """map the fractions reported by `progress` in the block to [`start`, `end`] of the current span"""
+    outer = getattr(_current, "span", (0.0, 1.0))
+    length = outer[1] - outer[0]
+    _current.span = (outer[0] + length * start, outer[0] + length * end)
+    try:
+        yield
+    finally:
+        _current.span = outer
+
+
+def _run_job(job_id, token, fn, args, shm, shm_csc):
+    _current.job = (job_id, token)
+    _current.started = time.time()
+    _current.span = (0.0, 1.0)
+    try:
+        return fn(*args, shm, shm_csc)
+    finally:
+        _current.job = (None, None)
+        _cancelled.discard(job_id)
+
+
+class _Worker:
+    """a Ray actor which runs jobs against the layers it has resolved so far"""
+
+    def __init__(self, initializer=None, progress=None):
+        global _progress
+        _progress = progress
+        self._resolved = {}
+        if initializer is not None:
+            initializer()
+
+    def _resolve(self, entry):
+        import ray
+
+        if not isinstance(entry, tuple):
+            return entry
+        resolved = []
+        for ref in entry:
+            if isinstance(ref, ray.ObjectRef):
+                if ref not in self._resolved:
+                    self._resolved[ref] = ray.get(ref)
+                ref = self._resolved[ref]
+            resolved.append(ref)
+        return tuple(resolved)
+
+    def run(self, job_id, fn, args, shm, shm_csc):
+        shm = {k: self._resolve(v) for k, v in shm.items()}
+        shm_csc = {k: self._resolve(v) for k, v in shm_csc.items()}
+        return _run_job(job_id, None, fn, args, shm, shm_csc)
+
+    def cancel(self, job_id):
+        _cancelled.add(job_id)
+
+    def ping(self):
+        return True
+
+
+def _dispatch(run):
+    while True:
+        job, ticket = job_scheduler.next_job()
+        try:
+            result = run(job)
+        except JobCancelled:
+            job_scheduler.done(ticket, "cancelled")
+            job.on_cancel()
+            continue
+        except Exception as e:
+            job_scheduler.done(ticket, "failed")
+            job.error_callback(e)
+            continue
+        finally:
+            with _lock:
+                job.signal = None
+                _jobs.pop(job.id, None)
+        job_scheduler.done(ticket)
+        try:
+            job.callback(result)
+        except Exception as e:
+            job.error_callback(e)
+
+
+def _forward_progress(get):
+    while True:
+        job_id, stage, fraction, elapsed = get()
+        with _lock:
+            job = _jobs.get(job_id)
+        if job is None:
+            continue
+        try:
+            job.on_progress(stage, fraction, elapsed)
+        except Exception:
+            traceback.print_exc()
+
+
+def _started(job, signal):
+    # the job was taken off the queue; from now on, cancelling it goes through `signal`
+    with _lock:
+        if job.cancelled:
+            raise JobCancelled(job.id)
+        job.signal = signal
+
+
+def _run_actor(actor, job):
+    import ray
+
+    _started(job, partial(actor.cancel.remote, job.id))
+    try:
+        return ray.get(actor.run.remote(job.id, job.fn, job.args, job.shm, job.shm_csc))
+    except ray.exceptions.RayTaskError as e:
+        if isinstance(e.cause, JobCancelled):
+            raise e.cause
+        raise
+
+
+def start(n_workers, initializer=None):
+    """start `n_workers` actors (once per process), which run `initializer` before any job"""
+    import ray
+    from ray.util.queue import Queue
+
+    with _lock:
+        if _actors:
+            return
+        # actors killed (eg, out of memory) are restarted; only the jobs they were running fail.
+        # A second thread takes the cancellations of the job running on the actor.
+        worker = ray.remote(num_cpus=1, max_restarts=-1, max_concurrency=2)(_Worker)
+        n_workers = max(1, n_workers)
+        job_scheduler.set_workers(n_workers)
+        progress = Queue()
+        threading.Thread(target=_forward_progress, args=(progress.get,), daemon=True).start()
+        for _ in range(n_workers):
+            actor = worker.remote(initializer, progress)
+            _actors.append(actor)
+            threading.Thread(target=_dispatch, args=(partial(_run_actor, actor),), daemon=True).start()
+
+
+def _ping():
+    return True
+
+
+def _initialize_local(progress, initializer):
+    global _progress
+    _progress = progress
+    if initializer is not None:
+        initializer()
+
+
+def _start_executor():
+    n_workers = _local["n_workers"]
+    executor = ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=_local["context"],
+        initializer=_initialize_local,
+        initargs=(_local["progress"], _local["initializer"]),
+    )
+    _local["executor"] = executor
+    _local["ready"] = [executor.submit(_ping) for _ in range(n_workers)]
+
+
+def _touch(token):
+    open(token, "w").close()
+
+
+def _run_local(job):
+    # the token of the job is a file, which the worker checks for at every checkpoint
+    token = os.path.join(_local["tokens"], job.id)
+    _started(job, partial(_touch, token))
+    executor = _local["executor"]
+    try:
+        return executor.submit(_run_job, job.id, token, job.fn, job.args, job.shm, job.shm_csc).result()
+    except BrokenProcessPool:
+        # a worker died (eg, out of memory); only the jobs running at the time fail
+        with _lock:
+            if _local["executor"] is executor:
+                _start_executor()
+        raise
+    finally:
+        if os.path.exists(token):
+            os.remove(token)
+
+
+def start_local(n_workers, initializer=None):
+    """start a pool of `n_workers` local processes (once per process), which run `initializer` first"""
+    with _lock:
+        if _local:
+            return
+        # the workers share this process' resource tracker, so only it unlinks the layers
+        shared_arrays.ensure_tracker()
+        tokens = tempfile.mkdtemp(prefix="jobs-")
+        atexit.register(shutil.rmtree, tokens, ignore_errors=True)
+        # spawned, so the workers do not inherit the threads of the server
+        context = multiprocessing.get_context("spawn")
+        progress = context.Queue()
+        _local.update(
+            n_workers=max(1, n_workers),
+            initializer=initializer,
+            tokens=tokens,
+            context=context,
+            progress=progress,
+        )
+        job_scheduler.set_workers(_local["n_workers"])
+        threading.Thread(target=_forward_progress, args=(progress.get,), daemon=True).start()
+        _start_executor()
+        for _ in range(_local["n_workers"]):
+            threading.Thread(target=_dispatch, args=(_run_local,), daemon=True).start()
+
+
+def submit(
+    fn,
+    args,
+    shm,
+    shm_csc,
+    callback,
+    error_callback,
+    on_cancel=None,
+    on_progress=None,
+    job_class="interactive",
+    user=None,
+    job_id=None,
+):
+    """
+    Queue the job `fn(*args, shm, shm_csc)` of `user` in `job_class` (see `job_scheduler`),
+    and return its id (`job_id`, or a new one).  Its result goes to `callback`, an exception
+    to `error_callback`; `on_cancel` is called once the job was cancelled (see `cancel`), and
+    `on_progress(stage, fraction, elapsed)` for every stage it reports (see `progress`).
+    """
+    job_id = job_id or uuid.uuid4().hex
+    on_cancel = on_cancel or (lambda: None)
+    on_progress = on_progress or (lambda stage, fraction, elapsed: None)
+    job = _Job(job_id, fn, args, shm, shm_csc, callback, error_callback, on_cancel, on_progress, job_class, user)
+    with _lock:
+        _jobs[job.id] = job
+    job_scheduler.submit(job, job_class, user)
+    return job.id
+
+
+def cancel(job_id, user=None):
+    """
+    Cancel the job `job_id` of `user`: a queued job is dropped at once, a running one stops
+    at its next `checkpoint`.  False if there is no such job.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job.user != user or job.cancelled:
+            return False
+        job.cancelled = True
+        signal = job.signal
+    if job_scheduler.remove(job, job.job_class, job.user):
+        with _lock:
+            _jobs.pop(job_id, None)
+        job.on_cancel()
+    elif signal is not None:
+        signal()
+    return True
+
+
+def wait_ready():
+    """wait until every worker has run its initializer"""
+    if _local:
+        for future in _local["ready"]:
+            future.result()
+    if _actors:
+        import ray
+
+        ray.get([actor.ping.remote() for actor in _actors])
@@ -1,4 +1,6 @@
+import threading
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
 from os.path import basename, splitext
 import numpy as np
 import pandas as pd
@@ -13,6 +15,10 @@ from backend.common.fbs.matrix import encode_matrix_fbs
 from backend.common.genesets import validate_gene_sets
 
 
+# upper bound on the total size of encoded layouts kept by layout_to_fbs_matrix
+LAYOUT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
 class DataAdaptor(metaclass=ABCMeta):
     """Base class for loading and accessing matrix data"""
 
@@ -31,6 +37,11 @@ class DataAdaptor(metaclass=ABCMeta):
         # parameters set by this data adaptor based on the data.
         self.parameters = {}
 
+        # encoded layouts, keyed by the fingerprints of the embeddings they contain
+        self._layout_cache = OrderedDict()
+        self._layout_cache_nbytes = 0
+        self._layout_cache_lock = threading.Lock()
+
     @staticmethod
     @abstractmethod
     def pre_load_validation(data_locator):
@@ -66,6 +77,14 @@ class DataAdaptor(metaclass=ABCMeta):
         """return an numpy array for the given pre-computed embedding name."""
         pass
 
+    def get_embedding_fingerprint(self, ename):
+        """return a hashable value which changes whenever the named embedding changes, or
+        None if this is not known.  Used to cache encoded layouts."""
+        return None
+
+    def get_embedding_fingerprint_joint(self, ename):
+        return None
+
     @abstractmethod
     def compute_sankey_df(self, labels, name):
         """compute sankey"""
@@ -113,6 +132,10 @@ class DataAdaptor(metaclass=ABCMeta):
     def get_corpora_props(self):
         return None
 
+    def get_layer_states(self):
+        """readiness of the layers which are prepared lazily, as {layer: state}"""
+        return {}
+
     @abstractmethod
     def annotation_to_fbs_matrix(self, axis, field=None, uid=None):
         """
@@ -329,23 +352,39 @@ class DataAdaptor(metaclass=ABCMeta):
             normalized_layout = normalized_layout.astype(dtype=np.float32)
         return normalized_layout
 
-    def layout_to_fbs_matrix(self, fields):
-        """
-        return specified embeddings as a flatbuffer, using the cellxgene matrix fbs encoding.
+    def _get_cached_layout(self, key):
+        with self._layout_cache_lock:
+            fbs = self._layout_cache.get(key)
+            if fbs is not None:
+                self._layout_cache.move_to_end(key)
+            return fbs
 
-        * returns only first two dimensions, with name {ename}_0 and {ename}_1,
-          where {ename} is the embedding name.
-        * client assumes each will be individually centered & scaled (isotropically)
-          to a [0, 1] range.
-        * does not support filtering
+    def _set_cached_layout(self, key, fbs):
+        if len(fbs) > LAYOUT_CACHE_MAX_BYTES:
+            return
+        with self._layout_cache_lock:
+            old = self._layout_cache.pop(key, None)
+            if old is not None:
+                self._layout_cache_nbytes -= len(old)
+            self._layout_cache[key] = fbs
+            self._layout_cache_nbytes += len(fbs)
+            while self._layout_cache_nbytes > LAYOUT_CACHE_MAX_BYTES:
+                _, evicted = self._layout_cache.popitem(last=False)
+                self._layout_cache_nbytes -= len(evicted)
+
+    def _encode_layouts(self, embeddings, get_embedding_array, get_embedding_fingerprint):
+        fingerprints = tuple(get_embedding_fingerprint(ename) for ename in embeddings)
+        key = (tuple(embeddings), fingerprints) if None not in fingerprints else None
+        if key is not None:
+            fbs = self._get_cached_layout(key)
+            if fbs is not None:
+                return fbs
 
-        """
-        embeddings = self.get_embedding_names() if fields is None or len(fields) == 0 else fields
         layout_data = []
         with ServerTiming.time("layout.query"):
             for ename in embeddings:
-                normalized_layout = self.get_embedding_array(ename, 2)
-                layout_data.append(pd.DataFrame(normalized_layout, columns=[f"{ename}_0", f"{ename}_1"]))
+                normalized_layout = get_embedding_array(ename, 2)
+                layout_data.append(pd.DataFrame(normalized_layout, columns=[f"{ename}_0", f"{ename}_1"], copy=False))
 
         with ServerTiming.time("layout.encode"):
             if layout_data:
@@ -354,9 +393,11 @@ class DataAdaptor(metaclass=ABCMeta):
                 df = pd.DataFrame()
             fbs = encode_matrix_fbs(df, col_idx=df.columns, row_idx=None)
 
+        if key is not None:
+            self._set_cached_layout(key, fbs)
         return fbs
 
-    def layout_to_fbs_matrix_joint(self, fields):
+    def layout_to_fbs_matrix(self, fields):
         """
         return specified embeddings as a flatbuffer, using the cellxgene matrix fbs encoding.
 
@@ -365,23 +406,28 @@ class DataAdaptor(metaclass=ABCMeta):
         * client assumes each will be individually centered & scaled (isotropically)
           to a [0, 1] range.
         * does not support filtering
+        * the encoding is cached until the underlying embeddings change
 
         """
         embeddings = self.get_embedding_names() if fields is None or len(fields) == 0 else fields
-        layout_data = []
-        with ServerTiming.time("layout.query"):
-            for ename in embeddings:
-                normalized_layout = self.get_embedding_array_joint(ename, 2)
-                layout_data.append(pd.DataFrame(normalized_layout, columns=[f"{ename}_0", f"{ename}_1"]))
+        return self._encode_layouts(embeddings, self.get_embedding_array, self.get_embedding_fingerprint)
 
-        with ServerTiming.time("layout.encode"):
-            if layout_data:
-                df = pd.concat(layout_data, axis=1, copy=False)
-            else:
-                df = pd.DataFrame()
-            fbs = encode_matrix_fbs(df, col_idx=df.columns, row_idx=None)
+    def layout_to_fbs_matrix_joint(self, fields):
+        """
+        return specified embeddings as a flatbuffer, using the cellxgene matrix fbs encoding.
 
-        return fbs
+        * returns only first two dimensions, with name {ename}_0 and {ename}_1,
+          where {ename} is the embedding name.
+        * client assumes each will be individually centered & scaled (isotropically)
+          to a [0, 1] range.
+        * does not support filtering
+        * the encoding is cached until the underlying embeddings change
+
+        """
+        embeddings = self.get_embedding_names() if fields is None or len(fields) == 0 else fields
+        return self._encode_layouts(
+            embeddings, self.get_embedding_array_joint, self.get_embedding_fingerprint_joint
+        )
 
     def get_last_mod_time(self):
         try:
@@ -34,14 +34,51 @@ server:
       #   if false/null, then do not set.
       #   if a string, then use that value (e.g. us-east-1).
       region_name: true
+    # directory in which remote datasets are kept after download, so later launches reuse them
+    # while the remote object is unchanged; only the latest version of each dataset is kept
+    # (null downloads to a temporary file on every launch)
+    cache_dir: download_cache
 
   adaptor:
     anndata_adaptor:
+      # serve the matrices of h5ad files whose X and layers are CSC-encoded from disk, reading
+      # genes on demand, instead of loading them
       backed: false
+      # upper bound, in bytes, on the blocks of genes read from disk kept in memory (0 disables
+      # the cache)
+      backed_cache_bytes: 1073741824
+      # directory in which layers prepared while loading an h5ad file are cached, so that later
+      # starts memory-map them instead of preparing them again.  A sidecar takes about as much
+      # disk as the prepared layers, and is never evicted (null disables the cache)
+      sidecar_dir: null
+      # orientations in which each layer is kept in memory: "both", or "csc" or "csr" to halve
+      # its memory, at the cost of gathering blocks of the other orientation on demand.  Either
+      # one policy for all layers or a map from layer name to policy (unlisted layers: "both")
+      layer_orientation: both
+      # when layers other than X are prepared: "startup" (before the server starts serving), or,
+      # for a faster start, "background" (after startup) or "on_access" (when first used, in which
+      # case no sidecar is written); readiness is reported in the schema
+      layer_preparation: startup
+      # layers computed on read from a stored base layer instead of being stored, as a map from
+      # layer name to {base: layer, transforms: [...]}, the transforms being "log1p",
+      # {normalize: {target_sum: ...}} and {clip_scale: {max_value: ...}}, applied in order.  With
+      # preprocessing, X is such a layer over raw_counts (log1p unless defined here)
+      virtual_layers: {}
+      # number of long-lived compute workers, Ray actors when hosted and local processes otherwise
+      # (null: one per available CPU)
+      compute_workers: null
 
   limits:
     column_request_max: 32
     diffexp_cellcount_max: null
+    # upper bound, in bytes, on unpickled workspace artifacts kept in memory (0 disables the cache)
+    artifact_cache_max_bytes: 536870912
+    # per-user disk quota, in bytes, for workspaces; least recently used kNN graphs and latent
+    # spaces are evicted when it is exceeded (null disables the quota)
+    workspace_quota_bytes: null
+    # compute jobs a user may run at once when hosted; further jobs queue while other users' jobs
+    # run (0 or null disables the cap, which never applies on the desktop)
+    jobs_per_user_max: 2
 
 
 dataset:
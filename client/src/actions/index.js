@@ -7,7 +7,7 @@ import {
   dispatchNetworkErrorMessageToUser,
 } from "../util/actionHelpers";
 import {
-  requestReembed, requestPreprocessing
+  requestReembed, requestReembedCancel, requestPreprocessing
 } from "./reembed";
 import {
   requestSankey
@@ -462,6 +462,21 @@ const setupWebSockets = (dispatch,getState,loggedIn,hostedMode) => {
 
   const onMessage = async (event) => {
     const data = JSON.parse(event.data);
+    if (data.status) {
+      // job status: "queued" carries the id the job is cancelled with, "progress" the stage
+      // the job reached and "cancelled" ends it
+      if (data.cfn === "reembedding") {
+        if (data.status === "queued") {
+          dispatch({type: "reembed: job queued", jobId: data.jobId});
+        } else if (data.status === "progress") {
+          const { stage, fraction, elapsed, jobId } = data;
+          dispatch({type: "reembed: job progress", jobId, stage, fraction, elapsed});
+        } else if (data.status === "cancelled") {
+          dispatch({type: "reembed: request cancel"});
+        }
+      }
+      return;
+    }
     if (data.fail) {
       if (data.cfn === "diffexp") {
         dispatch({
@@ -1248,6 +1263,7 @@ export default {
   requestSingleGeneExpressionCountsForColoringPOST,
   requestUserDefinedGene,
   requestReembed,
+  requestReembedCancel,
   requestPreprocessing,
   requestSankey,
   requestLeiden,
@@ -112,6 +112,17 @@ export function requestReembed(reembedParams,parentName,embName,otherSelector) {
 }
 
 
+export function requestReembedCancel() {
+  return (dispatch, getState) => {
+    const { controls, reembedController } = getState();
+    const { wsReembedding } = controls;
+    if (reembedController.jobId) {
+      // the server answers with a "cancelled" status once the job stopped
+      wsReembedding.send(JSON.stringify({ cancel: reembedController.jobId }));
+    }
+  };
+}
+
 async function doPreprocessingFetch(dispatch, getState, reembedParams) {
   const state = getState();
   let cells = state.annoMatrix.rowIndex.labels();  
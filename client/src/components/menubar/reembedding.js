@@ -93,8 +93,10 @@ class Reembedding extends React.PureComponent {
     const { dispatch, cxgMode, reembedController, idhash, annoMatrix, obsCrossfilter, preprocessController, reembedParams, userLoggedIn, hostedMode } = this.props;
     const cOrG = cxgMode === "OBS" ? "cell" : "gene";
     const loading = !!reembedController?.pendingFetch || !!preprocessController?.pendingFetch;
-    const tipContent =
-      "Click to perform preprocessing and dimensionality reduction on the currently selected cells.";
+    const progress = reembedController?.progress;
+    const tipContent = progress
+      ? `Reembedding: ${progress.stage} (${Math.round(progress.fraction * 100)}%, ${Math.round(progress.elapsed)} s).`
+      : "Click to perform preprocessing and dimensionality reduction on the currently selected cells.";
     const cS = obsCrossfilter.countSelected();
     
     const runDisabled = (cS > 50000) && hostedMode;
@@ -174,6 +176,21 @@ class Reembedding extends React.PureComponent {
             data-testid="reembedding-options"
           />
         </Tooltip>
+        {reembedController?.jobId ? (
+          <Tooltip
+            content="Cancel the running reembedding."
+            position="bottom"
+            hoverOpenDelay={globals.tooltipHoverOpenDelay}
+          >
+            <AnchorButton
+              icon="cross"
+              intent="danger"
+              minimal
+              onClick={() => dispatch(actions.requestReembedCancel())}
+              data-testid="reembedding-cancel"
+            />
+          </Tooltip>
+        ) : null}
       </div>
     );
   }
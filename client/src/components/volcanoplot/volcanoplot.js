@@ -455,7 +455,7 @@ class Volcanoplot extends React.PureComponent {
     let xScale;
     let positions;
     if (volcanoAccessor !== this.state.lastVolcanoAccessor || !this.state.lastVolcanoAccessor) {
-      const [result, result2] = await this.fetchData(volcanoAccessor);
+      const [result, result2] = await this.fetchData(volcanoAccessor, nVar);
       const { pop } = result;
       const {pop: sgInitial} = result2;
       const xCol = [];
@@ -577,12 +577,13 @@ class Volcanoplot extends React.PureComponent {
   }
 
   async fetchData(
-    volcanoAccessor
+    volcanoAccessor,
+    nVar
   ) {
     const name = volcanoAccessor.split('//;;//;;').at(0)
     const pop = volcanoAccessor.split('//;;//;;').at(1)
     const res = await fetch(
-      `${globals.API.prefix}${globals.API.version}diffExpStats?name=${encodeURIComponent(name)}&pop=${encodeURIComponent(pop)}`,
+      `${globals.API.prefix}${globals.API.version}diffExpStats?name=${encodeURIComponent(name)}&pop=${encodeURIComponent(pop)}&limit=${nVar}`,
       {credentials: "include"}
     );
     const result = await res.json();  
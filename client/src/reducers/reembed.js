@@ -4,6 +4,8 @@ controller state is not part of the undo/redo history
 export const reembedController = (
   state = {
     pendingFetch: null,
+    jobId: null,
+    progress: null,
   },
   action
 ) => {
@@ -14,12 +16,29 @@ export const reembedController = (
         pendingFetch: true,
       };
     }
+    case "reembed: job queued": {
+      return {
+        ...state,
+        jobId: action.jobId,
+      };
+    }
+    case "reembed: job progress": {
+      // reports may arrive after the job ended
+      if (action.jobId !== state.jobId) return state;
+      const { stage, fraction, elapsed } = action;
+      return {
+        ...state,
+        progress: { stage, fraction, elapsed },
+      };
+    }
     case "reembed: request aborted":
     case "reembed: request cancel":
     case "reembed: request completed": {
       return {
         ...state,
         pendingFetch: null,
+        jobId: null,
+        progress: null,
       };
     }
     default: {